@@ -10,6 +10,14 @@ from knefilereader import *
 from knefilewriter import *
 from knewriter import *
 from accountingline import *
+from interning import *
+from offsetindex import *
+from parsecache import *
+from postingtable import *
+from readeroptions import *
+from ingestion import *
+from feedreader import *
+from verifier import *
 
 import datev_encoding
 datev_encoding.register()
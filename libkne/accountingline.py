@@ -5,249 +5,154 @@
 
 from decimal import Decimal
 import datetime
-import re
 
-from libkne.util import assert_true, get_number_of_decimal_places, \
-    parse_number, parse_number_field, parse_optional_string_field, parse_string
+from libkne import datev_encoding
+from libkne.fieldspec import NumberField, RecordSpec, StringField
+from libkne.util import AMOUNTS_CENTS, AMOUNTS_DECIMAL, \
+    get_number_of_decimal_places, parse_number
 
 __all__ = ['AccountingLine']
 
+record_field_characters = '[0-9a-zA-Z$%&\\*\\+\\-/]'
+
 class AccountingLine(object):
+    '''A single posting line. All attributes are declared in __slots__ and
+    are None if the field is not set, setting any other attribute raises an
+    AttributeError.'''
+    __slots__ = ('file_metadata', 'transaction_volume', 'amendment_key', 
+                 'tax_key', 'offsetting_account', 'record_field1', 
+                 'record_field2', 'date', 'account_number', 'cost_center1', 
+                 'cost_center2', 'cash_discount', 'posting_text', 'eu_id', 
+                 'eu_state', 'vat_id', 'eu_taxrate', 
+                 'currency_code_transaction_volume', 'base_currency_amount', 
+                 'base_currency', 'exchange_rate', 'reserved_fields', 
+                 'custom_info_records')
+    
     def __init__(self, file_metadata):
+        self._set_defaults(file_metadata, [])
+    
+    
+    def _set_defaults(self, file_metadata, reserved_fields):
+        # Every slot is set so that reading a field which is not set does not
+        # need a (slow) fallback for unset slots.
         self.file_metadata = file_metadata
-        
-        self.transaction_volume = None
-        self.amendment_key = None
-        self.tax_key = None         # TODO: write to binary
-        self.offsetting_account = None
-        self.record_field1 = None
-        self.record_field2 = None
-        self.date = None
-        self.account_number = None
-        self.cost_center1 = None
-        self.cost_center2 = None
-        self.cash_discount = None           # TODO: Write to binary
-        self.posting_text = None
-        self.eu_id = None
-        self.eu_state = None
-        self.vat_id = None
-        self.eu_taxrate = None
-        self.currency_code_transaction_volume = None
-        self.base_currency_amount = None    # TODO: Write to binary!
-        self.base_currency = None           # TODO: Write to binary!
-        self.exchange_rate = None           # TODO: Write to binary!
-        self.reserved_fields = []
-        
+        self.transaction_volume = self.amendment_key = self.tax_key = \
+            self.offsetting_account = self.record_field1 = \
+            self.record_field2 = self.date = self.account_number = \
+            self.cost_center1 = self.cost_center2 = self.cash_discount = \
+            self.posting_text = self.eu_id = self.eu_state = self.vat_id = \
+            self.eu_taxrate = self.currency_code_transaction_volume = \
+            self.base_currency_amount = self.base_currency = \
+            self.exchange_rate = None
+        self.reserved_fields = reserved_fields
         self.custom_info_records = []
-        
-        char_re = '([^0-9a-zA-Z\$%&*\+-/])'
-        self.record_field_valid_characters = re.compile(char_re)
-    
-    
-    def _parse_transaction_volume(self, data):
-        assert_true(data[0] in ['+', '-'], data[0])
-        volume, end_index = parse_number(data, 1, 10)
-        complete_volume = int(data[0] + str(volume))
-        volume = Decimal(complete_volume) / Decimal(100)
-        self.transaction_volume = volume
-        return end_index
-    
-    
-    def _parse_amendment_key(self, data, start_index):
-        if data[start_index] == 'l':
-            start = start_index + 1
-            amendment_key, end_index = parse_number(data, start, start+1)
-            amendment_key = str(amendment_key)
-            assert_true(len(amendment_key) in [1, 2])
-            if len(amendment_key) == 1:
-                amendment_key = "0" + amendment_key
-            self.amendment_key = int(amendment_key[0]) or None
-            self.tax_key = int(amendment_key[1])
-            return end_index
-        else:
-            return start_index - 1
-    
-    
-    def _parse_record_field(self, data, start_index, first_character, attr_name):
-        if data[start_index] == first_character:
-            start = start_index+1
-            match = re.match('^([0-9a-zA-Z$%&\*\+\-/]{1,12})\x1c', data[start:])
-            if match != None:
-                record_field = match.group(1)
-                setattr(self, attr_name, record_field)
-                end_index = start + len(record_field) - 1 + 1
-                return end_index
-            assert False, 'Could not parse record field: ' + repr(data[start:(start+12)])
-        return start_index - 1
-    
-    
-    def _parse_transaction_date(self, data, start_index, metadata):
-        assert 'd' == data[start_index], repr(data[start_index])
-        date_number, end_index = parse_number(data, start_index+1, start_index+5)
-        
-        day = int(str(date_number)[:-2])
-        month = int(str(date_number)[-2:])
-        date_start = metadata['date_start']
-        date_end = metadata['date_end']
+    
+    
+    def __getstate__(self):
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
+    
+    
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+    
+    
+    def _parse_transaction_volume(self, value):
+        self.transaction_volume = Decimal(int(value)) / Decimal(100)
+    
+    
+    def _parse_amendment_key(self, value):
+        amendment_key = str(int(value))
+        if len(amendment_key) == 1:
+            amendment_key = "0" + amendment_key
+        self.amendment_key = int(amendment_key[0]) or None
+        self.tax_key = int(amendment_key[1])
+    
+    
+    def _parse_offsetting_account(self, value):
+        account_no_length = self.file_metadata.get('stored_general_ledger_account_no_length')
+        restrict_number_length = None
+        if account_no_length != None:
+            # sub-ledger account numbers contain 1 digit more than general 
+            # ledger account numbers
+            restrict_number_length = account_no_length + 1
+        self.offsetting_account, end_index = parse_number(value, 0, 
+            len(value) - 1, restrict_number_length=restrict_number_length)
+    
+    
+    def _parse_transaction_date(self, value):
+        day = int(value[:-2])
+        month = int(value[-2:])
+        date_start = self.file_metadata['date_start']
+        date_end = self.file_metadata['date_end']
         if month >= date_start.month:
             year = date_start.year
         else:
             assert month <= date_end.year
             year = date_end.year
         self.date = datetime.date(year, month, day)
-        return end_index
-    
-    
-    def _parse_account(self, data, start_index):
-        assert 'e' == data[start_index]
-        start = start_index+1
-        # TODO: Laenge der aufgezeichneten Nummern überprüfen!
-        
-        #stored_general_ledger_account_no_length
-        account, end_index = parse_number(data, start, start+9)
-        self.account_number  = account
-        return end_index
-    
-    
-    def _parse_cash_discount(self, data, start_index):
-        if data[start_index] == 'h':
-            start = start_index + 1
-            cash_discount, end_index = parse_number(data, start, start+10)
-            self.cash_discount = Decimal(cash_discount) / Decimal(100)
-            return end_index
-        return start_index - 1
-    
-    
-    def _parse_posting_text(self, data, start_index):
-        value, end_index = parse_optional_string_field(data, '\x1e', start_index, 30)
-        if value != None:
-            self.posting_text = value.decode('datev_ascii')
-        return end_index
-    
-    
-    def _parse_cost_center(self, data, start_index):
-        if data[start_index] == '\xbb':
-            end_index = start_index + 1
-            max_end_index = end_index + 8 - 1
-            while data[end_index] != '\x1c' and end_index <= max_end_index:
-                end_index += 1
-            assert data[end_index] == '\x1c', repr(data[end_index])
-            text = data[start_index+1:end_index]
-            self.cost_center1 = text
-            return end_index
-        return start_index - 1
-    
-    
-    def _parse_currency_code(self, data, start_index):
-        assert '\xb3' == data[start_index], repr(data[start_index])
-        index = start_index + 1
-        while data[index] != '\x1c' and index <= start_index + 3:
-            index += 1
-        assert data[index] == '\x1c'
-        code = data[start_index+1:index].upper()
-        self.currency_code_transaction_volume = code
-        return index
-    
-    
-    def _parse_base_currency_amount(self, data, start_index):
-        if data[start_index] == 'm':
-            start = start_index + 1
-            base_currency_amount, end_index = parse_number(data, start, start+12)
-            self.base_currency_amount = Decimal(base_currency_amount) / Decimal(100)
-            return end_index
-        return start_index - 1
-    
-    
-    def _parse_base_currency(self, data, start_index):
-        if data[start_index] == '\xb4':
-            start = start_index + 1
-            base_currency, end_index = parse_string(data, start, start+3)
-            self.base_currency = base_currency
-            return end_index
-        return start_index - 1
-    
-    
-    def _parse_exchange_rate(self, data, start_index):
-        if data[start_index] == 'n':
-            start = start_index + 1
-            exchange_rate, end_index = parse_number(data, start, start+11)
-            self.exchange_rate = Decimal(exchange_rate) / Decimal(1000000)
-            return end_index
-        return start_index - 1
-    
-    
-    def _parse_reserved_fields(self, data, start_index):
-        end_index = start_index - 1
-        reserved = [None] * 7
-        if data[end_index+1] == 'g':
-            start = end_index + 1 + 1
-            reserved[0], end_index = parse_number(data, start, start+11)
-        reserved[1], end_index = parse_optional_string_field(data, '\xb0', 
-                                                             end_index+1, 20)
-        reserved[2], end_index = parse_optional_string_field(data, '\xb1', 
-                                                             end_index+1, 20)
-        reserved[3], end_index = parse_optional_string_field(data, '\xb2', 
-                                                             end_index+1, 20)
-        if data[end_index+1] == 'f':
-            start = end_index + 1 + 1
-            reserved[4], end_index = parse_number(data, start, start+11)
-        if data[end_index+1] == 'p':
-            start = end_index + 1 + 1
-            reserved[5], end_index = parse_number(data, start, start+3)
-        if data[end_index+1] == 'q':
-            start = end_index + 1 + 1
-            reserved[6], end_index = parse_number(data, start, start+12)
-        self.reserved_fields = reserved
-        return end_index
+    
+    
+    def _get_date_intern_key(self, value):
+        # the year depends on the date range of the data file
+        metadata = self.file_metadata
+        return ('date', value, metadata['date_start'], metadata['date_end'])
+    
+    
+    def _parse_cash_discount(self, value):
+        self.cash_discount = Decimal(int(value)) / Decimal(100)
+    
+    
+    def _parse_posting_text(self, value):
+        self.posting_text = datev_encoding.decode(value)
+    
+    
+    def _parse_currency_code(self, value):
+        self.currency_code_transaction_volume = value.upper()
+    
+    
+    def _parse_base_currency_amount(self, value):
+        self.base_currency_amount = Decimal(int(value)) / Decimal(100)
+    
+    
+    def _parse_exchange_rate(self, value):
+        self.exchange_rate = Decimal(int(value)) / Decimal(1000000)
     
     
     @classmethod
-    def from_binary(cls, binary_data, start_index, metadata):
-        data = binary_data[start_index:]
-        line = cls(file_metadata=metadata)
-        end_index = line._parse_transaction_volume(data)
-        end_index = line._parse_amendment_key(data, end_index+1)
-        
-        account_no_length = line.file_metadata.get('stored_general_ledger_account_no_length')
-        # sub-ledger account numbers contain 1 digit more than general ledger
-        # account numbers
-        result = \
-            parse_number_field(data, 'a', end_index+1, 9, restrict_number_length=account_no_length+1)
-        (line.offsetting_account, end_index) = result
-        
-        end_index = line._parse_record_field(data, end_index+1, '\xbd', 'record_field1')
-        end_index = line._parse_record_field(data, end_index+1, '\xbe', 'record_field2')
-        end_index = line._parse_transaction_date(data, end_index+1, metadata)
-        end_index = line._parse_account(data, end_index+1)
-        end_index = line._parse_cost_center(data, end_index+1)
-        end_index = line._parse_cash_discount(data, end_index+1)
-        end_index = line._parse_posting_text(data, end_index+1)
-        end_index = line._parse_currency_code(data, end_index+1)
-        end_index = line._parse_base_currency_amount(data, end_index+1)
-        end_index = line._parse_base_currency(data, end_index+1)
-        end_index = line._parse_exchange_rate(data, end_index+1)
-        end_index = line._parse_reserved_fields(data, end_index+1)
-        assert 'y' == data[end_index + 1], repr(data[end_index + 1:])
-        end_index += 1
-        return (line, start_index + end_index)
-    
-    
-    def _assert_only_valid_characters_for_record_field(self, value):
-        match = self.record_field_valid_characters.search(value)
-        if match != None:
-            invalid_char = match.group(1)
-            msg = 'Invalid character in record field: ' + repr(invalid_char)
-            raise ValueError(msg)
+    def from_binary(cls, binary_data, start_index, metadata, 
+                    intern_table=None, amounts=AMOUNTS_DECIMAL):
+        """Parse the posting line which starts at start_index in binary_data 
+        (see posting_line_fields for the layout). Return the line and the 
+        index of its last character. If intern_table (an InternTable) is 
+        given, repeated values (e.g. dates, posting texts) are shared with 
+        the lines which were parsed before. If amounts is AMOUNTS_CENTS, all
+        amounts are ints of cents instead of Decimals."""
+        spec = posting_line_specs[amounts]
+        values, end_index = spec.match(binary_data, start_index)
+        line = cls.__new__(cls)
+        line._set_defaults(metadata, [None] * 7)
+        spec.load(line, values, intern_table)
+        return (line, end_index)
     
     
     def _encode_posting_text(self, value):
         if not isinstance(value, unicode):
             # filtering, only allow specified characters
-            value = value.decode('datev_ascii')
-        value = value.encode('datev_ascii')
+            value = datev_encoding.decode(value)
+        value = datev_encoding.encode(value)
         return value
     
     
+    def _decimal_to_binary(self, value, decimal_places):
+        if isinstance(value, Decimal):
+            dec_places = get_number_of_decimal_places(str(value))
+            if dec_places > decimal_places:
+                msg = 'Loosing precision when cutting "%s" to %d decimal places!'
+                raise ValueError(msg % (str(value), decimal_places))
+        return str(int(value * (10 ** decimal_places)))
+    
+    
     def _transaction_volume_to_binary(self):
         value = self.transaction_volume
         if isinstance(value, (int, long)):
@@ -266,58 +171,154 @@ class AccountingLine(object):
         return bin_volume
     
     
+    def _cents_to_binary(self, value, signed=False):
+        if not isinstance(value, (int, long)):
+            msg = 'amount must be an int of cents, not %s' % repr(value)
+            raise ValueError(msg)
+        if signed:
+            return '%+d' % value
+        return '%d' % value
+    
+    
+    def _transaction_volume_cents_to_binary(self):
+        value = self.transaction_volume
+        if value == 0:
+            raise ValueError('Transaction volume must not be zero!')
+        return self._cents_to_binary(value, signed=True)
+    
+    
+    def _cash_discount_cents_to_binary(self):
+        if self.cash_discount == None:
+            return None
+        return self._cents_to_binary(self.cash_discount)
+    
+    
+    def _base_currency_amount_cents_to_binary(self):
+        if self.base_currency_amount == None:
+            return None
+        return self._cents_to_binary(self.base_currency_amount)
+    
+    
+    def _amendment_key_to_binary(self):
+        if self.amendment_key == None and self.tax_key == None:
+            return None
+        return '%d%d' % (self.amendment_key or 0, self.tax_key or 0)
+    
+    
     def _date_to_binary(self):
         assert self.date != None
         bin_date = '%d%02d' % (self.date.day, self.date.month)
         return bin_date
     
     
-    def _write_reserved_fields(self):
-        binary_reserved = ''
-        delimiters = [('g', ''), ('\xb0', '\x1c'), ('\xb1', '\x1c'), 
-                      ('\xb2', '\x1c'), ('f', ''), ('p', ''), ('q', '')]
-        for (value, delimiter) in zip(self.reserved_fields, delimiters):
-            if value != None:
-                binary_reserved += delimiter[0] + str(value) + delimiter[1]
-        return binary_reserved
+    def _cash_discount_to_binary(self):
+        if self.cash_discount == None:
+            return None
+        return self._decimal_to_binary(self.cash_discount, 2)
+    
+    
+    def _posting_text_to_binary(self):
+        if self.posting_text == None:
+            return None
+        return self._encode_posting_text(self.posting_text)
+    
+    
+    def _currency_code_to_binary(self):
+        currency_code = self.currency_code_transaction_volume
+        if currency_code == None:
+            return None
+        if currency_code.upper() != currency_code:
+            raise ValueError('Currency code must be upper case: %s' % currency_code)
+        return currency_code
+    
     
+    def _base_currency_amount_to_binary(self):
+        if self.base_currency_amount == None:
+            return None
+        return self._decimal_to_binary(self.base_currency_amount, 2)
     
-    def to_binary(self):
+    
+    def _exchange_rate_to_binary(self):
+        if self.exchange_rate == None:
+            return None
+        return self._decimal_to_binary(self.exchange_rate, 6)
+    
+    
+    def to_binary(self, amounts=AMOUNTS_DECIMAL):
         """Return a list of multiple lines containing binary KNE format for this
-        posting line."""
-        assert self.cost_center1 == None # not yet implemented
+        posting line. If amounts is AMOUNTS_CENTS, all amounts must be ints of
+        cents."""
         assert self.cost_center2 == None # not yet implemented
-        bin_line = self._transaction_volume_to_binary()
-        if self.amendment_key != None:
-            amendment_key = str(int(self.amendment_key))
-            assert len(amendment_key) == 1
-            bin_line += 'l' + amendment_key + '0'
-        assert self.offsetting_account != None
-        bin_line += 'a' + str(self.offsetting_account)
-        if self.record_field1 != None:
-            assert_true(len(self.record_field1) <= 12)
-            self._assert_only_valid_characters_for_record_field(self.record_field1)
-            bin_line += '\xbd' + self.record_field1 + '\x1c'
-        if self.record_field2 != None:
-            assert_true(len(self.record_field2) <= 12)
-            self._assert_only_valid_characters_for_record_field(self.record_field2)
-            bin_line += '\xbe' + self.record_field2 + '\x1c'
-        bin_line += 'd' + self._date_to_binary()
-        bin_line += 'e' + str(self.account_number)
-        if self.posting_text != None:
-            assert_true(len(self.posting_text) <= 30)
-            encoded_text = self._encode_posting_text(self.posting_text)
-            bin_line += '\x1e' + encoded_text + '\x1c'
-        currency_code = self.currency_code_transaction_volume
-        assert len(currency_code) <= 3
-        assert currency_code.upper() == currency_code
-        bin_line += '\xb3' + currency_code + '\x1c'
-        
-        bin_line += self._write_reserved_fields()
-        bin_line += 'y'
-        
-        binary_lines = [bin_line]
+        binary_lines = [posting_line_specs[amounts].dump(self)]
         for record in self.custom_info_records:
             binary_lines.append(record.to_binary())
         return binary_lines
 
+
+# Layout of a posting line. The lines are parsed and written using this table
+# so reading and writing always use the same prefixes, lengths and order.
+#    prefix, attribute name, maximum length (digits/characters), ...
+posting_line_fields = (
+    NumberField('', 'transaction_volume', 10, signed=True, required=True,
+                load=AccountingLine._parse_transaction_volume,
+                dump=AccountingLine._transaction_volume_to_binary),
+    # the amendment key contains the amendment key (first digit) and the 
+    # tax key (second digit)
+    NumberField('l', 'amendment_key', 2,
+                load=AccountingLine._parse_amendment_key,
+                dump=AccountingLine._amendment_key_to_binary),
+    NumberField('a', 'offsetting_account', 9, required=True,
+                load=AccountingLine._parse_offsetting_account),
+    StringField('\xbd', 'record_field1', 12, min_length=1,
+                characters=record_field_characters, interned=True),
+    StringField('\xbe', 'record_field2', 12, min_length=1,
+                characters=record_field_characters, interned=True),
+    NumberField('d', 'date', 4, required=True,
+                load=AccountingLine._parse_transaction_date,
+                dump=AccountingLine._date_to_binary, interned=True,
+                intern_key=AccountingLine._get_date_intern_key),
+    # TODO: Laenge der aufgezeichneten Nummern überprüfen!
+    NumberField('e', 'account_number', 10, required=True, interned=True),
+    StringField('\xbb', 'cost_center1', 8),
+    NumberField('h', 'cash_discount', 11,
+                load=AccountingLine._parse_cash_discount,
+                dump=AccountingLine._cash_discount_to_binary),
+    StringField('\x1e', 'posting_text', 30,
+                load=AccountingLine._parse_posting_text,
+                dump=AccountingLine._posting_text_to_binary, interned=True),
+    StringField('\xb3', 'currency_code_transaction_volume', 3, required=True,
+                load=AccountingLine._parse_currency_code,
+                dump=AccountingLine._currency_code_to_binary, interned=True),
+    NumberField('m', 'base_currency_amount', 13,
+                load=AccountingLine._parse_base_currency_amount,
+                dump=AccountingLine._base_currency_amount_to_binary),
+    StringField('\xb4', 'base_currency', 4),
+    NumberField('n', 'exchange_rate', 12,
+                load=AccountingLine._parse_exchange_rate,
+                dump=AccountingLine._exchange_rate_to_binary),
+    NumberField('g', 'reserved_fields', 12, index=0),
+    StringField('\xb0', 'reserved_fields', 20, index=1),
+    StringField('\xb1', 'reserved_fields', 20, index=2),
+    StringField('\xb2', 'reserved_fields', 20, index=3),
+    NumberField('f', 'reserved_fields', 12, index=4),
+    NumberField('p', 'reserved_fields', 4, index=5),
+    NumberField('q', 'reserved_fields', 13, index=6),
+)
+posting_line_spec = RecordSpec(posting_line_fields, terminator='y')
+
+# In cents mode (amounts=AMOUNTS_CENTS) all amounts are ints of cents so the
+# binary values are used unchanged.
+cents_fields = dict([(field.name, field) for field in (
+    NumberField('', 'transaction_volume', 10, signed=True, required=True,
+                dump=AccountingLine._transaction_volume_cents_to_binary),
+    NumberField('h', 'cash_discount', 11,
+                dump=AccountingLine._cash_discount_cents_to_binary),
+    NumberField('m', 'base_currency_amount', 13,
+                dump=AccountingLine._base_currency_amount_cents_to_binary),
+)])
+cents_posting_line_spec = RecordSpec(
+    [cents_fields.get(field.name, field) for field in posting_line_fields],
+    terminator='y')
+
+posting_line_specs = {AMOUNTS_DECIMAL: posting_line_spec,
+                      AMOUNTS_CENTS: cents_posting_line_spec}
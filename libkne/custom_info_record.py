@@ -3,6 +3,7 @@
 # See LICENSE.txt in the main project directory, for more information.
 # For the exact contribution history, see the git revision log.
 
+from libkne.fieldspec import RecordSpec, StringField
 from libkne.util import assert_match, parse_string_field
 
 __all__ = ['CustomInfoRecord']
@@ -17,13 +18,13 @@ class CustomInfoRecord(object):
     
     @classmethod
     def from_binary(cls, binary_data, start_index):
-        data = binary_data[start_index:]
         custom_info = cls()
-        custom_info.key, end_index = parse_string_field(data, '\xb7', 0, 20)
-        custom_info.value, end_index = parse_string_field(data, '\xb8', 
+        custom_info.key, end_index = \
+            parse_string_field(binary_data, '\xb7', start_index, 20)
+        custom_info.value, end_index = parse_string_field(binary_data, '\xb8', 
                                                           end_index+1, 210)
-        assert_match('y', data[end_index+1])
-        return (custom_info, start_index + end_index + 1)
+        assert_match('y', binary_data[end_index+1])
+        return (custom_info, end_index + 1)
     
     
     def to_binary(self):
@@ -35,3 +36,10 @@ class CustomInfoRecord(object):
         bin_line += 'y'
         return bin_line
 
+
+# Layout of a custom info record, used to check the syntax without creating
+# CustomInfoRecord instances (see libkne.verifier).
+custom_info_record_spec = RecordSpec([
+    StringField('\xb7', 'key', 20, required=True),
+    StringField('\xb8', 'value', 210, required=True),
+])
@@ -3,6 +3,8 @@
 # See LICENSE.txt in the main project directory, for more information.
 # For the exact contribution history, see the git revision log.
 
+import datev_encoding
+from fieldspec import NumberField, RecordSpec, StringField
 from util import parse_string_field, parse_optional_number_field, \
     parse_number_field, replace_unencodable_characters
 
@@ -43,17 +45,12 @@ class DataLine(object):
         else:
             is_account_nr = True
         text, end_index = parse_string_field(binary_data, '\x1e', end_index+1, 40)
-        line.text = text.decode("datev_ascii")
+        line.text = datev_encoding.decode(text)
         key2, end_index = parse_optional_number_field(binary_data, 'u', 
                                                       end_index+1, 10)
         line.aggregation_or_adjustment_key = key2
-        # TODO: Do something with the data here!
-        # Basic Algorithm:
-        #    if account_nr:
-        #        just add an account
-        #    else:
-        #        aggregate all data between 101
-        #        8xx -> Zahlungsbedingungen
+        # The lines of an address are combined by 
+        # libkne.model.address.iter_addresses()
         assert 'y' == binary_data[end_index+1], repr(binary_data[end_index+1])
         return (line, end_index+1)
     
@@ -62,12 +59,17 @@ class DataLine(object):
         assert len(str(self.key)) <= 9
         #converted_text = unicode(self.text)
         converted_text = replace_unencodable_characters(unicode(self.text))
-        text = converted_text.encode('datev_ascii')
+        text = datev_encoding.encode(converted_text)
         assert len(text) <= 40, repr(text)
         # TODO: Verdichtung/Korrektur
         bin_line = 't' + str(self.key) + '\x1e' + text + '\x1c' + 'y'
         return bin_line
 
 
-
-
+# Layout of a master data line, used to check the syntax without creating
+# DataLine instances (see libkne.verifier).
+master_data_line_spec = RecordSpec([
+    NumberField('t', 'key', 9, required=True),
+    StringField('\x1e', 'text', 40, required=True),
+    NumberField('u', 'aggregation_or_adjustment_key', 10),
+])
@@ -0,0 +1,340 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''Helpers to access the payload of KNE data files which are organized in
+blocks of 256 bytes. Each block is terminated by (at least) six fill bytes
+('\\x00') which are not part of the payload.'''
+
+from array import array
+from bisect import bisect_right
+from collections import deque
+import mmap
+
+from libkne.util import assert_match, assert_true
+
+__all__ = ['BLOCK_SIZE', 'BlockWriter', 'DataBuffer', 'MappedFile', 
+           'OffsetReader', 'PushDataBuffer', 'StreamingDataBuffer', 
+           'map_file', 'strip_fill_bytes']
+
+BLOCK_SIZE = 256
+NUMBER_FILL_BYTES = 6
+
+
+def strip_fill_bytes(block, block_number):
+    '''Return the payload of a single data block. block_number (starting at 1)
+    is only used to report blocks which do not end with six fill bytes.'''
+    assert_match('\x00' * 6, block[-6:], 'block %d' % block_number)
+    return block.rstrip('\x00')
+
+
+def map_file(filename):
+    'Return a read-only memory mapping of the complete file.'
+    fp = file(filename, 'rb')
+    try:
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        # the mapping stays valid after closing the file
+        fp.close()
+
+
+class MappedFile(object):
+    '''Reference to a file which is memory-mapped when it is opened. In 
+    contrast to the mapping itself, this can be passed to worker processes 
+    (which then share the page cache).'''
+    
+    def __init__(self, filename):
+        self.filename = filename
+    
+    
+    def open(self):
+        return map_file(self.filename)
+
+
+
+class OffsetReader(object):
+    '''Reads from data_fp starting at the given offset without changing the 
+    current position of data_fp (so that a lazy parser can still read 
+    data_fp sequentially).'''
+    
+    def __init__(self, data_fp, offset):
+        self.data_fp = data_fp
+        self.offset = offset
+    
+    
+    def read(self, size):
+        position = self.data_fp.tell()
+        try:
+            self.data_fp.seek(self.offset)
+            data = self.data_fp.read(size)
+        finally:
+            self.data_fp.seek(position)
+        self.offset += len(data)
+        return data
+
+
+
+class DataBuffer(object):
+    '''Provides the complete payload of a data file (fill bytes already
+    removed) to the parser.'''
+    
+    def __init__(self, data):
+        self.data = data
+    
+    
+    def fill(self, index):
+        '''Make sure that the record starting at index is available in
+        self.data. Return the (possibly changed) index of this record.'''
+        return index
+    
+    
+    def is_exhausted(self, index):
+        'Return True if index points directly behind the last payload byte.'
+        return index == len(self.data)
+
+
+
+class StreamingDataBuffer(DataBuffer):
+    '''Reads a data file block by block from a file-like object so that only
+    a small window of the payload is kept in memory.
+    No record in a KNE data file is longer than two blocks so the buffer keeps
+    at least 'lookahead' bytes after the current record start (if the file
+    is long enough).
+    If data_fp starts in the middle of the data file (see OffsetReader), 
+    first_block_number is the number of blocks before data_fp so that file 
+    offsets and block numbers refer to the complete data file.'''
+    
+    def __init__(self, data_fp, number_data_blocks, lookahead=2*BLOCK_SIZE,
+                 first_block_number=0):
+        super(StreamingDataBuffer, self).__init__('')
+        self.data_fp = data_fp
+        self.number_data_blocks = number_data_blocks
+        self.first_block_number = first_block_number
+        self.blocks_read = 0
+        self.lookahead = lookahead
+        # number of payload bytes which were dropped from self.data
+        self.consumed = 0
+        # payload offset (including consumed bytes) where each block starts
+        self.block_starts = array('l')
+    
+    
+    def _read_block(self):
+        block = self.data_fp.read(BLOCK_SIZE)
+        self.blocks_read += 1
+        block_number = self.first_block_number + self.blocks_read
+        assert_match(BLOCK_SIZE, len(block), 'block %d' % block_number)
+        return strip_fill_bytes(block, block_number)
+    
+    
+    def fill(self, index):
+        if index >= self.lookahead:
+            # drop the payload which was already consumed by the parser
+            self.data = self.data[index:]
+            self.consumed += index
+            index = 0
+        missing_bytes = self.lookahead - (len(self.data) - index)
+        if missing_bytes > 0:
+            chunks = [self.data]
+            length = self.consumed + len(self.data)
+            while missing_bytes > 0 and \
+                    self.blocks_read < self.number_data_blocks:
+                self.block_starts.append(length)
+                payload = self._read_block()
+                chunks.append(payload)
+                length += len(payload)
+                missing_bytes -= len(payload)
+            self.data = ''.join(chunks)
+        return index
+    
+    
+    def file_offset(self, index):
+        '''Return the offset in the data file (including fill bytes) of the 
+        payload byte at index.'''
+        payload_offset = self.consumed + index
+        block_index = bisect_right(self.block_starts, payload_offset) - 1
+        block_offset = payload_offset - self.block_starts[block_index]
+        return (self.first_block_number + block_index) * BLOCK_SIZE + \
+            block_offset
+    
+    
+    def is_exhausted(self, index):
+        index = self.fill(index)
+        # trailing blocks may consist of fill bytes only
+        while self.blocks_read < self.number_data_blocks:
+            self.block_starts.append(self.consumed + len(self.data))
+            self.data += self._read_block()
+        assert_match('', self.data_fp.read(1), 'data after last block')
+        return super(StreamingDataBuffer, self).is_exhausted(index)
+
+
+
+class PushDataBuffer(DataBuffer):
+    '''Collects the payload of a data file which is pushed in chunks of
+    arbitrary size (see feed()), e.g. while it is being uploaded. Like the 
+    StreamingDataBuffer it only keeps a small window of the payload: the 
+    received chunks are kept unchanged and their blocks are only stripped 
+    when the parser needs them. The consumed payload is dropped once it is 
+    longer than compact_threshold so that each byte is only copied a few 
+    times, regardless of the chunk size. The parser must check with 
+    has_record() that a record is completely available before calling 
+    fill().'''
+    
+    def __init__(self, number_data_blocks, lookahead=2*BLOCK_SIZE,
+                 compact_threshold=64*BLOCK_SIZE):
+        super(PushDataBuffer, self).__init__('')
+        self.number_data_blocks = number_data_blocks
+        # number of blocks which were received (see feed())
+        self.blocks_read = 0
+        self.lookahead = lookahead
+        self.compact_threshold = max(compact_threshold, lookahead)
+        # received chunks whose blocks were not stripped yet, self._offset is
+        # the position of the first unstripped byte in self._chunks[0]
+        self._chunks = deque()
+        self._offset = 0
+        self._received_length = 0
+        self._blocks_stripped = 0
+        # number of payload bytes which were dropped from self.data
+        self.consumed = 0
+    
+    
+    def feed(self, data):
+        'Append the given bytes of the data file.'
+        max_length = self.number_data_blocks * BLOCK_SIZE
+        assert_true(self._received_length + len(data) <= max_length, 
+                    'data after last block')
+        if data:
+            self._chunks.append(data)
+            self._received_length += len(data)
+        self.blocks_read = self._received_length / BLOCK_SIZE
+    
+    
+    def _take_blocks(self, max_blocks):
+        '''Return the raw data of up to max_blocks received blocks which were
+        not stripped yet (but at least one block if available).'''
+        number_blocks = min(max_blocks, self.blocks_read - self._blocks_stripped)
+        length = number_blocks * BLOCK_SIZE
+        if length == 0:
+            return ''
+        chunk = self._chunks[0]
+        if len(chunk) - self._offset < length:
+            # the blocks span multiple chunks: join just the chunks needed
+            parts = [chunk[self._offset:]]
+            available = len(parts[0])
+            self._chunks.popleft()
+            while available < length:
+                chunk = self._chunks.popleft()
+                parts.append(chunk)
+                available += len(chunk)
+            chunk = ''.join(parts)
+            self._chunks.appendleft(chunk)
+            self._offset = 0
+        data = chunk[self._offset:self._offset+length]
+        self._offset += length
+        if self._offset == len(chunk):
+            self._chunks.popleft()
+            self._offset = 0
+        return data
+    
+    
+    def _strip_blocks(self, index):
+        '''Make sure that at least lookahead bytes are available after index
+        (as far as blocks were received).'''
+        max_blocks = self.compact_threshold / BLOCK_SIZE
+        while len(self.data) - index < self.lookahead:
+            data = self._take_blocks(max_blocks)
+            if not data:
+                break
+            payload_chunks = [self.data]
+            for offset in xrange(0, len(data), BLOCK_SIZE):
+                self._blocks_stripped += 1
+                block = data[offset:offset+BLOCK_SIZE]
+                payload_chunks.append(strip_fill_bytes(block, 
+                                                       self._blocks_stripped))
+            self.data = ''.join(payload_chunks)
+    
+    
+    def is_complete(self):
+        'Return True if all blocks were received.'
+        return self.blocks_read == self.number_data_blocks
+    
+    
+    def has_record(self, index):
+        'Return True if the record starting at index can be parsed.'
+        self._strip_blocks(index)
+        if len(self.data) - index >= self.lookahead:
+            return True
+        return self._blocks_stripped == self.number_data_blocks
+    
+    
+    def fill(self, index):
+        if index >= self.compact_threshold:
+            # drop the payload which was already consumed by the parser
+            self.data = self.data[index:]
+            self.consumed += index
+            index = 0
+        assert_true(self.has_record(index), 'more data needed')
+        return index
+    
+    
+    def is_exhausted(self, index):
+        assert_true(self.is_complete(), 'more data needed')
+        # trailing blocks may consist of fill bytes only
+        self._strip_blocks(index)
+        if self._blocks_stripped < self.number_data_blocks:
+            return False
+        return super(PushDataBuffer, self).is_exhausted(index)
+
+
+
+class BlockWriter(object):
+    '''Writes the payload of a data file to data_fp and inserts the fill 
+    bytes at the end of each block. Only complete blocks are written to 
+    data_fp, the current (incomplete) block is kept in memory.'''
+    
+    def __init__(self, data_fp):
+        self.data_fp = data_fp
+        # number of bytes (including fill bytes) written so far
+        self.length = 0
+        self._pending = []
+        self._pending_length = 0
+    
+    
+    def _flush_complete_blocks(self):
+        if self._pending_length < BLOCK_SIZE:
+            return
+        data = ''.join(self._pending)
+        complete_length = len(data) - (len(data) % BLOCK_SIZE)
+        self.data_fp.write(data[:complete_length])
+        remainder = data[complete_length:]
+        self._pending = [remainder]
+        self._pending_length = len(remainder)
+    
+    
+    def write(self, binary_data):
+        'Append binary_data without inserting any fill bytes.'
+        self._pending.append(binary_data)
+        self._pending_length += len(binary_data)
+        self.length += len(binary_data)
+        self._flush_complete_blocks()
+    
+    
+    def write_line(self, binary_line):
+        '''Append a single record. If the record does not fit into the current
+        block (leaving room for the fill bytes), it is split and the fill
+        bytes are inserted.'''
+        end_block_index = (self.length / BLOCK_SIZE + 1) * BLOCK_SIZE
+        free_bytes_in_block = end_block_index - NUMBER_FILL_BYTES - self.length
+        if free_bytes_in_block < len(binary_line):
+            binary_line = binary_line[:free_bytes_in_block] + \
+                          ('\x00' * NUMBER_FILL_BYTES) + \
+                          binary_line[free_bytes_in_block:]
+        self.write(binary_line)
+    
+    
+    def close(self):
+        '''Fill up the last block, write it to data_fp and return the total
+        number of blocks.'''
+        missing_bytes = BLOCK_SIZE - (self.length % BLOCK_SIZE)
+        self.write('\x00' * missing_bytes)
+        assert self._pending_length == 0
+        return self.length / BLOCK_SIZE
@@ -3,24 +3,67 @@
 # See LICENSE.txt in the main project directory, for more information.
 # For the exact contribution history, see the git revision log.
 
+from cStringIO import StringIO
+from itertools import islice
 import math
+import mmap
 import re
 import warnings
 
 from libkne.controlrecord import ControlRecord
 from libkne.custom_info_record import CustomInfoRecord
+from libkne.datablocks import BLOCK_SIZE, BlockWriter, DataBuffer, \
+    OffsetReader, StreamingDataBuffer, strip_fill_bytes
 from libkne.data_line import DataLine
-from libkne.accountingline import AccountingLine
+from libkne.accountingline import AccountingLine, posting_line_spec
+from libkne.offsetindex import OffsetIndex, get_data_fingerprint
+from libkne.postingtable import PostingTable
+from libkne.readeroptions import ReaderOptions
 from libkne.util import assert_match, assert_true, parse_short_date, \
-    _short_date, parse_number, parse_string, APPLICATION_NUMBER_TRANSACTION_DATA
+    _short_date, parse_number, parse_string, APPLICATION_NUMBER_TRANSACTION_DATA, \
+    AMOUNTS_CENTS, AMOUNTS_DECIMAL, assert_amounts
+
+__all__ = ['DataFile', 'InvalidRecord']
+
+# all errors which are raised by the parser for malformed data
+parse_errors = (AssertionError, IndexError, ValueError)
+
+
+class InvalidRecord(object):
+    '''A record which could not be parsed in tolerant mode (see 
+    DataFile.from_binary()).'''
+    
+    def __init__(self, file_number, file_offset, raw_data, message):
+        self.file_number = file_number
+        # offset in the data file (including fill bytes)
+        self.file_offset = file_offset
+        self.block_number = file_offset / BLOCK_SIZE + 1
+        # the record (and all skipped bytes up to the next valid record)
+        self.raw_data = raw_data
+        self.message = message
+    
+    
+    def __repr__(self):
+        return '%s<file %d, offset %d, block %d: %s>' % \
+            (self.__class__.__name__, self.file_number, self.file_offset, 
+             self.block_number, self.message)
 
-__all__ = ['DataFile']
 
 
 class DataFile(object):
     
-    def __init__(self, config, version_identifier=None):
+    def __init__(self, config, version_identifier=None, data_fp=None, 
+                 amounts=AMOUNTS_DECIMAL):
+        '''If data_fp is given, the file is written in streaming mode: Every 
+        appended line is encoded immediately and complete blocks are written
+        to data_fp (which must be seekable because the feed line is updated
+        in finish()). The lines themselves are not kept.
+        amounts is the representation of all amounts in the posting lines 
+        (Decimals or ints of cents, see AccountingLine.from_binary()). 
+        from_binary() may change it.'''
+        assert_amounts(amounts)
         self.config = config
+        self.amounts = amounts
         self.binary_info = None
         
         transaction_code = str(APPLICATION_NUMBER_TRANSACTION_DATA)
@@ -31,22 +74,45 @@ class DataFile(object):
         self.version_identifier = version_identifier
         
         self.lines = []
+        self._pending_data = None
         self.cr = None
+        # attribute name -> {value: [row positions in self.lines]}, see 
+        # _get_posting_index()
+        self._posting_indexes = {}
+        # file offsets of all posting lines with block statistics, see 
+        # from_binary()
+        self.offset_index = None
+        self.offset_index_filename = None
+        self._offset_index_builder = None
+        self._data_fp = None
+        # records which were skipped in tolerant mode, see from_binary()
+        self.tolerant = False
+        self.invalid_records = []
+        
+        self.data_fp = data_fp
+        self.block_writer = None
+        if data_fp != None:
+            self.lines = None
+        self.number_of_lines = 0
+        self.client_sum_total = 0
         
         self.open_for_additions = True
         self.number_of_blocks = None
     
     
-    def _client_total(self):
-        client_sum_total = 0
-        for line in self.lines:
-            client_sum_total += line.transaction_volume
-        
+    def is_streaming(self):
+        return self.data_fp != None
+    
+    
+    def _client_total(self, client_sum_total):
         if client_sum_total > 0:
             bin_total = 'x'
         else:
             bin_total = 'w'
-        int_total = abs(int(100 * client_sum_total))
+        if self.amounts == AMOUNTS_CENTS:
+            int_total = abs(client_sum_total)
+        else:
+            int_total = abs(int(100 * client_sum_total))
         
         bin_total += '%014d' % int_total 
         bin_total += 'y' + 'z'
@@ -123,6 +189,36 @@ class DataFile(object):
         return bin_versioninfo
     
     
+    def _get_feed_line(self):
+        if self.contains_transaction_data():
+            return self._get_complete_feed_line()
+        return self._get_short_feed_line()
+    
+    
+    def _get_version_record(self):
+        if self.contains_transaction_data():
+            return self._get_versioninfo_for_transaction_data(self.version_identifier)
+        return self._get_versioninfo_for_masterdata(self.version_identifier)
+    
+    
+    def _write_line(self, block_writer, line):
+        if self.contains_transaction_data():
+            binary_lines = line.to_binary(self.amounts)
+        else:
+            binary_lines = line.to_binary()
+        for binary_line in binary_lines:
+            block_writer.write_line(binary_line)
+    
+    
+    def _write_line_to_stream(self, line):
+        if self.block_writer == None:
+            # The feed line is rewritten in finish() when the date range of 
+            # all lines is known.
+            self.block_writer = BlockWriter(self.data_fp)
+            self.block_writer.write(self._get_feed_line() + self._get_version_record())
+        self._write_line(self.block_writer, line)
+    
+    
     def append_line(self, line):
         '''Append a new line to this file (only if to_binary() was not called 
         before on this file!). Return True if the line was appended 
@@ -142,8 +238,13 @@ class DataFile(object):
             
             # Short feed line must contain the same year as the transaction data
             self.config['accounting_year'] = line.date.year
+            self.client_sum_total += line.transaction_volume
         
-        self.lines.append(line)
+        if self.is_streaming():
+            self._write_line_to_stream(line)
+        else:
+            self.lines.append(line)
+        self.number_of_lines += 1
         return True
     
     
@@ -173,54 +274,47 @@ class DataFile(object):
         return result
     
     
-    def _compute_number_of_fill_bytes(self):
-        number_of_bytes = len(self.binary_info)
-        missing_bytes = 256 - (number_of_bytes % 256)
-        return missing_bytes
-    
-    
-    def _add_fill_bytes_at_file_end(self):
-        missing_bytes = self._compute_number_of_fill_bytes()
-        if missing_bytes > 0:
-            self.binary_info += '\x00' * missing_bytes
+    def _get_end_of_data(self):
+        if self.contains_transaction_data():
+            return self._client_total(self.client_sum_total)
+        return 'z'
     
     
-    def _insert_fill_bytes(self, binary_line):
-        number_fill_bytes = 6
-        blocks_used = len(self.binary_info) / 256 + 1
-        end_block_index = blocks_used * 256
-        free_bytes_in_block = end_block_index - number_fill_bytes \
-                                  - len(self.binary_info)
-        if free_bytes_in_block < len(binary_line):
-            binary_line = binary_line[:free_bytes_in_block] + \
-                          ('\x00' * number_fill_bytes) + \
-                          binary_line[free_bytes_in_block:]
-        return binary_line
+    def _finish_stream(self):
+        assert_true(self.block_writer != None, 'no lines in streamed file')
+        self.block_writer.write(self._get_end_of_data())
+        self.number_of_blocks = self.block_writer.close()
+        assert len(str(self.number_of_blocks)) <= 5
+        self.data_fp.seek(0)
+        self.data_fp.write(self._get_feed_line())
+        self.data_fp.seek(0, 2)
     
     
     def finish(self):
         if self.open_for_additions:
-            for line in self.lines:
-                for posting_line in line.to_binary():
-                    self.binary_info += self._insert_fill_bytes(posting_line)
-            if self.contains_transaction_data():
-                self.binary_info += self._client_total()
+            if self.is_streaming():
+                self._finish_stream()
             else:
-                self.binary_info += 'z'
-            self._add_fill_bytes_at_file_end()
+                data_fp = StringIO()
+                block_writer = BlockWriter(data_fp)
+                block_writer.write(self.binary_info)
+                for line in self.lines:
+                    self._write_line(block_writer, line)
+                block_writer.write(self._get_end_of_data())
+                block_writer.close()
+                self.binary_info = data_fp.getvalue()
             self.open_for_additions = False
     
     
     def _remove_fill_bytes(self, binary_data, number_data_blocks):
-        filtered_data = binary_data
-        for i in range(number_data_blocks, 0, - 1):
-            end_index = 256 * i - 1
-            assert ('\x00' * 6) == filtered_data[end_index-5:end_index+1]
-            start_index = end_index
-            while filtered_data[start_index] == '\x00':
-                start_index -= 1
-            filtered_data = filtered_data[:start_index+1] + filtered_data[end_index+1:]
-        return filtered_data
+        '''Return the payload of all data blocks (without the trailing fill
+        bytes of each block) as a single string. Every block must end with at
+        least six '\\x00' bytes, a ValueError is raised otherwise.'''
+        payload_chunks = []
+        for i in range(number_data_blocks):
+            block = binary_data[BLOCK_SIZE * i:BLOCK_SIZE * (i + 1)]
+            payload_chunks.append(strip_fill_bytes(block, i + 1))
+        return ''.join(payload_chunks)
     
     
     def _check_feed_line(self, metadata, binary_data):
@@ -317,9 +411,9 @@ class DataFile(object):
         Raises a ValueError if this file does not contain transaction data.'''
         assert_true(self.contains_transaction_data())
         same_financial_year = True
-        if len(self.lines) > 0:
+        if self.number_of_lines > 0:
             year_for_new_line = date_for_new_line.year
-            same_calendar_year = (self.lines[0].date.year == year_for_new_line)
+            same_calendar_year = (self.config['accounting_year'] == year_for_new_line)
             same_financial_year = same_calendar_year
         return same_financial_year
     
@@ -338,49 +432,139 @@ class DataFile(object):
         return False
     
     
-    def _parse_custom_info_records(self, binary_data, start_index, line):
-        end_index = start_index
-        while self.more_custom_info_records(binary_data, end_index):
-            record, end_index = \
-                CustomInfoRecord.from_binary(binary_data, end_index)
-            line.custom_info_records.append(record)
-            end_index += 1
-        # In the last round of the loop we increment the counter although the 
-        # loop condition fails afterwards so we need to decrement the end_index.
-        # This holds also true if we did not parse any data, because then we 
-        # need to fake the end_index so that the character at start_index is 
-        # passed to the next function
-        end_index -= 1
-        return end_index
-    
-    
-    def _check_client_total(self, binary_data, start_index):
-        nr_start_index = start_index
-        nr_max_end_index = start_index+1+14-1
+    def _parse_client_total(self, binary_data, start_index):
+        '''Parse the client total (or a subtotal) which starts at start_index
+        ('x' for positive, 'w' for negative totals). Return the total (in 
+        cents) and the index of the next record.'''
+        sign = binary_data[start_index]
+        assert_true(sign in ('x', 'w'), repr(sign))
+        nr_start_index = start_index + 1
+        nr_max_end_index = nr_start_index+1+14-1
         client_total, end_index = parse_number(binary_data, nr_start_index, nr_max_end_index)
-        if binary_data[start_index] == 'w':
+        if sign == 'w':
             client_total *= -1
         end_index += 1
         assert 'y' == binary_data[end_index], repr(binary_data[end_index])
-        return end_index + 1
+        return (client_total, end_index + 1)
     
     
-    def _parse_transactions(self, binary_data, start_index, metadata):
-        end_index = start_index - 1
+    def _check_client_total(self, binary_data, start_index):
+        client_total, end_index = \
+            self._parse_client_total(binary_data, start_index - 1)
+        return end_index
+    
+    
+    def _check_end_of_data(self, buf, end_index):
+        err_msg = 'no more data expected after index %d' % end_index
+        assert_true(buf.is_exhausted(end_index + 1), err_msg)
+    
+    
+    def _iter_transactions(self, buf, start_index, metadata, offset_index=None,
+                           intern_table=None, record_invalid_records=True):
+        '''Parse all posting lines starting at start_index. If offset_index 
+        is given, the file offset of every posting line is added to it. 
+        intern_table is passed to AccountingLine.from_binary(). Invalid 
+        records (tolerant mode) are only added to self.invalid_records if 
+        record_invalid_records is True (so that scanning a part of the file 
+        again does not add them twice).'''
         while True:
             # There can be multiple subtotals between the lines so we must 
             # break if we really reached 'client total'
-            while self.more_posting_lines(binary_data, start_index):
-                line, end_index = AccountingLine.from_binary(binary_data, start_index, metadata)
-                self.lines.append(line)
-                end_index = self._parse_custom_info_records(binary_data, end_index+1, line)
-                start_index = end_index + 1
-            end_index = self._check_client_total(binary_data, end_index+2)
-            if binary_data[end_index] != 'z':
+            start_index = buf.fill(start_index)
+            while self.more_posting_lines(buf.data, start_index):
+                try:
+                    line, end_index = AccountingLine.from_binary(buf.data, 
+                        start_index, metadata, intern_table, self.amounts)
+                except parse_errors, e:
+                    if not self.tolerant:
+                        raise
+                    start_index = self._skip_invalid_record(buf, 
+                        start_index, e, record_invalid_records)
+                    continue
+                if offset_index != None:
+                    offset_index.add(buf.file_offset(start_index), line, 
+                                     self.amounts)
+                start_index = buf.fill(end_index + 1)
+                while self.more_custom_info_records(buf.data, start_index):
+                    try:
+                        record, end_index = \
+                            CustomInfoRecord.from_binary(buf.data, start_index)
+                    except parse_errors, e:
+                        if not self.tolerant:
+                            raise
+                        start_index = self._skip_invalid_record(buf, 
+                            start_index, e, record_invalid_records)
+                        continue
+                    line.custom_info_records.append(record)
+                    start_index = buf.fill(end_index + 1)
+                yield line
+            end_index = self._check_client_total(buf.data, start_index + 1)
+            if buf.data[end_index] != 'z':
                 start_index = end_index
             else:
                 break
-        return end_index
+        self._check_end_of_data(buf, end_index)
+        if offset_index != None:
+            self._set_offset_index(offset_index)
+    
+    
+    def _is_valid_record_start(self, binary_data, start_index):
+        '''Return True if a posting line or a client total starts at 
+        start_index (or if there is no more data).'''
+        if start_index >= len(binary_data):
+            return True
+        if binary_data[start_index] in ('x', 'w'):
+            try:
+                self._parse_client_total(binary_data, start_index)
+                return True
+            except parse_errors:
+                return False
+        return posting_line_spec.regex.match(binary_data, start_index) != None
+    
+    
+    def _skip_invalid_record(self, buf, start_index, error, record=True):
+        '''Skip the record at start_index which could not be parsed and 
+        return the index of the next record terminator ('y') which is 
+        followed by a valid posting line or client total. If record is True,
+        the skipped bytes are stored in self.invalid_records. This is only 
+        used in tolerant mode, the error is raised again if there is no such
+        record.'''
+        file_offset = buf.file_offset(start_index)
+        raw_chunks = []
+        index = start_index
+        while True:
+            end_index = buf.data.find('y', index)
+            if end_index == -1:
+                raise error
+            raw_chunks.append(buf.data[index:end_index + 1])
+            index = buf.fill(end_index + 1)
+            if self._is_valid_record_start(buf.data, index):
+                break
+        if not record:
+            return index
+        message = '%s: %s' % (error.__class__.__name__, error)
+        file_number = self.get_metadata()['file_no']
+        invalid_record = InvalidRecord(file_number, file_offset, 
+                                       ''.join(raw_chunks), message)
+        self.invalid_records.append(invalid_record)
+        return index
+    
+    
+    def _set_offset_index(self, offset_index):
+        self.offset_index = offset_index
+        if self.offset_index_filename == None:
+            return
+        try:
+            index_fp = file(self.offset_index_filename, 'wb')
+            try:
+                offset_index.save(index_fp)
+            finally:
+                index_fp.close()
+        except (IOError, OSError), e:
+            # e.g. read-only directories, the index is still used in memory
+            msg = 'could not store offset index %s: %s'
+            warnings.warn(msg % (repr(self.offset_index_filename), e), 
+                          UserWarning)
     
     
     def more_master_data_lines(self, binary_data, start_index):
@@ -389,38 +573,121 @@ class DataFile(object):
         return False
     
     
-    def _parse_master_data(self, binary_data, start_index):
-        while self.more_master_data_lines(binary_data, start_index):
-            line, end_index = DataLine.from_binary(binary_data, start_index)
-            self.lines.append(line)
-            start_index = end_index + 1
-        assert 'z' == binary_data[start_index]
-        return start_index
+    def _iter_master_data(self, buf, start_index):
+        start_index = buf.fill(start_index)
+        while self.more_master_data_lines(buf.data, start_index):
+            line, end_index = DataLine.from_binary(buf.data, start_index)
+            yield line
+            start_index = buf.fill(end_index + 1)
+        assert 'z' == buf.data[start_index]
+        self._check_end_of_data(buf, start_index)
     
     
-    def from_binary(self, binary_control_record, data_fp):
-        '''Takes a binary control record and a file-like object which contains
-        the data and parses them.'''
+    def _iter_lines(self, buf, start_index, metadata, intern_table=None):
+        if self.contains_transaction_data():
+            offset_index = self._offset_index_builder
+            self._offset_index_builder = None
+            return self._iter_transactions(buf, start_index, metadata, 
+                                           offset_index, intern_table)
+        return self._iter_master_data(buf, start_index)
+    
+    
+    def _read_header(self, buf, metadata):
+        """Check the feed line and the version record at the beginning of the
+        data and return the index of the first data line."""
+        buf.fill(0)
+        end_index = self._check_feed_line(metadata, buf.data[:80])
+        relative_end_index = self._read_version_record(metadata, buf.data[end_index+1:])
+        end_index += relative_end_index + 1
+        return end_index + 1
+    
+    
+    def _read_control_record(self, binary_control_record):
         self.open_for_additions = False 
         cr = ControlRecord()
         cr.from_binary(binary_control_record)
         self.cr = cr
-        binary_data = data_fp.read()
+    
+    
+    def from_binary(self, binary_control_record, data_fp, options=None, 
+                    offset_index=None, offset_index_filename=None, 
+                    intern_table=None):
+        '''Takes a binary control record and a file-like object which contains
+        the data and parses them. options is a ReaderOptions instance (by 
+        default all options are off):
+        If options.lazy is True, only the feed line and the version record 
+        are read immediately. The data lines are parsed block by block from 
+        data_fp (which must not be closed before) when iterating over 
+        iter_posting_lines()/iter_master_data_lines().
+        If options.columnar is True (and lazy is False), posting lines are 
+        stored in a compact PostingTable instead of a list of 
+        AccountingLines.
+        If options.tolerant is True, posting lines (or custom info records) 
+        which can not be parsed are skipped (up to the next record 
+        terminator which is followed by a valid posting line) and stored in 
+        self.invalid_records instead of raising a ValueError.
+        If options.amounts is AMOUNTS_CENTS, all amounts in the posting lines
+        are ints of cents instead of Decimals.
+        data_fp may be a mmap object. Then the blocks are read one by one
+        from the mapping (like in lazy mode) so that the complete payload is 
+        never copied into memory.
+        offset_index is either an OffsetIndex for this file (e.g. loaded 
+        from disk) or True to build the index while parsing (transaction 
+        data only), the reader decides this for every file if 
+        options.offset_index is True. If offset_index_filename is given, a 
+        newly built index is saved there (data_fp must be seekable then, see
+        get_data_fingerprint()). The index is used by 
+        get_posting(), iter_postings() and the range scans.
+        If intern_table (an InternTable) is given, equal values of the 
+        posting lines are shared (see AccountingLine.from_binary()). It is 
+        not stored in the DataFile (only until the lines of a lazy file were
+        read).'''
+        if options == None:
+            options = ReaderOptions()
+        lazy = options.lazy
+        self.tolerant = options.tolerant
+        self.amounts = options.amounts
+        self._read_control_record(binary_control_record)
         metadata = self.get_metadata()
         number_data_blocks = metadata['number_data_blocks']
         assert_true(number_data_blocks > 0, number_data_blocks)
-        assert_match(256 * number_data_blocks, len(binary_data))
-        binary_data = self._remove_fill_bytes(binary_data, number_data_blocks)
-        end_index = self._check_feed_line(metadata, binary_data[:80])
-        relative_end_index = self._read_version_record(metadata, binary_data[end_index+1:])
-        end_index += relative_end_index + 1
-        start_index = end_index + 1
-        if self.contains_transaction_data():
-            end_index = self._parse_transactions(binary_data, start_index, metadata)
+        if lazy:
+            # needed for random access with the offset index
+            self._data_fp = data_fp
+        build_offset_index = (offset_index == True) and \
+            self.contains_transaction_data()
+        if build_offset_index:
+            data_fingerprint = None
+            if offset_index_filename != None:
+                # identifies the data file when the saved index is loaded
+                data_fingerprint = get_data_fingerprint(data_fp)
+            self._offset_index_builder = OffsetIndex(number_data_blocks, 
+                                                     data_fingerprint)
+            self.offset_index_filename = offset_index_filename
+        elif offset_index not in (None, True):
+            assert_match(number_data_blocks, offset_index.number_data_blocks,
+                         'number of blocks in offset index')
+            self.offset_index = offset_index
+        # tolerant mode needs the file offsets of invalid records
+        if lazy or build_offset_index or self.tolerant or \
+                isinstance(data_fp, mmap.mmap):
+            buf = StreamingDataBuffer(data_fp, number_data_blocks)
         else:
-            end_index = self._parse_master_data(binary_data, start_index)
-        err_msg = ('%d + 1 != %d' % (end_index, len(binary_data)))
-        assert end_index + 1 == len(binary_data), err_msg
+            binary_data = data_fp.read()
+            assert_match(256 * number_data_blocks, len(binary_data))
+            binary_data = self._remove_fill_bytes(binary_data, number_data_blocks)
+            buf = DataBuffer(binary_data)
+        start_index = self._read_header(buf, metadata)
+        if lazy:
+            self.lines = None
+            self._pending_data = (buf, start_index, intern_table)
+            return
+        lines = self._iter_lines(buf, start_index, metadata, intern_table)
+        if options.columnar and self.contains_transaction_data():
+            self.lines = PostingTable(metadata, self.amounts)
+            self.lines.extend(lines)
+        else:
+            self.lines = list(lines)
     
     
     def get_metadata(self):
@@ -431,24 +698,179 @@ class DataFile(object):
     def get_posting_lines(self):
         assert_true(self.contains_transaction_data())
         assert_true(not self.open_for_additions)
+        assert_true(self.lines != None, 'lazy file, use iter_posting_lines()')
         return self.lines
     
     
     def get_master_data_lines(self):
         assert not self.contains_transaction_data()
         assert not self.open_for_additions
+        assert_true(self.lines != None, 'lazy file, use iter_master_data_lines()')
         return self.lines
     
     
+    def _iter_parsed_lines(self):
+        assert_true(not self.open_for_additions)
+        if self.lines != None:
+            return iter(self.lines)
+        assert_true(self._pending_data != None, 'lines were already read')
+        buf, start_index, intern_table = self._pending_data
+        self._pending_data = None
+        return self._iter_lines(buf, start_index, self.get_metadata(), 
+                                intern_table)
+    
+    
+    def iter_posting_lines(self):
+        '''Return an iterator over all posting lines. For lazily read files
+        the lines are parsed while iterating which is only possible once.'''
+        assert_true(self.contains_transaction_data())
+        return self._iter_parsed_lines()
+    
+    
+    def _get_offset_index(self):
+        assert_true(self.offset_index != None, 
+                    'no offset index (not built yet?)')
+        return self.offset_index
+    
+    
+    def _iter_postings_at(self, posting_number):
+        '''Return an iterator over all posting lines starting with the given
+        posting line (which is found using the offset index).'''
+        file_offset = self._get_offset_index().offsets[posting_number]
+        block_number = file_offset / BLOCK_SIZE
+        metadata = self.get_metadata()
+        reader = OffsetReader(self._data_fp, block_number * BLOCK_SIZE)
+        number_of_blocks = metadata['number_data_blocks'] - block_number
+        buf = StreamingDataBuffer(reader, number_of_blocks, 
+                                  first_block_number=block_number)
+        start_index = buf.fill(file_offset % BLOCK_SIZE)
+        # invalid records were (or will be) recorded by the full parse
+        return self._iter_transactions(buf, start_index, metadata, 
+                                       record_invalid_records=False)
+    
+    
+    def get_posting(self, posting_number):
+        '''Return the posting line with the given number. For lazily read 
+        files, only this line is parsed (using the offset index).'''
+        assert_true(self.contains_transaction_data())
+        if self.lines != None:
+            return self.lines[posting_number]
+        offsets = self._get_offset_index().offsets
+        if posting_number < 0:
+            posting_number += len(offsets)
+        if not (0 <= posting_number < len(offsets)):
+            raise IndexError('posting number out of range')
+        return self._iter_postings_at(posting_number).next()
+    
+    
+    def iter_postings(self, start=0, stop=None):
+        '''Return an iterator over the posting lines from start to stop 
+        (exclusive, None means all remaining lines). For lazily read files,
+        parsing starts at the first requested line (using the offset 
+        index).'''
+        assert_true(self.contains_transaction_data())
+        if self.lines != None:
+            return iter(self.lines[start:stop])
+        number_of_postings = len(self._get_offset_index())
+        start, stop, step = slice(start, stop).indices(number_of_postings)
+        if start >= stop:
+            return iter([])
+        return islice(self._iter_postings_at(start), stop - start)
+    
+    
+    def _iter_postings_in_ranges(self, ranges, matches):
+        for start, stop in ranges:
+            for line in self.iter_postings(start, stop):
+                if matches(line):
+                    yield line
+    
+    
+    def _find_ranges(self, method_name, minimum, maximum):
+        if self.offset_index == None and self.lines != None:
+            return [(0, len(self.lines))]
+        return getattr(self._get_offset_index(), method_name)(minimum, maximum)
+    
+    
+    def iter_postings_by_date(self, date_start, date_end):
+        '''Return an iterator over all posting lines between date_start and 
+        date_end (both inclusive). Blocks without matching lines are skipped
+        (using the offset index).'''
+        ranges = self._find_ranges('find_date_ranges', date_start, date_end)
+        matches = lambda line: date_start <= line.date <= date_end
+        return self._iter_postings_in_ranges(ranges, matches)
+    
+    
+    def iter_postings_by_account(self, min_account, max_account=None):
+        '''Return an iterator over all posting lines for accounts between 
+        min_account and max_account (both inclusive). Blocks without 
+        matching lines are skipped (using the offset index).'''
+        if max_account == None:
+            max_account = min_account
+        ranges = self._find_ranges('find_account_ranges', min_account, 
+                                   max_account)
+        matches = lambda line: min_account <= line.account_number <= max_account
+        return self._iter_postings_in_ranges(ranges, matches)
+    
+    
+    def _get_posting_index(self, attribute_name):
+        '''Return a dict which maps every value of the given attribute to the
+        positions of all posting lines with this value. The index is built on
+        first use.'''
+        index = self._posting_indexes.get(attribute_name)
+        if index == None:
+            lines = self.get_posting_lines()
+            if isinstance(lines, PostingTable):
+                values = lines.get_column(attribute_name)
+            else:
+                values = [getattr(line, attribute_name) for line in lines]
+            index = {}
+            for position, value in enumerate(values):
+                index.setdefault(value, []).append(position)
+            self._posting_indexes[attribute_name] = index
+        return index
+    
+    
+    def _find_posting_lines(self, attribute_name, value):
+        positions = self._get_posting_index(attribute_name).get(value, [])
+        return [self.lines[position] for position in positions]
+    
+    
+    def postings_by_account(self, account_number):
+        'Return all posting lines for the given account number.'
+        return self._find_posting_lines('account_number', account_number)
+    
+    
+    def postings_by_offsetting_account(self, account_number):
+        'Return all posting lines for the given offsetting account number.'
+        return self._find_posting_lines('offsetting_account', account_number)
+    
+    
+    def postings_by_record_field1(self, value):
+        'Return all posting lines with the given value in record field 1.'
+        return self._find_posting_lines('record_field1', value)
+    
+    
+    def iter_master_data_lines(self):
+        '''Return an iterator over all master data lines. For lazily read 
+        files the lines are parsed while iterating which is only possible 
+        once.'''
+        assert not self.contains_transaction_data()
+        return self._iter_parsed_lines()
+    
+    
+    def iter_addresses(self):
+        '''Return an iterator over all addresses (KNEAddress instances) in 
+        this master data file (see libkne.model.address.iter_addresses()).
+        For lazily read files the lines are parsed while iterating.'''
+        # imported here because libkne.model imports libkne
+        from libkne.model.address import iter_addresses
+        return iter_addresses(self.iter_master_data_lines())
+    
+    
     def to_binary(self):
+        assert_true(not self.is_streaming(), 'streamed files are written in finish()')
         if self.version_identifier != None:
-            if self.contains_transaction_data():
-                feedline = self._get_complete_feed_line()
-                vid = self._get_versioninfo_for_transaction_data(self.version_identifier)
-            else:
-                feedline = self._get_short_feed_line()
-                vid = self._get_versioninfo_for_masterdata(self.version_identifier)
-            self.binary_info = feedline + vid
+            self.binary_info = self._get_feed_line() + self._get_version_record()
         
         self.finish()
         self.number_of_blocks = self._get_number_of_blocks()
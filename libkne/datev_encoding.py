@@ -21,10 +21,10 @@ import codecs
 ### Codec APIs
 class Codec(codecs.Codec):
     def encode(self,input,errors='strict'):
-        return codecs.charmap_encode(input,errors,encoding_map)
+        return codecs.charmap_encode(input,errors,encoding_table)
 
     def decode(self,input,errors='strict'):
-        return codecs.charmap_decode(input,errors,decoding_map)
+        return codecs.charmap_decode(input,errors,decoding_table)
 
 class StreamWriter(Codec,codecs.StreamWriter):
     pass
@@ -76,6 +76,42 @@ decoding_map.update({
 ### Encoding Map
 encoding_map = codecs.make_encoding_map(decoding_map)
 
+### Decoding Table/Encoding Table
+# The codec uses a decoding table (a string with one character for every byte,
+# u'\ufffe' means undefined) and the EncodingMap built from it because 
+# both are much faster than the dicts above (which are kept for reference).
+decoding_table = u''.join([unichr(decoding_map.get(i, 0xfffe)) 
+                           for i in range(256)])
+encoding_table = codecs.charmap_build(decoding_table)
+
+
+def decode(value):
+    '''Decode the byte string value without looking up the codec in the 
+    registry. Raises a UnicodeDecodeError for undefined bytes.'''
+    return codecs.charmap_decode(value, 'strict', decoding_table)[0]
+
+
+def encode(value):
+    '''Encode the unicode string value without looking up the codec in the 
+    registry. Raises a UnicodeEncodeError for characters which can not be 
+    represented.'''
+    return codecs.charmap_encode(value, 'strict', encoding_table)[0]
+
+
+def decode_many(values):
+    'Return a list with the decoded values of all given byte strings.'
+    charmap_decode = codecs.charmap_decode
+    table = decoding_table
+    return [charmap_decode(value, 'strict', table)[0] for value in values]
+
+
+def encode_many(values):
+    'Return a list with the encoded values of all given unicode strings.'
+    charmap_encode = codecs.charmap_encode
+    table = encoding_table
+    return [charmap_encode(value, 'strict', table)[0] for value in values]
+
+
 def register():
     '''Register this codec in the standard Python codec registry. Afterwards you
     can decode/encode strings using the codec name 'datev_ascii'.'''
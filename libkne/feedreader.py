@@ -0,0 +1,228 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''Incremental (push based) parsing of KNE data files. The data is passed in
+chunks of arbitrary size as it arrives (e.g. from an upload) and every call
+to feed() returns the lines which could be parsed so far. The parser never
+blocks or reads from a file itself so it can be driven by any event loop.'''
+
+from libkne.accountingline import AccountingLine
+from libkne.custom_info_record import CustomInfoRecord
+from libkne.datablocks import PushDataBuffer
+from libkne.data_line import DataLine
+from libkne.datafile import DataFile
+from libkne.interning import InternTable
+from libkne.knereader import parse_data_carrier_header, \
+    split_meta_info_for_data
+from libkne.util import AMOUNTS_DECIMAL, assert_amounts, assert_match, \
+    assert_true
+
+__all__ = ['DataFileFeedParser', 'KneFeedReader']
+
+# parser states
+HEADER = 'header'
+LINES = 'lines'
+CUSTOM_INFO_RECORDS = 'custom info records'
+END_OF_DATA = 'end of data'
+FINISHED = 'finished'
+
+
+class DataFileFeedParser(object):
+    '''Parses a single data file from chunks of data. The parsed lines are
+    only returned by feed()/close(), they are not stored in the DataFile
+    (self.datafile) which only provides the metadata. intern_table and 
+    amounts are passed to AccountingLine.from_binary().'''
+    
+    def __init__(self, config, binary_control_record, intern_table=None,
+                 amounts=AMOUNTS_DECIMAL):
+        self.datafile = DataFile(config, amounts=amounts)
+        self.datafile._read_control_record(binary_control_record)
+        self.datafile.lines = None
+        self.metadata = self.datafile.get_metadata()
+        number_data_blocks = self.metadata['number_data_blocks']
+        assert_true(number_data_blocks > 0, number_data_blocks)
+        self.buf = PushDataBuffer(number_data_blocks)
+        self.state = HEADER
+        self.index = 0
+        self.intern_table = intern_table
+        # posting line which may still be followed by custom info records
+        self._pending_line = None
+    
+    
+    def _parse_transaction_record(self):
+        '''Parse the next record in a transaction file and return the
+        completed posting line (if any).'''
+        buf, datafile = self.buf, self.datafile
+        if self.state == CUSTOM_INFO_RECORDS:
+            if datafile.more_custom_info_records(buf.data, self.index):
+                record, end_index = \
+                    CustomInfoRecord.from_binary(buf.data, self.index)
+                self._pending_line.custom_info_records.append(record)
+                self.index = end_index + 1
+                return None
+            line = self._pending_line
+            self._pending_line = None
+            self.state = LINES
+            return line
+        if datafile.more_posting_lines(buf.data, self.index):
+            line, end_index = \
+                AccountingLine.from_binary(buf.data, self.index, self.metadata, 
+                                           self.intern_table, datafile.amounts)
+            self._pending_line = line
+            self.state = CUSTOM_INFO_RECORDS
+            self.index = end_index + 1
+            return None
+        # There can be multiple subtotals between the lines
+        end_index = datafile._check_client_total(buf.data, self.index + 1)
+        if buf.data[end_index] == 'z':
+            self.state = END_OF_DATA
+        self.index = end_index
+        return None
+    
+    
+    def _parse_master_data_record(self):
+        buf = self.buf
+        if self.datafile.more_master_data_lines(buf.data, self.index):
+            line, end_index = DataLine.from_binary(buf.data, self.index)
+            self.index = end_index + 1
+            return line
+        assert_match('z', buf.data[self.index])
+        self.state = END_OF_DATA
+        return None
+    
+    
+    def parse(self, max_records=None):
+        '''Parse the records which are completely available (but at most
+        max_records records if given) and return the completed lines.'''
+        lines = []
+        number_records = 0
+        while self.state != FINISHED:
+            if (max_records != None) and (number_records >= max_records):
+                break
+            number_records += 1
+            if self.state == END_OF_DATA:
+                if not self.buf.is_complete():
+                    break
+                self.datafile._check_end_of_data(self.buf, self.index)
+                self.state = FINISHED
+                break
+            if not self.buf.has_record(self.index):
+                break
+            self.index = self.buf.fill(self.index)
+            if self.state == HEADER:
+                self.index = self.datafile._read_header(self.buf, self.metadata)
+                self.state = LINES
+            elif self.datafile.contains_transaction_data():
+                line = self._parse_transaction_record()
+                if line != None:
+                    lines.append(line)
+            else:
+                line = self._parse_master_data_record()
+                if line != None:
+                    lines.append(line)
+        return lines
+    
+    
+    def feed(self, data, max_records=None):
+        '''Add the next chunk of the data file and return a list of all lines
+        which were completed by this chunk. If max_records is given, at most
+        max_records records are parsed so that a large chunk does not block
+        the caller (e.g. an event loop) for long. The remaining records are 
+        parsed by the next calls of parse() or feed() (see 
+        has_available_records()).'''
+        assert_true(self.state != FINISHED, 'data after end of data')
+        self.buf.feed(data)
+        return self.parse(max_records)
+    
+    
+    def has_available_records(self):
+        'Return True if parse() can continue without more data.'
+        if self.state == FINISHED:
+            return False
+        if self.state == END_OF_DATA:
+            return self.buf.is_complete()
+        return self.buf.has_record(self.index)
+    
+    
+    def is_finished(self):
+        'Return True if the complete data file was parsed.'
+        return self.state == FINISHED
+    
+    
+    def close(self):
+        '''Signal that there is no more data and return the lines which were 
+        not parsed yet (see max_records in feed()). Raises a ValueError if 
+        the data file is incomplete.'''
+        lines = self.parse()
+        assert_true(self.is_finished(), 'incomplete data file (%d of %d blocks)'
+                    % (self.buf.blocks_read, self.buf.number_data_blocks))
+        return lines
+
+
+
+class KneFeedReader(object):
+    '''Reads a KNE data carrier whose data files arrive in chunks. The
+    control file (which is small) must be passed completely, the data files
+    are parsed incrementally with feed(index, data). The parsed lines are
+    only returned by feed(), parse() and close(), they are not stored in 
+    the data files (self.files) which only provide the metadata. amounts is
+    the representation of the amounts in the posting lines (see KneReader).
+    '''
+    
+    def __init__(self, header_fp, amounts=AMOUNTS_DECIMAL):
+        assert_amounts(amounts)
+        self.amounts = amounts
+        self.intern_table = InternTable()
+        self.config, data_meta_information = \
+            parse_data_carrier_header(header_fp)
+        meta_info_list = split_meta_info_for_data(data_meta_information)
+        assert_match(self.config['number_data_files'], len(meta_info_list))
+        self.parsers = []
+        for binary_control_record in meta_info_list:
+            parser = DataFileFeedParser(self.config, binary_control_record,
+                                        self.intern_table, amounts)
+            self.parsers.append(parser)
+        self.files = [parser.datafile for parser in self.parsers]
+    
+    
+    def get_config(self):
+        return self.config
+    
+    
+    def get_file(self, index):
+        return self.files[index]
+    
+    
+    def get_number_of_files(self):
+        return len(self.files)
+    
+    
+    def get_parser(self, index):
+        return self.parsers[index]
+    
+    
+    def feed(self, index, data, max_records=None):
+        '''Add the next chunk of the data file with the given index and return
+        a list of all lines which were completed by this chunk (see 
+        DataFileFeedParser.feed() for max_records).'''
+        return self.parsers[index].feed(data, max_records)
+    
+    
+    def parse(self, index, max_records=None):
+        '''Continue parsing the data file with the given index without adding
+        data (see DataFileFeedParser.parse()).'''
+        return self.parsers[index].parse(max_records)
+    
+    
+    def close(self, index=None):
+        '''Signal that the data file with the given index (all data files if
+        index is None) was received completely and return the lines which 
+        were not parsed yet (see DataFileFeedParser.close()). If index is 
+        None, a list with the remaining lines of each data file is returned.
+        The intern table is cleared when all data files were closed.'''
+        if index != None:
+            return self.parsers[index].close()
+        remaining_lines = [parser.close() for parser in self.parsers]
+        self.intern_table.clear()
+        return remaining_lines
@@ -0,0 +1,241 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''Declarative description of KNE records. A record is a sequence of fields
+which start with a (unique) prefix byte, followed by the field value and an
+optional terminator. The order of the fields is fixed, optional fields may be
+missing.
+
+A RecordSpec compiles the field table into a single regular expression for
+reading and uses the same table for writing so reader and writer can not
+drift apart.'''
+
+import re
+
+__all__ = ['NumberField', 'RecordSpec', 'StringField']
+
+
+class Field(object):
+    '''Base class for all fields. 'name' is the name of the attribute which
+    holds the field value (if index is given, the value is stored at this 
+    position of the list in this attribute). The conversion from/to the binary
+    value can be customized by passing 'load' (called with the object and the
+    binary value) and 'dump' (called with the object, must return the binary 
+    value or None) callables.
+    If interned is True, equal values of this field are shared by all 
+    records which are loaded with the same InternTable (see 
+    RecordSpec.load()). If the parsed value does not only depend on the 
+    binary value, 'intern_key' (called with the object and the binary value)
+    must return a key which contains everything the value depends on.'''
+    terminator = ''
+    
+    def __init__(self, prefix, name, max_length, required=False, index=None,
+                 load=None, dump=None, interned=False, intern_key=None):
+        self.prefix = prefix
+        self.name = name
+        self.max_length = max_length
+        self.required = required
+        self.index = index
+        assert not (interned and (index != None))
+        self.interned = interned
+        if intern_key != None:
+            self.get_intern_key = intern_key
+        if index != None:
+            self.load = self._load_item
+            self.get_binary_value = self._get_binary_value_of_item
+        if load != None:
+            self.load = load
+        if dump != None:
+            self.get_binary_value = dump
+        self.value_regex = re.compile('(?:%s)$' % self.value_pattern())
+        self.regex = re.compile(self.pattern())
+    
+    
+    def value_pattern(self):
+        raise NotImplementedError
+    
+    
+    def pattern(self):
+        return '%s(%s)%s' % (re.escape(self.prefix), self.value_pattern(),
+                             re.escape(self.terminator))
+    
+    
+    def decode(self, value):
+        return value
+    
+    
+    def encode(self, value):
+        return str(value)
+    
+    
+    def load(self, obj, value):
+        setattr(obj, self.name, self.decode(value))
+    
+    
+    def get_intern_key(self, obj, value):
+        return (self.name, value)
+    
+    
+    def _load_item(self, obj, value):
+        getattr(obj, self.name)[self.index] = self.decode(value)
+    
+    
+    def get_binary_value(self, obj):
+        value = getattr(obj, self.name)
+        if value == None:
+            return None
+        return self.encode(value)
+    
+    
+    def _get_binary_value_of_item(self, obj):
+        values = getattr(obj, self.name)
+        if self.index >= len(values) or values[self.index] == None:
+            return None
+        return self.encode(values[self.index])
+    
+    
+    def dump(self, obj):
+        '''Return the binary representation of this field (including prefix
+        and terminator) or None if the field is not present. Raises a
+        ValueError if the value can not be represented.'''
+        value = self.get_binary_value(obj)
+        if value == None:
+            if self.required:
+                raise ValueError('No value for required field %s' % self.name)
+            return None
+        if self.value_regex.match(value) == None:
+            msg = 'Invalid value for field %s: %s' % (self.name, repr(value))
+            raise ValueError(msg)
+        return self.prefix + value + self.terminator
+
+
+
+class NumberField(Field):
+    'A field which contains up to max_length digits (optionally signed).'
+    
+    def __init__(self, prefix, name, max_length, signed=False, **kwargs):
+        self.signed = signed
+        super(NumberField, self).__init__(prefix, name, max_length, **kwargs)
+    
+    
+    def value_pattern(self):
+        sign = ''
+        if self.signed:
+            sign = '[+\\-]'
+        return '%s[0-9]{1,%d}' % (sign, self.max_length)
+    
+    
+    def decode(self, value):
+        return int(value)
+    
+    
+    def encode(self, value):
+        return str(int(value))
+
+
+
+class StringField(Field):
+    '''A field which contains up to max_length characters and is terminated
+    by '\\x1c'. 'characters' is a regular expression character class which
+    describes all valid characters.'''
+    terminator = '\x1c'
+    
+    def __init__(self, prefix, name, max_length, min_length=0,
+                 characters='[^\\x1c]', **kwargs):
+        self.min_length = min_length
+        self.characters = characters
+        super(StringField, self).__init__(prefix, name, max_length, **kwargs)
+    
+    
+    def value_pattern(self):
+        return '%s{%d,%d}' % (self.characters, self.min_length, self.max_length)
+    
+    
+    def decode(self, value):
+        return value
+
+
+
+class RecordSpec(object):
+    '''Compiled description of a record. match() reads a complete record with
+    a single regular expression, dump() generates the binary representation.
+    '''
+    
+    def __init__(self, fields, terminator='y'):
+        self.fields = tuple(fields)
+        self.terminator = terminator
+        patterns = []
+        for field in self.fields:
+            pattern = field.pattern()
+            if not field.required:
+                pattern = '(?:%s)?' % pattern
+            patterns.append(pattern)
+        self.regex = re.compile(''.join(patterns) + re.escape(terminator))
+        self.fields_by_prefix = dict([(f.prefix, f) for f in self.fields 
+                                      if f.prefix != ''])
+    
+    
+    def _describe_error(self, data, start_index):
+        '''Walk through the record field by field to find out why it could not
+        be parsed and return an error message.'''
+        index = start_index
+        remaining_fields = list(self.fields)
+        while remaining_fields:
+            field = remaining_fields.pop(0)
+            match = field.regex.match(data, index)
+            if match != None:
+                index = match.end()
+                continue
+            prefix = field.prefix
+            prefix_found = (prefix != '') and \
+                (data[index:index+len(prefix)] == prefix)
+            if field.required or prefix_found:
+                msg = 'Missing or invalid field %s at index %d: %s'
+                return msg % (field.name, index, repr(data[index:index+40]))
+        unexpected_field = self.fields_by_prefix.get(data[index:index+1])
+        if unexpected_field != None:
+            msg = 'Invalid or misplaced field %s at index %d: %s'
+            return msg % (unexpected_field.name, index,
+                          repr(data[index:index+40]))
+        msg = 'Expected %s at index %d: %s'
+        return msg % (repr(self.terminator), index, repr(data[index:index+40]))
+    
+    
+    def match(self, data, start_index):
+        '''Parse the record which starts at start_index. Return a tuple of all
+        binary field values (None for missing fields) and the index of the
+        record terminator.'''
+        match = self.regex.match(data, start_index)
+        if match == None:
+            raise ValueError(self._describe_error(data, start_index))
+        return (match.groups(), match.end() - 1)
+    
+    
+    def load(self, obj, values, intern_table=None):
+        '''Set the attributes of obj using the binary values returned by 
+        match(). If intern_table (an InternTable) is given, the values of all
+        interned fields are looked up there first.'''
+        if intern_table == None:
+            for field, value in zip(self.fields, values):
+                if value != None:
+                    field.load(obj, value)
+            return
+        for field, value in zip(self.fields, values):
+            if value == None:
+                continue
+            if field.interned:
+                intern_table.load(field, obj, value)
+            else:
+                field.load(obj, value)
+    
+    
+    def dump(self, obj):
+        'Return the complete binary record for obj.'
+        binary_fields = []
+        for field in self.fields:
+            binary_field = field.dump(obj)
+            if binary_field != None:
+                binary_fields.append(binary_field)
+        binary_fields.append(self.terminator)
+        return ''.join(binary_fields)
@@ -0,0 +1,164 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''Bulk ingestion of many KNE data carriers (directories which contain a
+control file "EV01" and data files "ED#####"), e.g. one directory per client
+and month.'''
+
+from itertools import imap
+import logging
+import multiprocessing
+import os
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # backport for Python < 3.5 (optional)
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+from libkne.knefilereader import KneFileReader
+
+__all__ = ['find_kne_sets', 'ingest', 'Ingestion']
+
+log = logging.getLogger(__name__)
+
+
+def _list_directory(directory_name):
+    '''Return the names of all files and all subdirectories (two lists) in
+    the given directory.'''
+    filenames = []
+    subdirectories = []
+    if scandir != None:
+        for entry in scandir(directory_name):
+            if entry.is_dir():
+                subdirectories.append(entry.name)
+            elif entry.is_file():
+                filenames.append(entry.name)
+    else:
+        for name in os.listdir(directory_name):
+            path = os.path.join(directory_name, name)
+            if os.path.isdir(path):
+                subdirectories.append(name)
+            elif os.path.isfile(path):
+                filenames.append(name)
+    return (filenames, subdirectories)
+
+
+def find_kne_sets(paths):
+    '''Search the given directories recursively and yield a tuple
+    (directory, control file, data files) for every directory which contains
+    a control file and at least one data file.'''
+    if isinstance(paths, basestring):
+        paths = [paths]
+    pending_directories = list(reversed(paths))
+    while pending_directories:
+        directory_name = pending_directories.pop()
+        filenames, subdirectories = _list_directory(directory_name)
+        header_filename, data_filenames = \
+            KneFileReader._select_kne_files(directory_name, filenames)
+        if header_filename != None and len(data_filenames) > 0:
+            yield (directory_name, header_filename, data_filenames)
+        for name in reversed(sorted(subdirectories)):
+            pending_directories.append(os.path.join(directory_name, name))
+
+
+def _read_kne_set(job):
+    '''Read a single KNE set (possibly in a worker process). Return the
+    directory, the KneReader (or the exception if parsing failed) and the
+    number of bytes in all files.'''
+    (directory_name, header_filename, data_filenames), reader_options = job
+    number_of_bytes = 0
+    try:
+        for filename in [header_filename] + data_filenames:
+            number_of_bytes += os.path.getsize(filename)
+        reader = KneFileReader(header_filename, data_filenames, 
+                               **reader_options)
+        return (directory_name, reader, number_of_bytes)
+    except Exception, e:
+        return (directory_name, e, number_of_bytes)
+
+
+class Ingestion(object):
+    '''Iterator over the results of ingest(). Yields tuples (directory,
+    KneReader or exception) in the order of completion. The throughput
+    statistics are updated while iterating and logged when all sets were
+    read.'''
+    
+    def __init__(self, paths, workers=None, reader_options=None):
+        self.paths = paths
+        self.workers = workers
+        self.reader_options = reader_options or {}
+        assert not self.reader_options.get('lazy')
+        
+        self.number_of_sets = 0
+        self.number_of_errors = 0
+        self.number_of_bytes = 0
+        self.duration = 0.0
+        self._results = self._read_all()
+    
+    
+    def _iter_jobs(self):
+        for kne_set in find_kne_sets(self.paths):
+            yield (kne_set, self.reader_options)
+    
+    
+    def _read_all(self):
+        start = time.time()
+        pool = None
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers)
+            results = pool.imap_unordered(_read_kne_set, self._iter_jobs())
+        else:
+            results = imap(_read_kne_set, self._iter_jobs())
+        try:
+            for directory_name, reader, number_of_bytes in results:
+                self.number_of_sets += 1
+                self.number_of_bytes += number_of_bytes
+                if isinstance(reader, Exception):
+                    self.number_of_errors += 1
+                    log.warning('Could not read %s: %s', directory_name, reader)
+                self.duration = time.time() - start
+                yield (directory_name, reader)
+        finally:
+            if pool != None:
+                pool.terminate()
+                pool.join()
+        self.duration = time.time() - start
+        log.info('Read %d KNE sets (%d errors, %d bytes) in %.2f s: '
+                 '%.1f sets/s, %.0f bytes/s', self.number_of_sets,
+                 self.number_of_errors, self.number_of_bytes, self.duration,
+                 self.sets_per_second(), self.bytes_per_second())
+    
+    
+    def _per_second(self, value):
+        if self.duration <= 0:
+            return 0.0
+        return value / self.duration
+    
+    
+    def sets_per_second(self):
+        return self._per_second(self.number_of_sets)
+    
+    
+    def bytes_per_second(self):
+        return self._per_second(self.number_of_bytes)
+    
+    
+    def __iter__(self):
+        return self._results
+
+
+
+def ingest(paths, workers=None, **reader_options):
+    '''Find all KNE sets below the given directories and read them (with a
+    pool of worker processes if workers is greater than 1). Return an
+    iterator of (directory, KneReader or exception) tuples in the order of
+    completion. A set which can not be read does not stop the batch, the
+    exception is returned instead of the reader. Additional keyword
+    arguments are passed to the KneFileReader (e.g. columnar=True).'''
+    return Ingestion(paths, workers=workers, reader_options=reader_options)
@@ -0,0 +1,50 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''Sharing of equal field values while parsing. Currency codes, record
+fields, posting texts, account numbers and dates are repeated in almost every
+posting line. An InternTable maps the binary value of a field to the parsed
+value so that each distinct value is only parsed once and all lines
+reference the same object.'''
+
+__all__ = ['InternTable']
+
+DEFAULT_MAX_SIZE = 50000
+
+
+class InternTable(object):
+    '''Bounded mapping (intern key -> parsed value) used by RecordSpec.load()
+    for all fields which were declared with interned=True. If max_size
+    entries are reached, the table is cleared and filled again so that files
+    with many distinct values (e.g. record fields with invoice numbers) do
+    not use unbounded memory.'''
+    
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.values = {}
+    
+    
+    def __len__(self):
+        return len(self.values)
+    
+    
+    def clear(self):
+        self.values.clear()
+    
+    
+    def load(self, field, obj, value):
+        '''Set the attribute of obj for the given field (like field.load())
+        and reuse the parsed value if the same binary value was loaded
+        before.'''
+        key = field.get_intern_key(obj, value)
+        try:
+            parsed_value = self.values[key]
+        except KeyError:
+            field.load(obj, value)
+            if len(self.values) >= self.max_size:
+                self.values.clear()
+            self.values[key] = getattr(obj, field.name)
+            return
+        setattr(obj, field.name, parsed_value)
+
@@ -3,45 +3,235 @@
 # See LICENSE.txt in the main project directory, for more information.
 # For the exact contribution history, see the git revision log.
 
+import gzip
+import posixpath
 import re
 from StringIO import StringIO
 import os
+import tarfile
+import zipfile
 
+from datablocks import MappedFile, map_file
 from knereader import KneReader
+from offsetindex import OffsetIndex, get_data_fingerprint
+from parsecache import ParseCache
+from readeroptions import ReaderOptions
+from util import AMOUNTS_DECIMAL, assert_match
 
 __all__ = ['KneFileReader']
 
+
+# zipfile needs random access so a gzip compressed zip archive is 
+# decompressed into memory
+GZIP_ZIP_SIZE_LIMIT = 64 * 1024 * 1024
+
+
+def _get_zip_member_names(archive):
+    return [info.filename for info in archive.infolist() 
+            if not info.filename.endswith('/')]
+
+
+def _open_gzip_zip_archive(filename):
+    '''Open the zip archive in the gzip file (see _open_archive()). The 
+    zip archive is decompressed into memory, a ValueError is raised if it is
+    larger than GZIP_ZIP_SIZE_LIMIT bytes.'''
+    fp = gzip.open(filename, 'rb')
+    try:
+        try:
+            data = fp.read(GZIP_ZIP_SIZE_LIMIT + 1)
+        except IOError, e:
+            raise ValueError('Unsupported archive %s: %s' % (filename, e))
+    finally:
+        fp.close()
+    if len(data) > GZIP_ZIP_SIZE_LIMIT:
+        msg = 'Unsupported archive %s: gzip compressed zip archives must ' + \
+              'not be larger than %d bytes'
+        raise ValueError(msg % (filename, GZIP_ZIP_SIZE_LIMIT))
+    zip_fp = StringIO(data)
+    if not zipfile.is_zipfile(zip_fp):
+        raise ValueError('No zip or tar archive in %s' % filename)
+    archive = zipfile.ZipFile(zip_fp)
+    # all members share zip_fp so every member is read completely
+    open_member = lambda name: StringIO(archive.read(name))
+    return (archive, _get_zip_member_names(archive), open_member)
+
+
+def _open_archive(filename):
+    '''Open the zip or tar archive (optionally compressed with gzip or bzip2,
+    a gzip file may also contain a zip archive). Return the archive, the 
+    names of all regular files in it and a function which returns a 
+    file-like object for a member (the member is decompressed while it is 
+    read). The members can only be read until the archive is closed.'''
+    if zipfile.is_zipfile(filename):
+        archive = zipfile.ZipFile(filename)
+        # the archive was opened with a file name so every member uses its 
+        # own file handle
+        return (archive, _get_zip_member_names(archive), archive.open)
+    elif tarfile.is_tarfile(filename):
+        archive = tarfile.open(filename, 'r:*')
+        members = [member for member in archive.getmembers() if member.isfile()]
+        members_by_name = dict([(member.name, member) for member in members])
+        open_member = lambda name: archive.extractfile(members_by_name[name])
+        return (archive, [member.name for member in members], open_member)
+    return _open_gzip_zip_archive(filename)
+
+
 class KneFileReader(KneReader):
     'Reads the data from the file system and passes them to the KneReader'
     
-    def __init__(self, header_filename=None, data_filenames=None):
+    def __init__(self, header_filename=None, data_filenames=None, lazy=False,
+                 columnar=False, workers=None, use_mmap=False, 
+                 offset_index=False, cache_dir=None, tolerant=False, 
+                 amounts=AMOUNTS_DECIMAL):
+        '''If lazy is True, the data files stay open until close() is called.
+        If use_mmap is True, the data files are memory-mapped instead of 
+        being read into memory completely. Unless lazy is True, the mappings 
+        are closed after parsing, otherwise they are closed by close().
+        If offset_index is True, the offset index of every transaction file
+        is loaded from a file next to the data file ('ED00001.idx'). If 
+        there is no (current) index file, the index is built while parsing 
+        and saved.
+        If cache_dir is given, the parsed data files are stored in this
+        directory (see ParseCache) and loaded from there when the same files
+        are read again (lazy must be False). The cache entries are trusted, 
+        so only use a cache_dir which can not be written by others. Cached
+        posting lines are stored column by column, reading them with 
+        columnar=True is much faster than building AccountingLines again.'''
         assert header_filename != None
+        assert not (lazy and (cache_dir != None))
+        self.data_filenames = data_filenames
+        self.use_mmap = use_mmap
+        self.loaded_from_cache = False
+        options = ReaderOptions(lazy=lazy, columnar=columnar, 
+                                offset_index=offset_index, tolerant=tolerant,
+                                amounts=amounts)
+        if cache_dir != None:
+            cache = ParseCache(cache_dir)
+            filenames = [header_filename] + list(data_filenames or [])
+            # the same entry is used for columnar and non-columnar reading
+            cache_options = [('offset_index', bool(offset_index)),
+                             ('tolerant', tolerant), ('amounts', amounts)]
+            cache_key = cache.get_key(filenames, cache_options)
+            file_stats = cache.get_file_stats(filenames)
+            cached_files = cache.load(cache_key, filenames, file_stats)
+            if cached_files != None:
+                self._restore_cached_files(header_filename, cached_files, 
+                                           workers, options)
+                return
+        # the control file is small (128 bytes per data file)
         header_fp = StringIO(file(header_filename, 'rb').read())
         data_fps = []
         if data_filenames != None:
             for filename in data_filenames:
-                fake_fp = StringIO(file(filename, 'rb').read())
-                data_fps.append(fake_fp)
-        super(KneFileReader, self).__init__(header_fp=header_fp, 
-                                            data_fps=data_fps)
+                if use_mmap:
+                    data_fps.append(map_file(filename))
+                elif lazy:
+                    # data is read block by block while iterating over the lines
+                    data_fps.append(file(filename, 'rb'))
+                else:
+                    fake_fp = StringIO(file(filename, 'rb').read())
+                    data_fps.append(fake_fp)
+        try:
+            super(KneFileReader, self).__init__(header_fp=header_fp, 
+                                                data_fps=data_fps,
+                                                workers=workers,
+                                                options=options)
+        except:
+            for data_fp in data_fps:
+                data_fp.close()
+            raise
+        if lazy:
+            self._owned_fps.extend(data_fps)
+        elif use_mmap:
+            for data_fp in data_fps:
+                data_fp.close()
+        if cache_dir != None:
+            cache.store(cache_key, filenames, file_stats, self.files)
     
     
-    def _list_kne_files(cls, directory_name):
+    def _restore_cached_files(self, header_filename, cached_files, workers,
+                              options):
+        '''Read the control file and the headers of all data files (which 
+        contain configuration values) and take the lines of the data files
+        from cached_files (see ParseCache.load()).'''
+        header_fp = StringIO(file(header_filename, 'rb').read())
+        data_fps = [file(filename, 'rb') 
+                    for filename in (self.data_filenames or [])]
+        try:
+            header_options = ReaderOptions(lazy=True, amounts=options.amounts)
+            super(KneFileReader, self).__init__(header_fp=header_fp, 
+                                                data_fps=data_fps,
+                                                options=header_options)
+        finally:
+            for data_fp in data_fps:
+                data_fp.close()
+        assert_match(len(self.files), len(cached_files), 'cached data files')
+        for datafile, cached_file in zip(self.files, cached_files):
+            cached_file.restore(datafile, options.columnar)
+            datafile.tolerant = options.tolerant
+        self.options = options
+        self.workers = workers
+        self.loaded_from_cache = True
+    
+    
+    def _get_offset_index_options(self, index):
+        if not self.options.offset_index:
+            return (None, None)
+        data_filename = self.data_filenames[index]
+        index_filename = data_filename + '.idx'
+        if os.path.exists(index_filename) and \
+                os.path.getmtime(index_filename) >= os.path.getmtime(data_filename):
+            try:
+                offset_index = self._load_offset_index(index_filename)
+                data_fp = file(data_filename, 'rb')
+                try:
+                    data_fingerprint = get_data_fingerprint(data_fp)
+                finally:
+                    data_fp.close()
+                if offset_index.data_fingerprint == data_fingerprint:
+                    return (offset_index, None)
+            except (IOError, ValueError):
+                # unreadable or invalid index, build it again
+                pass
+        return (True, index_filename)
+    
+    
+    def _load_offset_index(self, index_filename):
+        index_fp = file(index_filename, 'rb')
+        try:
+            return OffsetIndex.load(index_fp)
+        finally:
+            index_fp.close()
+    
+    
+    def _get_data_for_worker(self, index, data_fp):
+        if self.use_mmap:
+            # the worker maps the file itself
+            return MappedFile(self.data_filenames[index])
+        return super(KneFileReader, self)._get_data_for_worker(index, data_fp)
+    
+    
+    def _get_data_file_name(self, index):
+        return os.path.basename(self.data_filenames[index])
+    
+    
+    def _select_kne_files(cls, directory_name, names):
+        '''Return the control file and the (sorted) data files among the 
+        given file names in directory_name. The control file is None if there
+        is none.'''
         header_filename = None
         ed_regex = re.compile('^ED(\d)+$', re.IGNORECASE)
         
         nr_to_filename_dict = {}
-        for item in os.listdir(directory_name):
+        for item in names:
             filename = os.path.join(directory_name, item)
-            
-            if os.path.isfile(filename):
-                normalized_name = item.upper()
-                match = ed_regex.match(normalized_name)
-                if match != None:
-                    nr = int(match.group(1))
-                    nr_to_filename_dict[nr] = filename
-                elif normalized_name.startswith('EV'):
-                    header_filename = filename
+            normalized_name = item.upper()
+            match = ed_regex.match(normalized_name)
+            if match != None:
+                nr = int(match.group(1))
+                nr_to_filename_dict[nr] = filename
+            elif normalized_name.startswith('EV'):
+                header_filename = filename
         
         data_filenames = []
         sorted_keys = sorted(nr_to_filename_dict.keys())
@@ -49,17 +239,101 @@ class KneFileReader(KneReader):
             filename = nr_to_filename_dict[nr]
             data_filenames.append(filename)
         return (header_filename, data_filenames)
+    _select_kne_files = classmethod(_select_kne_files)
+    
+    
+    def _list_kne_files(cls, directory_name):
+        names = []
+        for item in os.listdir(directory_name):
+            if os.path.isfile(os.path.join(directory_name, item)):
+                names.append(item)
+        return cls._select_kne_files(directory_name, names)
     _list_kne_files = classmethod(_list_kne_files)
     
     
-    def read_directory(cls, directory_name):
+    def read_directory(cls, directory_name, lazy=False, columnar=False, 
+                       workers=None, use_mmap=False, offset_index=False, 
+                       cache_dir=None, tolerant=False, amounts=AMOUNTS_DECIMAL):
         header_filename, data_filenames = cls._list_kne_files(directory_name)
         if header_filename == None:
             raise ValueError('No control file ("EV01") found!')
         elif len(data_filenames) == 0:
             raise ValueError('No data files ("ED.....") found!')
-        reader = KneFileReader(header_filename, data_filenames)
+        reader = KneFileReader(header_filename, data_filenames, lazy=lazy,
+                               columnar=columnar, workers=workers,
+                               use_mmap=use_mmap, offset_index=offset_index,
+                               cache_dir=cache_dir, tolerant=tolerant,
+                               amounts=amounts)
         return reader
     read_directory = classmethod(read_directory)
+    
+    
+    def _select_archive_members(cls, names):
+        '''Return the control file and the data files among the given member
+        names of an archive. All files of the KNE set must be in the same 
+        directory of the archive, a ValueError is raised if there is no or 
+        more than one KNE set.'''
+        names_by_directory = {}
+        for name in names:
+            directory_name, basename = posixpath.split(name)
+            names_by_directory.setdefault(directory_name, []).append(basename)
+        kne_sets = []
+        for directory_name, basenames in sorted(names_by_directory.items()):
+            header_name, data_names = cls._select_kne_files('', basenames)
+            if header_name != None and len(data_names) > 0:
+                header_name = posixpath.join(directory_name, header_name)
+                data_names = [posixpath.join(directory_name, name) 
+                              for name in data_names]
+                kne_sets.append((header_name, data_names))
+        if len(kne_sets) == 0:
+            raise ValueError('No control file ("EV01") with data files '
+                             '("ED.....") found!')
+        elif len(kne_sets) > 1:
+            header_names = [header_name for header_name, data in kne_sets]
+            raise ValueError('More than one KNE set in archive: %s' % 
+                             ', '.join(header_names))
+        return kne_sets[0]
+    _select_archive_members = classmethod(_select_archive_members)
+    
+    
+    def read_archive(cls, filename, lazy=False, columnar=False, workers=None,
+                     amounts=AMOUNTS_DECIMAL):
+        '''Read a KNE set (control file and data files) from a zip or tar 
+        archive (tar archives may be compressed with gzip or bzip2, a gzip 
+        file may also contain a zip archive) without extracting it to disk.
+        The data files are decompressed while they are parsed (a gzip 
+        compressed zip archive is decompressed into memory up front, see 
+        GZIP_ZIP_SIZE_LIMIT). If lazy is 
+        True, the archive stays open until close() is called on the returned
+        KneReader (the data files of compressed tar archives should be read 
+        one after the other then). Parse errors name the archive members.
+        Returns a KneReader.'''
+        archive, names, open_member = _open_archive(filename)
+        data_fps = []
+        try:
+            header_name, data_names = cls._select_archive_members(names)
+            # the control file is small (128 bytes per data file)
+            member_fp = open_member(header_name)
+            header_fp = StringIO(member_fp.read())
+            member_fp.close()
+            for name in data_names:
+                data_fps.append(open_member(name))
+            reader = KneReader(header_fp, data_fps, lazy=lazy, 
+                               columnar=columnar, workers=workers, 
+                               amounts=amounts, data_names=data_names)
+        except:
+            for data_fp in data_fps:
+                data_fp.close()
+            archive.close()
+            raise
+        if lazy:
+            # the archive must be closed after its members
+            reader._owned_fps.extend(data_fps + [archive])
+        else:
+            for data_fp in data_fps:
+                data_fp.close()
+            archive.close()
+        return reader
+    read_archive = classmethod(read_archive)
 
 
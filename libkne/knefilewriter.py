@@ -6,6 +6,7 @@
 import os
 
 from knewriter import KneWriter
+from util import AMOUNTS_DECIMAL
 
 __all__ = ['KneFileWriter']
 
@@ -17,11 +18,14 @@ class KneFileWriter(KneWriter):
         return file(new_ed_filename, "wb")
     
     
-    def __init__(self, config=None, dir=None):
+    def __init__(self, config=None, dir=None, streaming=False, 
+                 amounts=AMOUNTS_DECIMAL):
         self.dir = dir
         
         ev_filename = os.path.join(self.dir, "EV01")
         header_fp = file(ev_filename, "wb")
         super(KneFileWriter, self).__init__(config=config, header_fp=header_fp,
-                                            data_fp_builder=self.new_data_fp)
+                                            data_fp_builder=self.new_data_fp,
+                                            streaming=streaming,
+                                            amounts=amounts)
 
@@ -3,18 +3,156 @@
 # See LICENSE.txt in the main project directory, for more information.
 # For the exact contribution history, see the git revision log.
 
+from StringIO import StringIO
+import multiprocessing
+import traceback
+
+from datablocks import MappedFile
 from datafile import DataFile
+from interning import InternTable
+from readeroptions import ReaderOptions
+from util import AMOUNTS_DECIMAL, assert_true
 
 __all__ = ['KneReader']
 
+
+def parse_data_carrier_header(header_fp):
+    '''Parse the control file (header_fp) and return the config and the 
+    control records of the data files (see split_meta_info_for_data()).'''
+    config = {}
+    contents = header_fp.read()
+    assert (len(contents) > 0) and ((len(contents) % 128) == 0)
+    config['data_carrier_number'] = int(contents[:3])
+    assert ('   ' == contents[3:6])
+    config['advisor_number'] = int(contents[6:13])
+    config['advisor_name'] = contents[13:22].strip()
+    assert (' ' == contents[22])
+    config['number_data_files'] = int(contents[23:28])
+    config['number_last_data_file'] = int(contents[28:33])
+    assert (' '*95 == contents[33:128])
+    return config, contents[128:]
+
+
+def split_meta_info_for_data(data_meta_information):
+    '''Return a list with the binary control record of every data file.'''
+    number_of_blocks = int(len(data_meta_information) / 128)
+    meta_info_list = []
+    for i in range(number_of_blocks):
+        data = data_meta_information[(i * 128):((i + 1) * 128)]
+        meta_info_list.append(data)
+    return meta_info_list
+
+
+def get_data_file_name(index, data_names=None):
+    '''Return the name of the data file with the given index (used for 
+    error messages). The default names are 'ED00001', ...'''
+    if data_names != None:
+        return data_names[index]
+    return 'ED%05d' % (index + 1)
+
+
+def _parse_data_file_in_worker(job):
+    '''Parse a single data file in a worker process (see 
+    KneReader._parse_data_files_in_parallel()). Return the DataFile, a 
+    dict of all config values which were added or changed while parsing 
+    (the worker only has a copy of the config) and None. If parsing fails,
+    the DataFile and the dict are None and the last item is a tuple 
+    (exception class, message, formatted traceback), see 
+    _raise_worker_error().'''
+    config, binary_control_record, data, options = job
+    if isinstance(data, MappedFile):
+        data_fp = data.open()
+    else:
+        data_fp = StringIO(data)
+    original_config = dict(config)
+    datafile = DataFile(config)
+    try:
+        try:
+            # every worker uses its own table (the lines of a data file 
+            # still share their values after unpickling)
+            datafile.from_binary(binary_control_record, data_fp, options,
+                                 intern_table=InternTable())
+        except Exception, e:
+            # tracebacks can not be pickled
+            return (None, None, (e.__class__, str(e), traceback.format_exc()))
+    finally:
+        data_fp.close()
+    config_updates = {}
+    for key, value in config.items():
+        if (key not in original_config) or (original_config[key] != value):
+            config_updates[key] = value
+    return (datafile, config_updates, None)
+
+
+def _raise_worker_error(name, error_info):
+    '''Raise the exception of a worker process again (see 
+    _parse_data_file_in_worker()) with the same type. The message names the 
+    data file and contains the traceback of the worker. If the exception 
+    class needs other arguments than a message (e.g. UnicodeDecodeError), 
+    its nearest base class which accepts a message is used.'''
+    exception_class, message, formatted_traceback = error_info
+    msg = 'Error while parsing %s: %s\n\nTraceback of the worker process:\n%s'
+    msg = msg % (name, message, formatted_traceback.rstrip())
+    for cls in exception_class.__mro__:
+        try:
+            error = cls(msg)
+        except TypeError:
+            continue
+        raise error
+    raise ValueError(msg)
+
+
 class KneReader(object):
     
-    def __init__(self, header_fp=None, data_fps=None):
+    def __init__(self, header_fp=None, data_fps=None, lazy=False, 
+                 columnar=False, workers=None, offset_index=False, 
+                 tolerant=False, amounts=AMOUNTS_DECIMAL, data_names=None,
+                 options=None):
         '''header_fp is a file-like object which contains the header file 
         contents. data_fps is a list of file-like objects which contain the
-        real data.'''
+        real data. data_names are the names of the data files which are used
+        in error messages (default: 'ED00001', ...).
+        If lazy is True, the data lines are not parsed up front but only when
+        iterating over them (e.g. with iter_posting_lines()). In this case the
+        data_fps must not be closed before all lines were read.
+        If columnar is True, the posting lines of each file are stored in a 
+        compact PostingTable (see DataFile.from_binary()).
+        If workers is greater than 1, the data files are parsed in a pool of
+        that many processes (lazy must be False). A parse error is raised 
+        with its original type, the message names the data file and 
+        contains the traceback of the worker process.
+        If offset_index is True, an OffsetIndex is built for every 
+        transaction file while parsing (see DataFile.from_binary()).
+        If tolerant is True, posting lines which can not be parsed are 
+        skipped instead of raising a ValueError (see get_invalid_records()).
+        Equal values of the posting lines (e.g. dates, posting texts) are 
+        shared using self.intern_table which is cleared by close().
+        Data files which are opened by the reader itself (see KneFileReader)
+        are closed by close().
+        If amounts is AMOUNTS_CENTS ('cents'), all amounts in the posting 
+        lines are ints of cents instead of Decimals (use 
+        libkne.util.cents_to_decimal() for a Decimal view).
+        The options lazy, columnar, offset_index, tolerant and amounts are 
+        stored in self.options (a ReaderOptions instance) which is passed to
+        every DataFile. Instead of them, a ReaderOptions instance can be 
+        given as options.
+        '''
+        if options == None:
+            options = ReaderOptions(lazy=lazy, columnar=columnar, 
+                                    offset_index=offset_index, 
+                                    tolerant=tolerant, amounts=amounts)
+        assert_true(not (options.lazy and (workers > 1)), 
+                    'lazy reading is not possible with multiple workers')
+        assert_true(not (options.offset_index and (workers > 1)),
+                    'offset indexes can not be built with multiple workers')
+        self.options = options
+        self.workers = workers
+        self.data_names = data_names
+        self.intern_table = InternTable()
+        # file handles and memory mappings which are closed by close()
+        self._owned_fps = []
         self.config, data_meta_information = \
-            self._parse_data_carrier_header(header_fp)
+            parse_data_carrier_header(header_fp)
         if data_fps == None:
             data_fps = []
         number_data_files = self.config['number_data_files']
@@ -22,43 +160,81 @@ class KneReader(object):
         # How can this be different?
         assert self.config['number_last_data_file'] == number_data_files
         assert len(data_fps) == int(len(data_meta_information) / 128)
-        meta_info_list = self._split_meta_info_for_data(data_meta_information)
-        self.files = []
-        for metainfo, data_fp in zip(meta_info_list, data_fps):
-            transaction_file = self._parse_data_file(metainfo, data_fp)
-            self.files.append(transaction_file)
-    
-    
-    def _parse_data_carrier_header(self, header_fp):
-        config = {}
-        contents = header_fp.read()
-        assert (len(contents) > 0) and ((len(contents) % 128) == 0)
-        config['data_carrier_number'] = int(contents[:3])
-        assert ('   ' == contents[3:6])
-        config['advisor_number'] = int(contents[6:13])
-        config['advisor_name'] = contents[13:22].strip()
-        assert (' ' == contents[22])
-        config['number_data_files'] = int(contents[23:28])
-        config['number_last_data_file'] = int(contents[28:33])
-        assert (' '*95 == contents[33:128])
-        return config, contents[128:]
-    
-    
-    def _split_meta_info_for_data(self, data_meta_information):
-        number_of_blocks = int(len(data_meta_information) / 128)
-        meta_info_list = []
-        for i in range(number_of_blocks):
-            data = data_meta_information[(i * 128):((i + 1) * 128)]
-            meta_info_list.append(data)
-        return meta_info_list
-    
-    
-    def _parse_data_file(self, binary_control_record, data_fp):
+        meta_info_list = split_meta_info_for_data(data_meta_information)
+        if workers > 1:
+            self.files = self._parse_data_files_in_parallel(meta_info_list, 
+                                                            data_fps)
+        else:
+            self.files = []
+            for i, (metainfo, data_fp) in enumerate(zip(meta_info_list, data_fps)):
+                transaction_file = self._parse_data_file(metainfo, data_fp, i)
+                self.files.append(transaction_file)
+    
+    
+    def _get_offset_index_options(self, index):
+        '''Return the offset_index and offset_index_filename arguments for 
+        DataFile.from_binary() for the data file with the given index.'''
+        return (self.options.offset_index or None, None)
+    
+    
+    def _parse_data_file(self, binary_control_record, data_fp, index=0):
+        offset_index, offset_index_filename = \
+            self._get_offset_index_options(index)
         tf = DataFile(self.config)
-        tf.from_binary(binary_control_record, data_fp)
+        tf.from_binary(binary_control_record, data_fp, self.options,
+                       offset_index=offset_index,
+                       offset_index_filename=offset_index_filename,
+                       intern_table=self.intern_table)
         return tf
     
     
+    def _get_data_file_name(self, index):
+        'Return the name of the data file (used for error messages).'
+        return get_data_file_name(index, self.data_names)
+    
+    
+    def _get_data_for_worker(self, index, data_fp):
+        '''Return the contents of the data file (or a MappedFile) so that it 
+        can be sent to a worker process.'''
+        return data_fp.read()
+    
+    
+    def _parse_data_files_in_parallel(self, meta_info_list, data_fps):
+        jobs = []
+        for i, (metainfo, data_fp) in enumerate(zip(meta_info_list, data_fps)):
+            data = self._get_data_for_worker(i, data_fp)
+            job = (self.config, metainfo, data, self.options)
+            jobs.append(job)
+        pool = multiprocessing.Pool(min(self.workers, len(jobs)))
+        try:
+            # map() returns the results in the order of the jobs
+            results = pool.map(_parse_data_file_in_worker, jobs)
+        finally:
+            pool.terminate()
+            pool.join()
+        # apply the config changes in the same order as a sequential read 
+        # and share the config with all data files again
+        datafiles = []
+        for i, (datafile, config_updates, error_info) in enumerate(results):
+            if error_info != None:
+                _raise_worker_error(self._get_data_file_name(i), error_info)
+            self.config.update(config_updates)
+            datafile.config = self.config
+            datafiles.append(datafile)
+        return datafiles
+    
+    
+    def close(self):
+        '''Close all data files which were opened by the reader (e.g. the 
+        memory mappings of lazily read files) and clear the intern table. 
+        Lines which were parsed already keep their values but lazily read 
+        files can not be iterated afterwards.'''
+        for data_fp in self._owned_fps:
+            data_fp.close()
+        del self._owned_fps[:]
+        self.intern_table.clear()
+    
+    
     def get_config(self):
         return self.config
     
@@ -78,4 +254,56 @@ class KneReader(object):
             if datafile.contains_transaction_data():
                 transaction_files.append(datafile)
         return transaction_files
-
+    
+    
+    def get_invalid_records(self):
+        '''Return a list of all records which were skipped in tolerant mode
+        (InvalidRecord instances). For lazily read files, the list is only
+        complete after all lines were read.'''
+        invalid_records = []
+        for datafile in self.files:
+            invalid_records.extend(datafile.invalid_records)
+        return invalid_records
+    
+    
+    def iter_posting_lines(self):
+        '''Return an iterator over the posting lines of all transaction files.
+        '''
+        for datafile in self.get_transaction_files():
+            for line in datafile.iter_posting_lines():
+                yield line
+    
+    
+    def iter_addresses(self):
+        '''Return an iterator over the addresses (KNEAddress instances) of 
+        all master data files.'''
+        for datafile in self.files:
+            if not datafile.contains_transaction_data():
+                for address in datafile.iter_addresses():
+                    yield address
+    
+    
+    def _find_posting_lines(self, method_name, value):
+        lines = []
+        for datafile in self.get_transaction_files():
+            lines.extend(getattr(datafile, method_name)(value))
+        return lines
+    
+    
+    def postings_by_account(self, account_number):
+        '''Return the posting lines of all transaction files for the given
+        account number (see DataFile.postings_by_account()).'''
+        return self._find_posting_lines('postings_by_account', account_number)
+    
+    
+    def postings_by_offsetting_account(self, account_number):
+        '''Return the posting lines of all transaction files for the given
+        offsetting account number.'''
+        return self._find_posting_lines('postings_by_offsetting_account', 
+                                        account_number)
+    
+    
+    def postings_by_record_field1(self, value):
+        '''Return the posting lines of all transaction files with the given
+        value in record field 1.'''
+        return self._find_posting_lines('postings_by_record_field1', value)
@@ -6,19 +6,29 @@
 import datetime
 
 from transactionmanager import TransactionManager
-from util import product_abbreviation
+from util import AMOUNTS_DECIMAL, assert_amounts, product_abbreviation
 
 __all__ = ['KneWriter']
 
 
 class KneWriter(object):
     
-    def __init__(self, config=None, header_fp=None, data_fp_builder=None):
+    def __init__(self, config=None, header_fp=None, data_fp_builder=None,
+                 streaming=False, amounts=AMOUNTS_DECIMAL):
         '''header_fp is a file-like object which will be used to store the KNE
         header. data_fp_builder is a callable that will return a file-like 
         object when called with the number of previously retrieved fp as a an
         argument. These file-like objects will be used to store the data items 
-        (transaction data or master data).'''
+        (transaction data or master data).
+        If streaming is True, every line is encoded when it is added and 
+        complete blocks are written to the data file immediately so the lines
+        are not kept in memory. The file-like objects must be seekable in 
+        this mode.
+        If amounts is AMOUNTS_CENTS ('cents'), all amounts of the posting 
+        lines (transaction volume, cash discount, base currency amount) must 
+        be ints of cents.'''
+        assert_amounts(amounts)
+        self.amounts = amounts
         self.header_fp = header_fp
         self.data_fp_builder = data_fp_builder
         self.number_data_files = 0
@@ -32,7 +42,8 @@ class KneWriter(object):
         
         version_info = self.get_version_identifier()
         self.transaction_manager = TransactionManager(self.config, version_info,
-                                                      data_fp_builder)
+                                                      data_fp_builder, streaming,
+                                                      amounts)
     
     
     def _build_config(self, cfg):
@@ -1,6 +1,6 @@
 # -*- coding: UTF-8 -*-
 
-from libkne.model.account import KNEAccount
+from libkne.model.account import KNEAccount, KNEPeriodBalance
 from libkne.model.address import KNEAddress
 from libkne.model.balanceparser import BalanceParser
 from libkne.model.opos_reader import OposReader
@@ -1,7 +1,7 @@
 # -*- coding: UTF-8 -*-
 
 
-__all__ = ["KNEAccount"]
+__all__ = ["KNEAccount", "KNEPeriodBalance"]
 
 class KNEAccount(object):
     def __init__(self, account_number, balance=None):
@@ -9,3 +9,13 @@ class KNEAccount(object):
         self.label = None
         self.balance = balance
 
+
+class KNEPeriodBalance(object):
+    """Debit and credit totals of an account in the period which starts at
+    period_start (see BalanceParser.periodic_balances())."""
+    def __init__(self, account_number, period_start, debit=0, credit=0):
+        self.number = account_number
+        self.period_start = period_start
+        self.debit = debit
+        self.credit = credit
+        self.balance = debit - credit
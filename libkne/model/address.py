@@ -8,7 +8,7 @@ from libkne import DataLine
 
 log = logging.getLogger(__name__)
 
-__all__ = ["KNEAddress"]
+__all__ = ["KNEAddress", "iter_addresses"]
 
 
 attr_codes = \
@@ -35,6 +35,15 @@ attr_codes = \
          interneturl2      = 804,
         )
 
+# attribute code -> attribute name
+attr_names = dict([(code, name) for name, code in attr_codes.items()])
+
+# master data lines with longer keys contain account labels
+max_attr_code = 999
+
+# maximum length of a single master data line
+max_line_length = 40
+
 
 class KNEAddress(object):
     
@@ -79,6 +88,9 @@ class KNEAddress(object):
         self._splittable_attribut_names = self._build_list_of_splittable_attribut_names()
         self._attrnames_sorted_by_key = self._build_sorted_attrname_dict()
         self._assert_no_unused_kw_arguments(kwargs)
+        # code -> text for all master data lines with codes which are not in
+        # attr_codes (only filled by from_masterdata_lines())
+        self.additional_fields = {}
     
     
     def _split_long_values(self, attrname, value):
@@ -174,4 +186,69 @@ class KNEAddress(object):
             if line != None:
                 lines.append(line)
         return lines
+    
+    
+    def _join_split_values(self):
+        for base_name in self._splittable_attribut_names:
+            first_part = getattr(self, base_name + '1')
+            if first_part == None:
+                continue
+            value = first_part
+            # build_masterdata_lines() only uses the second line if the 
+            # value does not fit into the first one.
+            second_part = getattr(self, base_name + '2')
+            if len(first_part) == max_line_length and second_part != None:
+                value += second_part
+            setattr(self, base_name, value)
+    
+    
+    def from_masterdata_lines(cls, lines):
+        '''Build an address from the master data lines of a single record
+        (starting with the line for 'new_record'). Values which were split 
+        across multiple lines (e.g. emailaddress1/emailaddress2) are joined 
+        in the base attribute (e.g. emailaddress). Returns None if the record
+        does not contain an account number (e.g. terms of payment).'''
+        values = {}
+        additional_fields = {}
+        for line in lines:
+            name = attr_names.get(line.key)
+            if name == None:
+                additional_fields[line.key] = line.text
+            else:
+                values[name] = line.text
+        account_number = values.pop('account_number', None)
+        if account_number in ['', None]:
+            return None
+        if account_number.isdigit():
+            account_number = int(account_number)
+        new_record = (values.pop('new_record', None) == '1')
+        address = cls(new_record, account_number, **values)
+        address.additional_fields = additional_fields
+        address._join_split_values()
+        return address
+    from_masterdata_lines = classmethod(from_masterdata_lines)
+
+
 
+def iter_addresses(lines):
+    '''Group consecutive master data lines (DataLine instances) into 
+    KNEAddress instances. Every address is returned as soon as the next record
+    starts so the lines can be read lazily. Lines outside of a record (e.g. 
+    account labels) and records without an account number are skipped.'''
+    new_record_code = attr_codes['new_record']
+    record_lines = None
+    for line in lines:
+        if line.key == new_record_code or line.key > max_attr_code:
+            if record_lines != None:
+                address = KNEAddress.from_masterdata_lines(record_lines)
+                if address != None:
+                    yield address
+            record_lines = None
+            if line.key == new_record_code:
+                record_lines = [line]
+        elif record_lines != None:
+            record_lines.append(line)
+    if record_lines != None:
+        address = KNEAddress.from_masterdata_lines(record_lines)
+        if address != None:
+            yield address
@@ -1,21 +1,188 @@
 # -*- coding: UTF-8 -*-
 """Groups transaction information and computes the account balance out of it."""
 
+from bisect import bisect_right
+import datetime
+from itertools import imap, izip
+import multiprocessing
 from operator import attrgetter
+import os
 
-from libkne.model.account import KNEAccount
+try:
+    import numpy
+except ImportError:
+    # optional, periodic_balances() uses a pure Python implementation then
+    numpy = None
+
+from libkne.knefilereader import KneFileReader
+from libkne.model.account import KNEAccount, KNEPeriodBalance
+from libkne.postingtable import PostingTable, integer_array
+from libkne.util import AMOUNTS_CENTS, AMOUNTS_DECIMAL, assert_amounts, \
+    assert_true, cents_to_decimal, decimal_to_cents
 
 __all__ = ["BalanceParser"]
 
+PERIOD_FREQUENCIES = ('month', 'quarter', 'year')
+
+# date(1970, 1, 1).toordinal(), numpy dates count the days since 1970-01-01
+ORDINAL_1970 = 719163
+
+
+def _get_period_start(day, freq):
+    if freq == 'month':
+        return datetime.date(day.year, day.month, 1)
+    elif freq == 'quarter':
+        return datetime.date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+    return datetime.date(day.year, 1, 1)
+
+
+def _get_boundaries(freq):
+    '''Return the ordinals of the custom period boundaries (None for 
+    'month', 'quarter', 'year').'''
+    if isinstance(freq, basestring):
+        assert_true(freq in PERIOD_FREQUENCIES, freq)
+        return None
+    boundaries = sorted([day.toordinal() for day in freq])
+    assert_true(len(boundaries) > 0, 'no period boundaries')
+    return boundaries
+
+
+def _period_totals(columns, freq, boundaries):
+    '''Return (account number, period start ordinal, debit, credit) tuples 
+    (amounts in cents) for all accounts with postings in a period.'''
+    period_starts = {}
+    totals = {}
+    for amounts, account_numbers, offsetting_accounts, dates in columns:
+        for amount, account_number, offsetting_account, ordinal in \
+                izip(amounts, account_numbers, offsetting_accounts, dates):
+            period_start = period_starts.get(ordinal)
+            if period_start == None:
+                if boundaries == None:
+                    day = datetime.date.fromordinal(ordinal)
+                    period_start = _get_period_start(day, freq).toordinal()
+                else:
+                    index = bisect_right(boundaries, ordinal) - 1
+                    assert_true(index >= 0, 'posting date before first period')
+                    period_start = boundaries[index]
+                period_starts[ordinal] = period_start
+            for number, value in [(account_number, amount), 
+                                  (offsetting_account, -amount)]:
+                key = (number, period_start)
+                entry = totals.get(key)
+                if entry == None:
+                    entry = totals[key] = [0, 0]
+                if value > 0:
+                    entry[0] += value
+                else:
+                    entry[1] -= value
+    return [(number, period_start, debit, credit) 
+            for (number, period_start), (debit, credit) in totals.items()]
+
+
+def _numpy_column(column):
+    if len(column) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    values = numpy.frombuffer(column, dtype=numpy.dtype(column.typecode))
+    return values.astype(numpy.int64)
+
+
+def _numpy_period_starts(dates, freq, boundaries):
+    if boundaries != None:
+        boundaries = numpy.array(boundaries, dtype=numpy.int64)
+        indexes = numpy.searchsorted(boundaries, dates, side='right') - 1
+        assert_true(not (indexes < 0).any(), 'posting date before first period')
+        return boundaries[indexes]
+    days = (dates - ORDINAL_1970).astype('datetime64[D]')
+    if freq == 'year':
+        starts = days.astype('datetime64[Y]')
+    else:
+        starts = days.astype('datetime64[M]')
+        if freq == 'quarter':
+            months = starts.astype(numpy.int64)
+            # month 0 is January 1970 (floor modulo also for earlier dates)
+            starts = (months - months % 3).astype('datetime64[M]')
+    return starts.astype('datetime64[D]').astype(numpy.int64) + ORDINAL_1970
+
+
+def _numpy_period_totals(columns, freq, boundaries):
+    '''Same as _period_totals() but groups the postings with numpy: Account
+    numbers and periods are mapped to dense integer codes and the amounts 
+    are summed with numpy.add.at() (integer arithmetic so the totals are 
+    exact).'''
+    if len(columns) == 0:
+        return []
+    amounts, account_numbers, offsetting_accounts, dates = \
+        [numpy.concatenate([_numpy_column(c[i]) for c in columns]) 
+         for i in range(4)]
+    period_starts = _numpy_period_starts(dates, freq, boundaries)
+    # every posting line changes the account and the offsetting account
+    numbers = numpy.concatenate([account_numbers, offsetting_accounts])
+    values = numpy.concatenate([amounts, -amounts])
+    periods = numpy.concatenate([period_starts, period_starts])
+    account_values, account_codes = numpy.unique(numbers, return_inverse=True)
+    period_values, period_codes = numpy.unique(periods, return_inverse=True)
+    number_of_periods = len(period_values)
+    keys = account_codes * number_of_periods + period_codes
+    size = len(account_values) * number_of_periods
+    debits = numpy.zeros(size, dtype=numpy.int64)
+    credits = numpy.zeros(size, dtype=numpy.int64)
+    numpy.add.at(debits, keys, numpy.where(values > 0, values, 0))
+    numpy.add.at(credits, keys, numpy.where(values < 0, -values, 0))
+    used_keys = numpy.flatnonzero(numpy.bincount(keys, minlength=size))
+    totals = []
+    for key in used_keys:
+        account_code, period_code = divmod(int(key), number_of_periods)
+        totals.append((int(account_values[account_code]), 
+                       int(period_values[period_code]), 
+                       int(debits[key]), int(credits[key])))
+    return totals
+
+
+def _compute_account_totals(path):
+    '''Read a single KNE set (archive file or directory, possibly in a 
+    worker process) and return a dict {account number: balance in cents}.
+    Only this dict is sent back to the parent process.'''
+    try:
+        if os.path.isdir(path):
+            reader = KneFileReader.read_directory(path, lazy=True, 
+                                                  amounts=AMOUNTS_CENTS)
+        else:
+            reader = KneFileReader.read_archive(path, lazy=True, 
+                                                amounts=AMOUNTS_CENTS)
+        try:
+            accounts = BalanceParser(reader).balances()
+        finally:
+            reader.close()
+    except Exception, e:
+        msg = 'Error while reading %s (%s: %s)'
+        raise ValueError(msg % (path, e.__class__.__name__, e))
+    return dict([(account.number, account.balance) for account in accounts])
+
+
 class BalanceParser(object):
     
-    def __init__(self, reader):
+    def __init__(self, reader, amounts=None):
+        '''amounts is the representation of the balances (AMOUNTS_DECIMAL or 
+        AMOUNTS_CENTS for ints of cents). By default the balances use the 
+        same representation as the amounts of the reader, otherwise every
+        amount is converted.'''
         self.reader = reader
+        self.reader_amounts = reader.options.amounts
+        if amounts == None:
+            amounts = self.reader_amounts
+        assert_amounts(amounts)
+        self.amounts = amounts
+        self._convert_amount = None
+        if amounts != self.reader_amounts:
+            if amounts == AMOUNTS_CENTS:
+                self._convert_amount = decimal_to_cents
+            else:
+                self._convert_amount = cents_to_decimal
     
     
     def _process_file(self, accounts, datafile):
         if datafile.contains_transaction_data():
-            for line in datafile.get_posting_lines():
+            for line in datafile.iter_posting_lines():
                 self._process_line(accounts, line)
     
     
@@ -28,6 +195,8 @@ class BalanceParser(object):
     def _process_line(self, accounts, line):
         self._create_accounts_if_necessary(accounts, line)
         amount = line.transaction_volume
+        if self._convert_amount != None:
+            amount = self._convert_amount(amount)
         accounts[line.account_number].balance += amount
         accounts[line.offsetting_account].balance -= amount
     
@@ -43,4 +212,91 @@ class BalanceParser(object):
         for i in range(self.reader.get_number_of_files()):
             self._process_file(accounts, self.reader.get_file(i))
         return self._serialize_account_list(accounts)
-
+    
+    
+    def _get_columns(self, datafile):
+        '''Return the amounts (in cents), account numbers, offsetting 
+        accounts and dates (ordinals) of all posting lines in the data file 
+        as arrays. The columns of a PostingTable are used directly.'''
+        lines = datafile.lines
+        if isinstance(lines, PostingTable):
+            return (lines.amounts, lines.account_numbers, 
+                    lines.offsetting_accounts, lines.dates)
+        columns = [integer_array() for i in range(4)]
+        amounts, account_numbers, offsetting_accounts, dates = columns
+        in_cents = (self.reader_amounts == AMOUNTS_CENTS)
+        for line in datafile.iter_posting_lines():
+            amount = line.transaction_volume
+            if not in_cents:
+                amount = decimal_to_cents(amount)
+            amounts.append(amount)
+            account_numbers.append(line.account_number)
+            offsetting_accounts.append(line.offsetting_account)
+            dates.append(line.date.toordinal())
+        return columns
+    
+    
+    def periodic_balances(self, freq='month', use_numpy=None):
+        '''Return the debit and credit totals (and the balance) of every 
+        account for every period with postings as a list of KNEPeriodBalance
+        instances (sorted by account number and period). freq is 'month',
+        'quarter', 'year' or a list of dates which are the first days of 
+        custom periods (the last period is open-ended, a ValueError is 
+        raised for postings before the first period).
+        The postings are grouped with numpy if it is installed (use_numpy
+        may be set to False to use the pure Python implementation which 
+        returns the same results).'''
+        boundaries = _get_boundaries(freq)
+        if use_numpy == None:
+            use_numpy = (numpy != None)
+        assert_true((numpy != None) or not use_numpy, 'numpy not installed')
+        columns = [self._get_columns(datafile) 
+                   for datafile in self.reader.get_transaction_files()]
+        if use_numpy:
+            totals = _numpy_period_totals(columns, freq, boundaries)
+        else:
+            totals = _period_totals(columns, freq, boundaries)
+        totals.sort()
+        period_balances = []
+        for number, period_start, debit, credit in totals:
+            if self.amounts != AMOUNTS_CENTS:
+                debit = cents_to_decimal(debit)
+                credit = cents_to_decimal(credit)
+            period_start = datetime.date.fromordinal(period_start)
+            period_balances.append(KNEPeriodBalance(number, period_start, 
+                                                    debit, credit))
+        return period_balances
+    
+    
+    def from_archives(cls, paths, workers=None, amounts=AMOUNTS_DECIMAL):
+        '''Compute the consolidated balances of many KNE sets (archive files
+        which can be read with KneFileReader.read_archive() or directories).
+        Every KNE set is read in a pool of worker processes if workers is 
+        greater than 1, the workers only return the totals per account which
+        are summed up afterwards. Returns a list of KNEAccount instances 
+        (sorted by account number) like balances().'''
+        assert_amounts(amounts)
+        paths = list(paths)
+        pool = None
+        if workers > 1 and len(paths) > 1:
+            pool = multiprocessing.Pool(min(workers, len(paths)))
+            results = pool.imap_unordered(_compute_account_totals, paths)
+        else:
+            results = imap(_compute_account_totals, paths)
+        accounts = {}
+        try:
+            for totals in results:
+                for number, balance in totals.items():
+                    accounts[number] = accounts.get(number, 0) + balance
+        finally:
+            if pool != None:
+                pool.terminate()
+                pool.join()
+        accountlist = []
+        for number, balance in accounts.items():
+            if amounts != AMOUNTS_CENTS:
+                balance = cents_to_decimal(balance)
+            accountlist.append(KNEAccount(number, balance=balance))
+        accountlist.sort(key=attrgetter('number'))
+        return accountlist
+    from_archives = classmethod(from_archives)
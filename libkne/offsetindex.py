@@ -0,0 +1,176 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''Offset index for the posting lines of a data file. It stores the file
+offset of every posting line and some statistics (date range, account range,
+sum of all amounts) for the posting lines which start in the same 256 byte
+block. This allows random access to single posting lines and range scans which
+skip all blocks without matching posting lines.'''
+
+from array import array
+import sys
+from zlib import crc32
+
+from libkne.datablocks import BLOCK_SIZE
+from libkne.util import AMOUNTS_CENTS, assert_match, assert_true, \
+    decimal_to_cents
+
+__all__ = ['OffsetIndex']
+
+INDEX_VERSION = '2'
+
+
+def get_data_fingerprint(data_fp):
+    '''Return a string which identifies the contents of a data file: its 
+    size and the CRC-32 checksums of the first and the last block. It is 
+    stored in saved indexes so that an index of another (version of the) 
+    data file is detected. data_fp must be seekable, its position is not 
+    changed.'''
+    position = data_fp.tell()
+    try:
+        data_fp.seek(0, 2)
+        size = data_fp.tell()
+        data_fp.seek(0)
+        first_block = data_fp.read(BLOCK_SIZE)
+        data_fp.seek(max(size - BLOCK_SIZE, 0))
+        last_block = data_fp.read(BLOCK_SIZE)
+    finally:
+        data_fp.seek(position)
+    return '%d:%08x:%08x' % (size, crc32(first_block) & 0xffffffff, 
+                             crc32(last_block) & 0xffffffff)
+
+
+class OffsetIndex(object):
+    
+    # names of all arrays in the order of the index file
+    columns = ('offsets', 'block_numbers', 'first_postings', 'min_dates',
+               'max_dates', 'min_accounts', 'max_accounts', 'amount_sums')
+    
+    def __init__(self, number_data_blocks, data_fingerprint=None):
+        self.number_data_blocks = number_data_blocks
+        # see get_data_fingerprint(), None if unknown
+        self.data_fingerprint = data_fingerprint
+        # file offset of every posting line
+        self.offsets = array('l')
+        # statistics for every block in which at least one posting line
+        # starts: block number, number of the first posting line in this
+        # block, date range (as ordinals), account range, sum of all amounts
+        # (in cents)
+        self.block_numbers = array('l')
+        self.first_postings = array('l')
+        self.min_dates = array('l')
+        self.max_dates = array('l')
+        self.min_accounts = array('l')
+        self.max_accounts = array('l')
+        self.amount_sums = array('l')
+    
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    
+    def add(self, file_offset, line, amounts=None):
+        '''Add a posting line which starts at file_offset. amounts is the
+        representation of the transaction volume in the line (see 
+        AccountingLine.from_binary()).'''
+        date = line.date.toordinal()
+        account_number = line.account_number
+        if amounts == AMOUNTS_CENTS:
+            amount = line.transaction_volume
+        else:
+            amount = decimal_to_cents(line.transaction_volume)
+        block_number = file_offset / BLOCK_SIZE
+        if len(self.block_numbers) == 0 or \
+                self.block_numbers[-1] != block_number:
+            self.block_numbers.append(block_number)
+            self.first_postings.append(len(self.offsets))
+            self.min_dates.append(date)
+            self.max_dates.append(date)
+            self.min_accounts.append(account_number)
+            self.max_accounts.append(account_number)
+            self.amount_sums.append(amount)
+        else:
+            self.min_dates[-1] = min(self.min_dates[-1], date)
+            self.max_dates[-1] = max(self.max_dates[-1], date)
+            self.min_accounts[-1] = min(self.min_accounts[-1], account_number)
+            self.max_accounts[-1] = max(self.max_accounts[-1], account_number)
+            self.amount_sums[-1] += amount
+        self.offsets.append(file_offset)
+    
+    
+    def _block_range(self, i):
+        'Return the numbers of the posting lines which start in block i.'
+        start = self.first_postings[i]
+        if i + 1 < len(self.first_postings):
+            return (start, self.first_postings[i + 1])
+        return (start, len(self.offsets))
+    
+    
+    def _find_ranges(self, min_values, max_values, minimum, maximum):
+        '''Return a list of (start, stop) tuples of posting line numbers which
+        are in blocks whose values overlap with [minimum, maximum]. Adjacent
+        blocks are merged into a single range.'''
+        ranges = []
+        for i in xrange(len(self.block_numbers)):
+            if max_values[i] < minimum or min_values[i] > maximum:
+                continue
+            start, stop = self._block_range(i)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], stop)
+            else:
+                ranges.append((start, stop))
+        return ranges
+    
+    
+    def find_date_ranges(self, date_start, date_end):
+        '''Return the ranges (start, stop) of posting line numbers which may
+        contain postings between date_start and date_end (both inclusive).'''
+        return self._find_ranges(self.min_dates, self.max_dates,
+                                 date_start.toordinal(), date_end.toordinal())
+    
+    
+    def find_account_ranges(self, min_account, max_account):
+        '''Return the ranges (start, stop) of posting line numbers which may
+        contain postings for accounts between min_account and max_account
+        (both inclusive).'''
+        return self._find_ranges(self.min_accounts, self.max_accounts,
+                                 min_account, max_account)
+    
+    
+    def save(self, fp):
+        'Write the index to the file-like object fp.'
+        fp.write('KNEIDX %s %s %d %d %d %s\n' % (INDEX_VERSION, 
+                    sys.byteorder, self.offsets.itemsize, 
+                    self.number_data_blocks, len(self.block_numbers),
+                    self.data_fingerprint or '-'))
+        fp.write('%d\n' % len(self.offsets))
+        for name in self.columns:
+            fp.write(getattr(self, name).tostring())
+    
+    
+    def load(cls, fp):
+        '''Read an index which was written by save(). Raises a ValueError if
+        the index is invalid or was written on an incompatible platform.'''
+        header = fp.readline().split()
+        assert_match(7, len(header), 'invalid index header')
+        assert_match(['KNEIDX', INDEX_VERSION, sys.byteorder], header[:3])
+        data_fingerprint = header[6]
+        if data_fingerprint == '-':
+            data_fingerprint = None
+        index = cls(int(header[4]), data_fingerprint)
+        number_of_blocks = int(header[5])
+        number_of_postings = int(fp.readline())
+        itemsize = index.offsets.itemsize
+        assert_match(itemsize, int(header[3]), 'index item size')
+        for name in cls.columns:
+            column = getattr(index, name)
+            length = number_of_blocks
+            if name == 'offsets':
+                length = number_of_postings
+            data = fp.read(length * itemsize)
+            assert_match(length * itemsize, len(data), 'index column %s' % name)
+            column.fromstring(data)
+        assert_true(fp.read(1) == '', 'data after end of index')
+        return index
+    load = classmethod(load)
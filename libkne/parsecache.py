@@ -0,0 +1,386 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''On-disk cache for parsed KNE data carriers. KNE archives are usually never
+changed after they were exported so re-reading them can be avoided by storing
+the parsed data files in a cache directory. Every entry is identified by a key
+which is built from the absolute names of the control file and all data files
+(and the reader options which change the parsed representation). The entry 
+stores the size, modification time and SHA-1 hash of every file. A file whose
+size changed invalidates the entry, the hash is only computed (and compared)
+if the size is the same but the modification time changed so looking up an 
+entry of unchanged files does not read them.
+
+An entry contains the posting lines of every transaction file column by 
+column (the arrays and string tables of a PostingTable) in a fixed binary 
+layout, master data lines, invalid records and offset indexes are stored as 
+plain values. Entries never contain pickled objects so loading an entry does
+not execute code. Still, the cache directory must only be writable by 
+trusted users: the contents of an entry are returned as parsed data without 
+checking them against the data files.'''
+
+from cStringIO import StringIO
+from decimal import Decimal
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+
+from libkne.custom_info_record import CustomInfoRecord
+from libkne.data_line import DataLine
+from libkne.datafile import InvalidRecord
+from libkne.offsetindex import OffsetIndex
+from libkne.postingtable import PostingTable, array_columns, \
+    integer_array, list_columns
+from libkne.util import assert_match
+
+__all__ = ['ParseCache']
+
+# increment if the layout of the cache entries changes
+CACHE_VERSION = 4
+
+CACHE_SUFFIX = '.knecache'
+
+TRANSACTION_DATA = 'transactions'
+MASTER_DATA = 'master data'
+
+
+def _write_value(fp, value):
+    '''Write a single value (None, int, str, unicode, Decimal, list, dict or
+    CustomInfoRecord) as a type tag followed by its data.'''
+    if value == None:
+        fp.write('N')
+    elif isinstance(value, (int, long)):
+        _write_data(fp, 'i', str(value))
+    elif isinstance(value, str):
+        _write_data(fp, 's', value)
+    elif isinstance(value, unicode):
+        _write_data(fp, 'u', value.encode('utf-8'))
+    elif isinstance(value, Decimal):
+        _write_data(fp, 'd', str(value))
+    elif isinstance(value, (list, tuple)):
+        fp.write('l' + struct.pack('<I', len(value)))
+        for item in value:
+            _write_value(fp, item)
+    elif isinstance(value, dict):
+        fp.write('m' + struct.pack('<I', len(value)))
+        for key, item in sorted(value.items()):
+            _write_value(fp, key)
+            _write_value(fp, item)
+    elif isinstance(value, CustomInfoRecord):
+        fp.write('c')
+        _write_value(fp, value.key)
+        _write_value(fp, value.value)
+    else:
+        raise ValueError('can not store %s in the cache' % repr(value))
+
+
+def _write_data(fp, tag, data):
+    fp.write(tag + struct.pack('<I', len(data)) + data)
+
+
+def _read(fp, size):
+    data = fp.read(size)
+    if len(data) != size:
+        raise ValueError('truncated cache entry')
+    return data
+
+
+def _read_length(fp):
+    return struct.unpack('<I', _read(fp, 4))[0]
+
+
+def _read_value(fp):
+    '''Read a value which was written by _write_value().'''
+    tag = _read(fp, 1)
+    if tag == 'N':
+        return None
+    elif tag in 'isud':
+        data = _read(fp, _read_length(fp))
+        if tag == 'i':
+            return int(data)
+        elif tag == 'u':
+            return data.decode('utf-8')
+        elif tag == 'd':
+            return Decimal(data)
+        return data
+    elif tag == 'l':
+        return [_read_value(fp) for i in xrange(_read_length(fp))]
+    elif tag == 'm':
+        items = {}
+        for i in xrange(_read_length(fp)):
+            key = _read_value(fp)
+            items[key] = _read_value(fp)
+        return items
+    elif tag == 'c':
+        key = _read_value(fp)
+        return CustomInfoRecord(key, _read_value(fp))
+    raise ValueError('invalid type tag %s in cache entry' % repr(tag))
+
+
+def _write_array(fp, column):
+    _write_value(fp, len(column))
+    column.tofile(fp)
+
+
+def _read_array(fp, column):
+    # raises an EOFError if the entry is truncated
+    column.fromfile(fp, _read_value(fp))
+
+
+def _write_list_column(fp, values):
+    '''Write a column of (mostly repeated) values as a table of distinct
+    values and the position of each value in this table.'''
+    distinct_values = []
+    positions = {}
+    indexes = integer_array()
+    for value in values:
+        # str and unicode values may be equal but are stored separately
+        key = (type(value), value)
+        position = positions.get(key)
+        if position == None:
+            position = positions[key] = len(distinct_values)
+            distinct_values.append(value)
+        indexes.append(position)
+    _write_value(fp, distinct_values)
+    _write_array(fp, indexes)
+
+
+def _read_list_column(fp):
+    distinct_values = _read_value(fp)
+    indexes = integer_array()
+    _read_array(fp, indexes)
+    return [distinct_values[index] for index in indexes]
+
+
+class CachedDataFile(object):
+    '''The parsed contents of a single data file as stored in the cache: a
+    PostingTable (transaction data) or a list of DataLines (master data), 
+    the invalid records and the offset index. The metadata of the data file
+    is not stored, it is read again from the data file itself (see 
+    restore()).'''
+    
+    def __init__(self, kind, lines, invalid_records=(), offset_index=None):
+        self.kind = kind
+        self.lines = lines
+        self.invalid_records = list(invalid_records)
+        self.offset_index = offset_index
+    
+    
+    def from_datafile(cls, datafile):
+        lines = datafile.lines
+        if datafile.contains_transaction_data():
+            kind = TRANSACTION_DATA
+            if not isinstance(lines, PostingTable):
+                lines = PostingTable(datafile.get_metadata(), datafile.amounts)
+                lines.extend(datafile.lines)
+        else:
+            kind = MASTER_DATA
+        return cls(kind, lines, datafile.invalid_records, 
+                   datafile.offset_index)
+    from_datafile = classmethod(from_datafile)
+    
+    
+    def restore(self, datafile, columnar=False):
+        '''Set the lines, invalid records and offset index of datafile. The
+        control record and the header of datafile must have been read 
+        already (e.g. with DataFile.from_binary(lazy=True)). The posting 
+        lines are stored as a PostingTable, unless columnar is True they are 
+        converted to AccountingLines here which takes about as long as 
+        building them while parsing (only the parsing of the records is 
+        saved).'''
+        expected_kind = MASTER_DATA
+        if datafile.contains_transaction_data():
+            expected_kind = TRANSACTION_DATA
+        assert_match(expected_kind, self.kind, 'cached data file')
+        lines = self.lines
+        if self.kind == TRANSACTION_DATA:
+            assert_match(datafile.amounts, lines.amounts_type, 'cached amounts')
+            lines.file_metadata = datafile.get_metadata()
+            if not columnar:
+                lines = list(lines)
+        datafile.lines = lines
+        datafile._pending_data = None
+        datafile._data_fp = None
+        datafile.invalid_records = list(self.invalid_records)
+        datafile.offset_index = self.offset_index
+    
+    
+    def save(self, fp):
+        _write_value(fp, self.kind)
+        if self.kind == TRANSACTION_DATA:
+            table = self.lines
+            _write_value(fp, table.amounts_type)
+            for name in array_columns:
+                _write_array(fp, getattr(table, name))
+            for name in list_columns:
+                _write_list_column(fp, getattr(table, name))
+            _write_value(fp, table.sparse_values)
+        else:
+            values = [[line.key, line.text, line.aggregation_or_adjustment_key]
+                      for line in self.lines]
+            _write_value(fp, values)
+        _write_value(fp, [[record.file_number, record.file_offset, 
+                           record.raw_data, record.message] 
+                          for record in self.invalid_records])
+        offset_index_data = None
+        if self.offset_index != None:
+            index_fp = StringIO()
+            self.offset_index.save(index_fp)
+            offset_index_data = index_fp.getvalue()
+        _write_value(fp, offset_index_data)
+    
+    
+    def load(cls, fp):
+        kind = _read_value(fp)
+        if kind == TRANSACTION_DATA:
+            # the metadata is set by restore()
+            lines = PostingTable(None, _read_value(fp))
+            for name in array_columns:
+                _read_array(fp, getattr(lines, name))
+            for name in list_columns:
+                setattr(lines, name, _read_list_column(fp))
+            lines.sparse_values = _read_value(fp)
+        elif kind == MASTER_DATA:
+            lines = [DataLine(*values) for values in _read_value(fp)]
+        else:
+            raise ValueError('invalid data file kind %s' % repr(kind))
+        invalid_records = [InvalidRecord(*values) 
+                           for values in _read_value(fp)]
+        offset_index = None
+        offset_index_data = _read_value(fp)
+        if offset_index_data != None:
+            offset_index = OffsetIndex.load(StringIO(offset_index_data))
+        return cls(kind, lines, invalid_records, offset_index)
+    load = classmethod(load)
+
+
+
+class ParseCache(object):
+    '''Stores the parsed data files of a KNE data carrier in cache_dir (see
+    KneFileReader). cache_dir must not be writable by untrusted users.'''
+    
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+    
+    
+    def _hash_file(self, filename):
+        checksum = hashlib.sha1()
+        fp = file(filename, 'rb')
+        try:
+            while True:
+                data = fp.read(1024 * 1024)
+                if not data:
+                    break
+                checksum.update(data)
+        finally:
+            fp.close()
+        return checksum.hexdigest()
+    
+    
+    def get_key(self, filenames, options=()):
+        '''Return the cache key for the given files (control file first) and
+        reader options (a sequence of (name, value) tuples). The key does not
+        depend on the contents of the files, they are checked by load().'''
+        key = hashlib.sha1('%d' % CACHE_VERSION)
+        for filename in filenames:
+            key.update(repr(os.path.abspath(filename)))
+        key.update(repr(tuple(options)))
+        return key.hexdigest()
+    
+    
+    def get_file_stats(self, filenames):
+        '''Return the size and modification time of the given files (see 
+        load() and store()).'''
+        file_stats = []
+        for filename in filenames:
+            stat = os.stat(filename)
+            file_stats.append([stat.st_size, repr(stat.st_mtime)])
+        return file_stats
+    
+    
+    def _is_current(self, file_infos, filenames, file_stats):
+        '''Return True if the files were not changed since the file_infos of
+        an entry (size, modification time and hash) were stored.'''
+        if len(file_infos) != len(filenames):
+            return False
+        for filename, (size, mtime), file_info in \
+                zip(filenames, file_stats, file_infos):
+            stored_size, stored_mtime, stored_hash = file_info
+            if size != stored_size:
+                return False
+            if (mtime != stored_mtime) and \
+                    (self._hash_file(filename) != stored_hash):
+                return False
+        return True
+    
+    
+    def _get_filename(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+    
+    
+    def _get_entry_header(self):
+        # arrays are stored in the native layout
+        return 'KNECACHE %d %s %d\n' % (CACHE_VERSION, sys.byteorder,
+                                        integer_array().itemsize)
+    
+    
+    def load(self, key, filenames, file_stats):
+        '''Return the list of CachedDataFiles for the given key or None if 
+        there is no (readable) cache entry or if the files (see get_key()) 
+        were changed. file_stats must be the current result of 
+        get_file_stats(filenames).'''
+        filename = self._get_filename(key)
+        if not os.path.exists(filename):
+            return None
+        fp = file(filename, 'rb')
+        try:
+            try:
+                if fp.readline() != self._get_entry_header():
+                    return None
+                file_infos = _read_value(fp)
+                if not self._is_current(file_infos, filenames, file_stats):
+                    return None
+                number_of_files = _read_value(fp)
+                cached_files = [CachedDataFile.load(fp) 
+                                for i in xrange(number_of_files)]
+                if fp.read(1) != '':
+                    return None
+            except Exception:
+                # truncated or incompatible entry, treat it as a cache miss
+                # (it is replaced by the next store())
+                return None
+        finally:
+            fp.close()
+        return cached_files
+    
+    
+    def store(self, key, filenames, file_stats, datafiles):
+        '''Store the parsed datafiles for the given key. file_stats is the 
+        result of get_file_stats(filenames) before the files were parsed, 
+        nothing is stored if a file was changed in the meantime. The entry is
+        written to a temporary file first so that concurrent readers never
+        see partial entries.'''
+        file_infos = [[size, mtime, self._hash_file(filename)] for 
+                      filename, (size, mtime) in zip(filenames, file_stats)]
+        if self.get_file_stats(filenames) != file_stats:
+            return
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, tmp_filename = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        fp = os.fdopen(fd, 'wb')
+        try:
+            try:
+                fp.write(self._get_entry_header())
+                _write_value(fp, file_infos)
+                _write_value(fp, len(datafiles))
+                for datafile in datafiles:
+                    CachedDataFile.from_datafile(datafile).save(fp)
+            finally:
+                fp.close()
+            os.rename(tmp_filename, self._get_filename(key))
+        except:
+            os.remove(tmp_filename)
+            raise
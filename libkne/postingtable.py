@@ -0,0 +1,216 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''Compact, column oriented storage for parsed posting lines. Instead of one
+AccountingLine instance per posting, every field is stored in a separate
+column (arrays of integers for amounts, account numbers and dates, lists of
+shared strings for text fields). Rarely used fields are kept in a sparse dict.
+'''
+
+from array import array
+import datetime
+
+from libkne.accountingline import AccountingLine
+from libkne.util import AMOUNTS_CENTS, AMOUNTS_DECIMAL, assert_amounts, \
+    assert_true, cents_to_decimal, decimal_to_cents
+
+__all__ = ['PostingTable']
+
+
+def _get_integer_typecode():
+    '''Return the typecode of 64 bit integer arrays or None. 'q' is only 
+    available in Python 3.3+, 'l' is only 32 bit where a C long is (e.g. on
+    Windows) which is not enough for 10 digit account numbers.'''
+    for typecode in ('q', 'l'):
+        try:
+            if array(typecode).itemsize >= 8:
+                return typecode
+        except ValueError:
+            pass
+    return None
+
+INTEGER_TYPECODE = _get_integer_typecode()
+
+
+def integer_array():
+    '''Return a new (empty) array of 64 bit integers. Raises a ValueError if
+    there are no such arrays on this platform.'''
+    assert_true(INTEGER_TYPECODE != None, 
+                'no 64 bit integer arrays on this platform')
+    return array(INTEGER_TYPECODE)
+
+
+# amendment key/tax key not set
+NO_KEY = -1
+
+# attributes which are only stored if they are set (see
+# PostingTable.sparse_values)
+sparse_attributes = ('cost_center1', 'cost_center2', 'cash_discount', 'eu_id',
+                     'eu_state', 'vat_id', 'eu_taxrate', 'base_currency_amount',
+                     'base_currency', 'exchange_rate')
+
+# columns which are stored in arrays and lists (see libkne.parsecache)
+array_columns = ('amounts', 'offsetting_accounts', 'account_numbers', 'dates',
+                 'amendment_keys', 'tax_keys')
+list_columns = ('record_fields1', 'record_fields2', 'posting_texts', 
+                'currency_codes')
+
+# attribute name -> name of the column which stores the values unchanged
+column_names = {'offsetting_account': 'offsetting_accounts',
+                'account_number': 'account_numbers',
+                'record_field1': 'record_fields1',
+                'record_field2': 'record_fields2',
+                'posting_text': 'posting_texts',
+                'currency_code_transaction_volume': 'currency_codes'}
+
+
+class PostingTable(object):
+    '''A sequence of posting lines stored column by column. Indexing or
+    iterating returns new AccountingLine instances (views) which are built on
+    demand, changing them does not modify the table. 'amounts' is the 
+    representation of the transaction volume in the appended and returned 
+    lines (see AccountingLine.from_binary()).'''
+    
+    def __init__(self, file_metadata, amounts=AMOUNTS_DECIMAL):
+        assert_amounts(amounts)
+        self.file_metadata = file_metadata
+        self.amounts_type = amounts
+        # transaction volume in cents
+        self.amounts = integer_array()
+        self.offsetting_accounts = integer_array()
+        self.account_numbers = integer_array()
+        # dates as proleptic Gregorian ordinals (date.toordinal())
+        self.dates = integer_array()
+        self.amendment_keys = array('b')
+        self.tax_keys = array('b')
+        self.record_fields1 = []
+        self.record_fields2 = []
+        self.posting_texts = []
+        self.currency_codes = []
+        # row -> {attribute name: value} for all rarely used fields
+        self.sparse_values = {}
+        self._shared_values = {}
+    
+    
+    def _share(self, value):
+        'Return an identical object for equal values to save memory.'
+        if value == None:
+            return None
+        # str and unicode values may be equal (and have the same hash) but 
+        # the type of the value must not change
+        key = (type(value), value)
+        return self._shared_values.setdefault(key, value)
+    
+    
+    def _to_cents(self, value):
+        if self.amounts_type == AMOUNTS_CENTS:
+            assert_true(isinstance(value, (int, long)), value)
+            return value
+        return decimal_to_cents(value)
+    
+    
+    def _key_to_column(self, key):
+        if key == None:
+            return NO_KEY
+        return key
+    
+    
+    def _key_from_column(self, key):
+        if key == NO_KEY:
+            return None
+        return key
+    
+    
+    def _get_sparse_values(self, line):
+        values = {}
+        for name in sparse_attributes:
+            value = getattr(line, name)
+            if value != None:
+                values[name] = value
+        if [field for field in line.reserved_fields if field != None]:
+            values['reserved_fields'] = list(line.reserved_fields)
+        if len(line.custom_info_records) > 0:
+            values['custom_info_records'] = list(line.custom_info_records)
+        return values
+    
+    
+    def append(self, line):
+        'Store the given AccountingLine in the table.'
+        # convert all values first so that a failure leaves no partial row
+        amount = self._to_cents(line.transaction_volume)
+        date = line.date.toordinal()
+        amendment_key = self._key_to_column(line.amendment_key)
+        tax_key = self._key_to_column(line.tax_key)
+        sparse_values = self._get_sparse_values(line)
+        
+        row = len(self)
+        self.amounts.append(amount)
+        self.offsetting_accounts.append(line.offsetting_account)
+        self.account_numbers.append(line.account_number)
+        self.dates.append(date)
+        self.amendment_keys.append(amendment_key)
+        self.tax_keys.append(tax_key)
+        self.record_fields1.append(self._share(line.record_field1))
+        self.record_fields2.append(self._share(line.record_field2))
+        self.posting_texts.append(self._share(line.posting_text))
+        currency_code = line.currency_code_transaction_volume
+        self.currency_codes.append(self._share(currency_code))
+        if len(sparse_values) > 0:
+            self.sparse_values[row] = sparse_values
+    
+    
+    def extend(self, lines):
+        for line in lines:
+            self.append(line)
+    
+    
+    def get_column(self, attribute_name):
+        '''Return the column which stores the values for the given 
+        AccountingLine attribute (only attributes whose values are stored 
+        unchanged are supported).'''
+        return getattr(self, column_names[attribute_name])
+    
+    
+    def get_line(self, row):
+        'Return a new AccountingLine which contains the values of the row.'
+        line = AccountingLine(self.file_metadata)
+        amount = self.amounts[row]
+        if self.amounts_type == AMOUNTS_DECIMAL:
+            amount = cents_to_decimal(amount)
+        line.transaction_volume = amount
+        line.amendment_key = self._key_from_column(self.amendment_keys[row])
+        line.tax_key = self._key_from_column(self.tax_keys[row])
+        line.offsetting_account = self.offsetting_accounts[row]
+        line.record_field1 = self.record_fields1[row]
+        line.record_field2 = self.record_fields2[row]
+        line.date = datetime.date.fromordinal(self.dates[row])
+        line.account_number = self.account_numbers[row]
+        line.posting_text = self.posting_texts[row]
+        line.currency_code_transaction_volume = self.currency_codes[row]
+        line.reserved_fields = [None] * 7
+        for name, value in self.sparse_values.get(row, {}).items():
+            if isinstance(value, list):
+                value = list(value)
+            setattr(line, name, value)
+        return line
+    
+    
+    def __len__(self):
+        return len(self.amounts)
+    
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            rows = xrange(*index.indices(len(self)))
+            return [self.get_line(row) for row in rows]
+        if index < 0:
+            index += len(self)
+        if not (0 <= index < len(self)):
+            raise IndexError('posting table index out of range')
+        return self.get_line(index)
+    
+    
+    def __iter__(self):
+        for row in xrange(len(self)):
+            yield self.get_line(row)
@@ -0,0 +1,24 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+from libkne.util import AMOUNTS_DECIMAL, assert_amounts
+
+__all__ = ['ReaderOptions']
+
+
+class ReaderOptions(object):
+    '''Options which control how the data files of a KNE data carrier are
+    parsed (see KneReader for their meaning). The KneReader creates a single
+    instance which is passed to DataFile.from_binary() for every data file
+    (and to the worker processes).'''
+    
+    def __init__(self, lazy=False, columnar=False, offset_index=False,
+                 tolerant=False, amounts=AMOUNTS_DECIMAL):
+        assert_amounts(amounts)
+        self.lazy = lazy
+        self.columnar = columnar
+        self.offset_index = offset_index
+        self.tolerant = tolerant
+        self.amounts = amounts
@@ -6,19 +6,40 @@
 from copy import copy
 
 from libkne.datafile import DataFile
-from libkne.util import APPLICATION_NUMBER_MASTER_DATA, APPLICATION_NUMBER_TRANSACTION_DATA
+from libkne.util import APPLICATION_NUMBER_MASTER_DATA, APPLICATION_NUMBER_TRANSACTION_DATA, \
+    AMOUNTS_DECIMAL
 
 __all__ = ['TransactionManager']
 
 class TransactionManager(object):
     
-    def __init__(self, config, version_identifier, data_fp_builder):
+    def __init__(self, config, version_identifier, data_fp_builder, 
+                 streaming=False, amounts=AMOUNTS_DECIMAL):
+        '''If streaming is True, the data_fp for every data file is retrieved
+        as soon as the file is created (so files are numbered in the order of
+        creation) and all lines are written immediately. amounts is passed to
+        all data files.'''
         self.config = config
         self.version_identifier = version_identifier
         self.data_fp_builder = data_fp_builder
+        self.streaming = streaming
+        self.amounts = amounts
         
         self.transaction_files = []
         self.masterdata_files = []
+        # all files in the order of creation (only used in streaming mode)
+        self.streamed_files = []
+    
+    
+    def _new_data_file(self, data_config):
+        if not self.streaming:
+            return DataFile(data_config, self.version_identifier, 
+                            amounts=self.amounts)
+        data_fp = self.data_fp_builder(len(self.streamed_files))
+        new_file = DataFile(data_config, self.version_identifier, data_fp,
+                            amounts=self.amounts)
+        self.streamed_files.append(new_file)
+        return new_file
     
     
     def append_masterdata_line(self, line):
@@ -26,7 +47,7 @@ class TransactionManager(object):
             data_config = copy(self.config)
             data_config['application_number'] = APPLICATION_NUMBER_MASTER_DATA
             data_config['accounting_number'] = 189
-            new_file = DataFile(data_config, self.version_identifier)
+            new_file = self._new_data_file(data_config)
             self.masterdata_files.append(new_file)
         tf = self.masterdata_files[-1]
         assert tf.append_line(line)
@@ -44,7 +65,7 @@ class TransactionManager(object):
             data_config['application_number'] = APPLICATION_NUMBER_TRANSACTION_DATA
             data_config['date_start'] = None
             data_config['date_end'] = None
-            transaction_file = DataFile(data_config, self.version_identifier)
+            transaction_file = self._new_data_file(data_config)
             self.transaction_files.append(transaction_file)
         assert transaction_file.append_line(line)
     
@@ -56,6 +77,11 @@ class TransactionManager(object):
         Return a list of control records. 
         '''
         control_records = []
+        if self.streaming:
+            for nr_files, df in enumerate(self.streamed_files):
+                df.finish()
+                control_records.append(df.build_control_record(nr_files))
+            return control_records
         nr_files = 0
         for files in [self.transaction_files, self.masterdata_files]:
             for df in files:
@@ -4,20 +4,29 @@
 # For the exact contribution history, see the git revision log.
 
 import datetime
+from decimal import Decimal
 import re
 
-__all__ = ['APPLICATION_NUMBER_TRANSACTION_DATA', 
+__all__ = ['AMOUNTS_CENTS', 'AMOUNTS_DECIMAL', 
+           'APPLICATION_NUMBER_TRANSACTION_DATA', 
            'APPLICATION_NUMBER_MASTER_DATA', '_short_date', 
-           'assert_match', 'assert_true', 
+           'assert_amounts', 'assert_match', 'assert_true', 
+           'cents_to_decimal', 'decimal_to_cents', 
            'product_abbreviation', 'get_number_of_decimal_places',
            'is_debtor_account', 'parse_short_date', 'parse_number', 
            'parse_number_field', 'parse_optional_number_field', 
            'parse_optional_string_field', 'parse_string', 'parse_string_field', 
-           'replace_unencodable_characters', 'short_date_to_binary', ]
+           'replace_unencodable_characters', 'scan_digits', 'scan_string', 
+           'short_date_to_binary', ]
 
 APPLICATION_NUMBER_TRANSACTION_DATA = 11
 APPLICATION_NUMBER_MASTER_DATA      = 13
 
+# Representation of amounts (transaction volume, cash discount, base currency
+# amount, client totals, balances): Decimal instances or ints of cents
+AMOUNTS_DECIMAL = 'decimal'
+AMOUNTS_CENTS = 'cents'
+
 product_abbreviation = 'lkne'
 
 def _short_date(date):
@@ -38,7 +47,7 @@ replacement_table_for_non_datev_characters = {
     # KNE ASCII does not know the '~' character. Probably it is used mostly for
     # URLs where it can be encoded using the hexadecimal ASCII value.
     u'~': '%7E',
-    
+
 #    
 #    u'': '', u'': '', u'': '', u'': '', u'': '', u'': '',
 }
@@ -100,6 +109,28 @@ def assert_true(condition, additional_data=None):
     assert_match(True, condition, additional_data=additional_data)
 
 
+def assert_amounts(amounts):
+    'Asserts that amounts is a valid representation of amounts.'
+    assert_true(amounts in (AMOUNTS_DECIMAL, AMOUNTS_CENTS), amounts)
+
+
+def cents_to_decimal(cents):
+    'Return the Decimal view of an amount in cents (None stays None).'
+    if cents == None:
+        return None
+    return Decimal(cents) / Decimal(100)
+
+
+def decimal_to_cents(value):
+    '''Return the amount (Decimal or int) as int of cents. Raises a ValueError
+    if the amount has more than 2 decimal places.'''
+    if value == None:
+        return None
+    cents = value * 100
+    assert_true(cents == int(cents), 'more than 2 decimal places: %s' % value)
+    return int(cents)
+
+
 def is_debtor_account(account_nr, general_ledger_account_number_length=4):
     '''Return True if the account_nr is a debtor account number in the DATEV
     accounting plain SKR03/04, else False.'''
@@ -126,18 +157,38 @@ def parse_short_date(binary_data):
     return datetime.date(year, month, day)
 
 
+digits_regex = re.compile('[0-9]*')
+
+def scan_digits(data, start_index, max_end_index):
+    '''Return the run of digits which starts at start_index (but does not 
+    extend max_end_index) and the index of its last digit. The digit string is
+    empty if there is no digit at start_index.'''
+    digits = digits_regex.match(data, start_index, max_end_index+1).group()
+    return (digits, start_index + len(digits) - 1)
+
+
+def scan_string(data, start_index, max_end_index=None, stop_character='\x1c'):
+    '''Return all characters from start_index up to the stop character and 
+    the index of the stop character. If max_end_index is given, the stop
+    character must be found at max_end_index+1 at the latest.'''
+    if max_end_index != None:
+        end = max_end_index + 1 + 1
+        stop_index = data.find(stop_character, start_index, end)
+    else:
+        end = len(data)
+        stop_index = data.find(stop_character, start_index)
+    if stop_index == -1:
+        assert_match(stop_character, data[end-1:end], data[start_index:end])
+    return (data[start_index:stop_index], stop_index)
+
+
 def parse_number(data, start_index, max_end_index, restrict_number_length=None):
     '''Reads all digits from start_index until either a non-digit character is
     read or the digit on position max_end_index was read successfully. Returns
     the read number (as int) and the last index where a digit was read.
     If restrict_number_length is specified, the read number string will be cut
     after restrict_number_length before removing leading zeroes (if any).'''
-    string_number = ''
-    for i in range(start_index, max_end_index+1):
-        if data[i] not in map(str, range(10)):
-            break
-        string_number += data[i]
-    end_index = start_index + len(string_number) - 1
+    string_number, end_index = scan_digits(data, start_index, max_end_index)
     if restrict_number_length != None and len(string_number) > restrict_number_length:
         print 'restricting "%s" to %d characters (is %d bytes long)' % (string_number, restrict_number_length, len(string_number))
         string_number = string_number[0:restrict_number_length]
@@ -147,20 +198,7 @@ def parse_number(data, start_index, max_end_index, restrict_number_length=None):
 def parse_string(data, start_index, max_end_index=None, stop_character='\x1c'):
     '''Reads all characters until the stop character (default '\x1c') is read 
     or max_end_index is reached.'''
-    read_string = ''
-    if max_end_index != None:
-        for i in range(start_index, max_end_index+1+1):
-            if data[i] == stop_character:
-                break
-            read_string += data[i]
-    else:
-        i = start_index
-        while i < len(data) and data[i] != stop_character:
-            read_string += data[i]
-            i += 1
-    assert_match(stop_character, data[i], data[i])
-    end_index = start_index + len(read_string) - 1 + 1
-    return (read_string, end_index)
+    return scan_string(data, start_index, max_end_index, stop_character)
 
 
 def parse_optional_string_field(data, first_character, start, max_characters):
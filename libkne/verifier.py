@@ -0,0 +1,237 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''Checks if a KNE data carrier is well formed without building the posting
+lines/master data lines. Every data file is scanned in a single pass (block
+by block) and all records are matched against the record specifications.
+The amounts of all posting lines are summed up (as integers) and compared
+with the client totals.'''
+
+import re
+
+from libkne.accountingline import posting_line_fields, posting_line_spec
+from libkne.custom_info_record import custom_info_record_spec
+from libkne.datablocks import StreamingDataBuffer
+from libkne.data_line import master_data_line_spec
+from libkne.datafile import DataFile, parse_errors
+from libkne.datev_encoding import decoding_map
+from libkne.knereader import get_data_file_name, parse_data_carrier_header, \
+    split_meta_info_for_data
+
+__all__ = ['DataFileReport', 'KneVerifier', 'VerificationReport', 'verify']
+
+undefined_characters_regex = re.compile('[%s]' % ''.join(
+    [re.escape(chr(i)) for i in range(256) if i not in decoding_map]))
+
+posting_line_regex = posting_line_spec.regex
+posting_text_position = \
+    [field.name for field in posting_line_fields].index('posting_text')
+
+
+def _describe_error(e):
+    return '%s: %s' % (e.__class__.__name__, e)
+
+
+class DataFileReport(object):
+    '''Result of the verification of a single data file. Amounts are given in
+    cents.'''
+    
+    def __init__(self, name):
+        self.name = name
+        self.contains_transaction_data = None
+        self.number_of_blocks = None
+        # number of posting lines or master data lines
+        self.number_of_lines = 0
+        self.number_of_custom_info_records = 0
+        self.amount_total = 0
+        # all client totals and subtotals in the order of the file
+        self.client_totals = []
+        self.errors = []
+    
+    
+    def is_valid(self):
+        return len(self.errors) == 0
+    
+    
+    def add_error(self, message, file_offset=None):
+        if file_offset != None:
+            message = 'offset %d: %s' % (file_offset, message)
+        self.errors.append(message)
+
+
+
+class VerificationReport(object):
+    '''Result of verify(): errors concerning the control file and a
+    DataFileReport for every data file.'''
+    
+    def __init__(self):
+        self.errors = []
+        self.files = []
+    
+    
+    def is_valid(self):
+        if len(self.errors) > 0:
+            return False
+        for file_report in self.files:
+            if not file_report.is_valid():
+                return False
+        return True
+    
+    
+    def get_errors(self):
+        'Return a list of all errors (prefixed with the data file name).'
+        errors = list(self.errors)
+        for file_report in self.files:
+            for error in file_report.errors:
+                errors.append('%s: %s' % (file_report.name, error))
+        return errors
+
+
+
+class KneVerifier(object):
+    '''Verifies a KNE data carrier, see verify(). The report is available
+    as self.report.'''
+    
+    def __init__(self, header_fp, data_fps):
+        self.report = VerificationReport()
+        try:
+            self.config, data_meta_information = \
+                parse_data_carrier_header(header_fp)
+            meta_info_list = split_meta_info_for_data(data_meta_information)
+        except parse_errors, e:
+            error = 'invalid control file (%s)' % _describe_error(e)
+            self.report.errors.append(error)
+            return
+        number_data_files = self.config['number_data_files']
+        if number_data_files != len(meta_info_list):
+            msg = 'control file describes %d data files but contains %d ' + \
+                  'control records'
+            self.report.errors.append(msg % (number_data_files,
+                                             len(meta_info_list)))
+        if len(meta_info_list) != len(data_fps):
+            msg = 'control file describes %d data files but got %d'
+            self.report.errors.append(msg % (len(meta_info_list),
+                                             len(data_fps)))
+        for i, (metainfo, data_fp) in enumerate(zip(meta_info_list, data_fps)):
+            file_report = DataFileReport(get_data_file_name(i))
+            self._verify_data_file(metainfo, data_fp, file_report)
+            self.report.files.append(file_report)
+    
+    
+    def _verify_data_file(self, binary_control_record, data_fp, report):
+        buf = None
+        payload_offset = None
+        try:
+            # the config must not be changed by the header of the data file
+            datafile = DataFile(dict(self.config))
+            datafile._read_control_record(binary_control_record)
+            metadata = datafile.get_metadata()
+            report.contains_transaction_data = \
+                datafile.contains_transaction_data()
+            report.number_of_blocks = metadata['number_data_blocks']
+            assert report.number_of_blocks > 0, 'no data blocks'
+            buf = StreamingDataBuffer(data_fp, report.number_of_blocks)
+            index = datafile._read_header(buf, metadata)
+            if report.contains_transaction_data:
+                scan = self._scan_transactions
+            else:
+                scan = self._scan_master_data
+            for payload_offset in scan(datafile, buf, index, report):
+                pass
+        except parse_errors, e:
+            file_offset = None
+            if payload_offset != None:
+                file_offset = buf.file_offset(payload_offset - buf.consumed)
+            report.add_error(_describe_error(e), file_offset)
+    
+    
+    def _check_text(self, text, field_name):
+        match = undefined_characters_regex.search(text)
+        if match != None:
+            msg = 'undefined character %s in %s'
+            raise ValueError(msg % (repr(match.group()), field_name))
+    
+    
+    def _compare_client_total(self, buf, index, report, running_total,
+                              section_total):
+        client_total = report.client_totals[-1]
+        if client_total not in (running_total, section_total):
+            msg = 'client total %d does not match the sum of the posting ' + \
+                  'lines (%d)'
+            report.add_error(msg % (client_total, running_total),
+                             buf.file_offset(index))
+    
+    
+    def _scan_transactions(self, datafile, buf, index, report):
+        '''Check all records after the version record. Yields the payload 
+        offset of every record so that errors can be located.'''
+        # A client total (and subtotals) may contain the sum of all posting
+        # lines before or of the posting lines since the last subtotal.
+        running_total = 0
+        section_total = 0
+        after_client_total = False
+        while True:
+            index = buf.fill(index)
+            yield buf.consumed + index
+            data = buf.data
+            record_type = data[index]
+            if record_type in ('x', 'w'):
+                client_total, next_index = \
+                    datafile._parse_client_total(data, index)
+                report.client_totals.append(client_total)
+                self._compare_client_total(buf, index, report, 
+                                           running_total, section_total)
+                section_total = 0
+                after_client_total = True
+                index = next_index
+                continue
+            if record_type == 'z' and after_client_total:
+                break
+            after_client_total = False
+            if record_type == '\xb7':
+                values, end_index = custom_info_record_spec.match(data, index)
+                report.number_of_custom_info_records += 1
+            else:
+                match = posting_line_regex.match(data, index)
+                if match == None:
+                    # raises a ValueError with a detailed error message
+                    posting_line_spec.match(data, index)
+                values = match.groups()
+                end_index = match.end() - 1
+                posting_text = values[posting_text_position]
+                if posting_text != None:
+                    self._check_text(posting_text, 'posting_text')
+                amount = int(values[0])
+                running_total += amount
+                section_total += amount
+                report.number_of_lines += 1
+            index = end_index + 1
+        report.amount_total = running_total
+        if len(report.client_totals) == 0:
+            report.add_error('no client total')
+        datafile._check_end_of_data(buf, index)
+    
+    
+    def _scan_master_data(self, datafile, buf, index, report):
+        while True:
+            index = buf.fill(index)
+            yield buf.consumed + index
+            data = buf.data
+            if data[index] == 'z':
+                break
+            values, end_index = master_data_line_spec.match(data, index)
+            self._check_text(values[1], 'text')
+            report.number_of_lines += 1
+            index = end_index + 1
+        datafile._check_end_of_data(buf, index)
+
+
+
+def verify(header_fp, data_fps):
+    '''Check that the KNE data carrier (control file and data files, see
+    KneReader) is well formed: fill bytes and number of blocks, feed line and
+    version record, syntax of all records and the client totals. Returns a
+    VerificationReport, parse errors are not raised but stored in the
+    report.'''
+    return KneVerifier(header_fp, data_fps).report
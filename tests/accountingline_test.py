@@ -3,7 +3,10 @@
 # See LICENSE.txt in the main project directory, for more information.
 # For the exact contribution history, see the git revision log.
 
+import copy
 from datetime import date
+from decimal import Decimal
+import pickle
 import unittest
 
 from libkne import AccountingLine
@@ -76,4 +79,91 @@ class TestPostingline(unittest.TestCase):
         parsed_line, end_index = \
             AccountingLine.from_binary(binary_line, 0, get_minimal_metadata())
         self.assertEqual(reserved_fields, parsed_line.reserved_fields)
-
+    
+    def test_parse_line_with_offset(self):
+        binary_line = '-11500a1000d510e8400\xb3EUR\x1cy'
+        binary_data = 'z' * 10 + binary_line + binary_line
+        
+        parsed_line, end_index = \
+            AccountingLine.from_binary(binary_data, 10, get_minimal_metadata())
+        self.assertEqual(10 + len(binary_line) - 1, end_index)
+        self.assertEqual(8400, parsed_line.account_number)
+        self.assertEqual('EUR', parsed_line.currency_code_transaction_volume)
+        
+        parsed_line, end_index = AccountingLine.from_binary(binary_data, 
+                                    end_index + 1, get_minimal_metadata())
+        self.assertEqual(len(binary_data) - 1, end_index)
+        self.assertEqual(1000, parsed_line.offsetting_account)
+    
+    def test_write_and_parse_all_fields(self):
+        line = build_minimal_postingline()
+        line.amendment_key = 2
+        line.tax_key = 9
+        line.record_field1 = 'Re526100910'
+        line.record_field2 = '150102'
+        line.cost_center1 = 'KOST1'
+        line.cash_discount = Decimal('2.30')
+        line.posting_text = u'Zahlung mit Fremdwährung'
+        line.currency_code_transaction_volume = 'USD'
+        line.base_currency_amount = Decimal('832.82')
+        line.base_currency = 'EUR'
+        line.exchange_rate = Decimal('1.200740')
+        line.reserved_fields = [None, 'abc', None, None, None, 123, None]
+        binary_line = line.to_binary()[0]
+        
+        parsed_line, end_index = \
+            AccountingLine.from_binary(binary_line, 0, get_minimal_metadata())
+        self.assertEqual(len(binary_line) - 1, end_index)
+        for attr_name in ['transaction_volume', 'amendment_key', 'tax_key', 
+                          'offsetting_account', 'record_field1', 
+                          'record_field2', 'date', 'account_number', 
+                          'cost_center1', 'cash_discount', 'posting_text', 
+                          'currency_code_transaction_volume', 
+                          'base_currency_amount', 'base_currency', 
+                          'exchange_rate', 'reserved_fields']:
+            self.assertEqual(getattr(line, attr_name), 
+                             getattr(parsed_line, attr_name), attr_name)
+    
+    def test_write_tax_key_without_amendment_key(self):
+        line = build_minimal_postingline()
+        line.tax_key = 9
+        binary_line = '-11500l09a1000d510e8400\xb3EUR\x1cy'
+        self.assertEqual([binary_line], line.to_binary())
+        parsed_line, end_index = \
+            AccountingLine.from_binary(binary_line, 0, get_minimal_metadata())
+        self.assertEqual(None, parsed_line.amendment_key)
+        self.assertEqual(9, parsed_line.tax_key)
+    
+    def test_parse_error_names_field(self):
+        binary_line = '-11500a1000\xbdRe.1\x1cd510e8400\xb3EUR\x1cy'
+        try:
+            AccountingLine.from_binary(binary_line, 0, get_minimal_metadata())
+            self.fail('ValueError expected')
+        except ValueError, e:
+            self.assertTrue('record_field1' in str(e), str(e))
+    
+    def test_unset_attributes_are_none(self):
+        line = AccountingLine({})
+        self.assertEqual(None, line.posting_text)
+        self.assertTrue(hasattr(line, 'posting_text'))
+        self.assertEqual([], line.reserved_fields)
+        self.assertRaises(AttributeError, getattr, line, 'no_such_attribute')
+        self.assertRaises(AttributeError, setattr, line, 'no_such_attribute', 1)
+    
+    def test_copy_and_pickle(self):
+        line = build_minimal_postingline()
+        line.posting_text = u'Foo'
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            for copied_line in [copy.copy(line), 
+                    pickle.loads(pickle.dumps(line, protocol))]:
+                self.assertEqual(line.to_binary(), copied_line.to_binary())
+                self.assertEqual(None, copied_line.cash_discount)
+    
+    def test_all_slots_are_set(self):
+        binary_line = build_minimal_postingline().to_binary()[0]
+        parsed_line = AccountingLine.from_binary(binary_line, 0, 
+                                                 get_minimal_metadata())[0]
+        for line in [AccountingLine({}), parsed_line]:
+            for name in AccountingLine.__slots__:
+                # raises an AttributeError for slots which were not set
+                object.__getattribute__(line, name)
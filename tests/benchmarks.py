@@ -0,0 +1,347 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+'''Benchmarks for the KNE parser/writer. They are not part of the regular test
+suite because they take some time, run them with
+
+    python -m tests.benchmarks [name of benchmark ...]
+'''
+
+from cStringIO import StringIO
+from datetime import date
+import codecs
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from libkne import AccountingLine, InternTable, KneFileReader, \
+    KneFileWriter, KneReader, KneWriter, PostingTable, datev_encoding, verify
+from libkne.model import BalanceParser
+from libkne.model import balanceparser
+from libkne.util import parse_number, parse_optional_number_field, \
+    parse_optional_string_field, parse_string
+
+
+__all__ = ['build_posting_line', 'run_benchmarks']
+
+
+def get_metadata():
+    return dict(stored_general_ledger_account_no_length=8,
+                date_start=date(2008, 1, 1), date_end=date(2008, 12, 31))
+
+
+def build_posting_line():
+    line = AccountingLine(get_metadata())
+    line.transaction_volume = -115
+    line.offsetting_account = 100010000
+    line.record_field1 = 'Re526100910'
+    line.record_field2 = '150102'
+    line.date = date(day=1, month=1, year=2008)
+    line.account_number = 84000000
+    line.posting_text = 'AR mit UST-Automatikkonto'
+    line.currency_code_transaction_volume = 'EUR'
+    return line
+
+
+def _time_per_call(function, repetitions):
+    start = time.time()
+    for i in xrange(repetitions):
+        function()
+    return (time.time() - start) / repetitions
+
+
+def _print_result(label, seconds_per_item, unit='line'):
+    print '%-45s %8.2f µs/%s' % (label, seconds_per_item * 1000000, unit)
+
+
+def benchmark_posting_line_offsets(sizes=(1000, 10000, 100000, 500000)):
+    '''Parse time per posting line must not depend on the size of the
+    data file (the parser must not copy the remaining data for every line).'''
+    metadata = get_metadata()
+    binary_line = build_posting_line().to_binary()[0]
+    for number_of_lines in sizes:
+        binary_data = binary_line * number_of_lines
+        start = time.time()
+        start_index = 0
+        while start_index < len(binary_data):
+            line, end_index = \
+                AccountingLine.from_binary(binary_data, start_index, metadata)
+            start_index = end_index + 1
+        duration = time.time() - start
+        label = 'AccountingLine.from_binary (%d lines)' % number_of_lines
+        _print_result(label, duration / number_of_lines)
+
+
+def benchmark_util_parsers(repetitions=100000):
+    'Micro benchmarks for the basic field parsers in libkne.util.'
+    data = 'a100010000\x1eAR mit UST-Automatikkonto\x1c\xb3EUR\x1cy'
+    parsers = [
+        ('parse_number', lambda: parse_number(data, 1, 9)),
+        ('parse_string', lambda: parse_string(data, 11, 40)),
+        ('parse_optional_string_field (present)',
+            lambda: parse_optional_string_field(data, '\x1e', 10, 30)),
+        ('parse_optional_string_field (missing)',
+            lambda: parse_optional_string_field(data, '\xb0', 0, 20)),
+        ('parse_optional_number_field (present)',
+            lambda: parse_optional_number_field(data, 'a', 0, 9)),
+        ('parse_optional_number_field (missing)',
+            lambda: parse_optional_number_field(data, 'g', 0, 12)),
+    ]
+    for label, parser in parsers:
+        _print_result(label, _time_per_call(parser, repetitions), unit='call')
+
+
+def benchmark_data_file_packing(sizes=(1000, 10000, 100000)):
+    '''Writing a data file must take linear time (the time per line must not
+    depend on the number of lines).'''
+    line = build_posting_line()
+    config = dict(advisor_number=1234567, advisor_name='Datev eG',
+                  client_number=42, name_abbreviation='fs',
+                  date_start=date(2008, 1, 1), date_end=date(2008, 12, 31))
+    for number_of_lines in sizes:
+        writer = KneWriter(config=dict(config), header_fp=StringIO(),
+                           data_fp_builder=lambda nr: StringIO())
+        writer.add_posting_lines([line] * number_of_lines)
+        start = time.time()
+        writer.finish()
+        duration = time.time() - start
+        label = 'DataFile.to_binary (%d lines)' % number_of_lines
+        _print_result(label, duration / number_of_lines)
+
+
+def benchmark_accounting_line_allocation(repetitions=100000):
+    'Cost of creating (empty or parsed) AccountingLine instances.'
+    metadata = get_metadata()
+    binary_line = build_posting_line().to_binary()[0]
+    _print_result('AccountingLine()', 
+                  _time_per_call(lambda: AccountingLine(metadata), repetitions))
+    parse = lambda: AccountingLine.from_binary(binary_line, 0, metadata)
+    _print_result('AccountingLine.from_binary', 
+                  _time_per_call(parse, repetitions))
+    line = parse()[0]
+    size = _get_size(line, set([id(metadata)]))
+    print '%-45s %8.1f bytes/line' % ('parsed AccountingLine', size)
+
+
+def _get_size(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _get_size(key, seen) + _get_size(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += _get_size(item, seen)
+    elif hasattr(obj, '__dict__'):
+        size += _get_size(obj.__dict__, seen)
+    elif hasattr(obj, '__slots__'):
+        for name in obj.__slots__:
+            if hasattr(obj, name):
+                size += _get_size(getattr(obj, name), seen)
+    return size
+
+
+def benchmark_interning(number_of_lines=10000):
+    '''Parse time and memory of posting lines with and without sharing equal
+    values (InternTable).'''
+    metadata = get_metadata()
+    binary_line = build_posting_line().to_binary()[0]
+    for label, intern_table in [('without InternTable', None), 
+                                ('with InternTable', InternTable())]:
+        lines = []
+        start = time.time()
+        for i in xrange(number_of_lines):
+            line, end_index = AccountingLine.from_binary(binary_line, 0, 
+                                                         metadata, intern_table)
+            lines.append(line)
+        duration = time.time() - start
+        _print_result('AccountingLine.from_binary (%s)' % label, 
+                      duration / number_of_lines)
+        size = _get_size(lines, set([id(metadata)]))
+        print '%-45s %8.1f bytes/line' % ('list of AccountingLines (%s)' % label, 
+                                          float(size) / number_of_lines)
+
+
+def benchmark_posting_table_memory(number_of_lines=10000):
+    '''Memory used by a list of parsed AccountingLines compared to a
+    PostingTable with the same lines.'''
+    metadata = get_metadata()
+    binary_line = build_posting_line().to_binary()[0]
+    lines = []
+    for i in xrange(number_of_lines):
+        line, end_index = AccountingLine.from_binary(binary_line, 0, metadata)
+        lines.append(line)
+    table = PostingTable(metadata)
+    table.extend(lines)
+    # the metadata is shared by all lines
+    seen = set([id(metadata)])
+    list_size = _get_size(lines, seen)
+    table_size = _get_size(table, set([id(metadata)]))
+    for label, size in [('list of AccountingLines', list_size),
+                        ('PostingTable', table_size)]:
+        print '%-45s %8.1f bytes/line' % (label, float(size) / number_of_lines)
+
+
+def benchmark_datev_encoding(repetitions=100000):
+    '''Decoding/encoding posting texts with the dict based charmap (old 
+    codec), the registered codec and the module level helpers.'''
+    binary_text = 'AR mit UST-Automatikkonto f\x81r \x99l'
+    text = binary_text.decode('datev_ascii')
+    decoding_map = datev_encoding.decoding_map
+    encoding_map = datev_encoding.encoding_map
+    coders = [
+        ('decode (dict charmap)', 
+            lambda: codecs.charmap_decode(binary_text, 'strict', decoding_map)),
+        ('decode (registered codec)', lambda: binary_text.decode('datev_ascii')),
+        ('datev_encoding.decode', lambda: datev_encoding.decode(binary_text)),
+        ('encode (dict charmap)', 
+            lambda: codecs.charmap_encode(text, 'strict', encoding_map)),
+        ('encode (registered codec)', lambda: text.encode('datev_ascii')),
+        ('datev_encoding.encode', lambda: datev_encoding.encode(text)),
+    ]
+    for label, coder in coders:
+        _print_result(label, _time_per_call(coder, repetitions), unit='call')
+    binary_texts = [binary_text] * repetitions
+    start = time.time()
+    datev_encoding.decode_many(binary_texts)
+    _print_result('datev_encoding.decode_many', 
+                  (time.time() - start) / repetitions, unit='call')
+
+
+def benchmark_verify(number_of_lines=50000):
+    'Verifying a data carrier compared to reading it completely.'
+    config = dict(advisor_number=1234567, advisor_name='Datev eG',
+                  client_number=42, name_abbreviation='fs',
+                  date_start=date(2008, 1, 1), date_end=date(2008, 12, 31))
+    header_fp = StringIO()
+    data_fps = []
+    def data_fp_builder(number):
+        data_fps.append(StringIO())
+        return data_fps[-1]
+    writer = KneWriter(config=config, header_fp=header_fp, 
+                       data_fp_builder=data_fp_builder)
+    writer.add_posting_lines([build_posting_line()] * number_of_lines)
+    writer.finish()
+    header = header_fp.getvalue()
+    data = [data_fp.getvalue() for data_fp in data_fps]
+    for label, function in [('verify', verify), ('KneReader', KneReader)]:
+        start = time.time()
+        function(StringIO(header), [StringIO(item) for item in data])
+        _print_result(label, (time.time() - start) / number_of_lines)
+
+
+def benchmark_amounts(number_of_lines=20000):
+    '''Reading, summing and writing posting lines with Decimal amounts 
+    compared to ints of cents (amounts='cents').'''
+    metadata = get_metadata()
+    line = build_posting_line()
+    config = dict(advisor_number=1234567, advisor_name='Datev eG',
+                  client_number=42, name_abbreviation='fs',
+                  date_start=date(2008, 1, 1), date_end=date(2008, 12, 31))
+    for amounts in ['decimal', 'cents']:
+        binary_line = line.to_binary()[0]
+        start = time.time()
+        lines = []
+        for i in xrange(number_of_lines):
+            lines.append(AccountingLine.from_binary(binary_line, 0, metadata,
+                                                    amounts=amounts)[0])
+        _print_result('AccountingLine.from_binary (%s)' % amounts, 
+                      (time.time() - start) / number_of_lines)
+        start = time.time()
+        total = 0
+        for parsed_line in lines:
+            total += parsed_line.transaction_volume
+        _print_result('sum of transaction volumes (%s)' % amounts, 
+                      (time.time() - start) / number_of_lines)
+        writer = KneWriter(config=dict(config), header_fp=StringIO(),
+                           data_fp_builder=lambda nr: StringIO(), 
+                           amounts=amounts)
+        writer.add_posting_lines(lines)
+        start = time.time()
+        writer.finish()
+        _print_result('KneWriter.finish (%s)' % amounts,
+                      (time.time() - start) / number_of_lines)
+
+
+def benchmark_periodic_balances(number_of_lines=100000):
+    '''Monthly balances of a columnar reader with the pure Python 
+    implementation and with numpy (if installed).'''
+    config = dict(advisor_number=1234567, advisor_name='Datev eG',
+                  client_number=42, name_abbreviation='fs',
+                  date_start=date(2008, 1, 1), date_end=date(2008, 12, 31))
+    header_fp = StringIO()
+    data_fps = []
+    def data_fp_builder(number):
+        data_fps.append(StringIO())
+        return data_fps[-1]
+    writer = KneWriter(config=config, header_fp=header_fp, 
+                       data_fp_builder=data_fp_builder)
+    for i in xrange(number_of_lines):
+        line = build_posting_line()
+        line.date = date(2008, i % 12 + 1, i % 28 + 1)
+        line.account_number = 84000000 + (i % 50) * 10000
+        writer.add_posting_line(line)
+    writer.finish()
+    reader = KneReader(StringIO(header_fp.getvalue()), 
+                       [StringIO(data_fp.getvalue()) for data_fp in data_fps],
+                       columnar=True)
+    parser = BalanceParser(reader)
+    implementations = [('pure Python', False)]
+    if balanceparser.numpy != None:
+        implementations.append(('numpy', True))
+    for label, use_numpy in implementations:
+        start = time.time()
+        parser.periodic_balances('month', use_numpy=use_numpy)
+        _print_result('periodic_balances (%s)' % label, 
+                      (time.time() - start) / number_of_lines)
+
+
+def benchmark_parse_cache(number_of_lines=50000):
+    '''Reading a KNE set from the files compared to loading it from a
+    ParseCache entry (columnar and as AccountingLines).'''
+    config = dict(advisor_number=1234567, advisor_name='Datev eG',
+                  client_number=42, name_abbreviation='fs',
+                  date_start=date(2008, 1, 1), date_end=date(2008, 12, 31))
+    data_dir = tempfile.mkdtemp()
+    cache_dir = os.path.join(data_dir, 'cache')
+    try:
+        writer = KneFileWriter(config=config, dir=data_dir)
+        for i in xrange(number_of_lines):
+            line = build_posting_line()
+            line.record_field1 = 'Re%d' % i
+            writer.add_posting_line(line)
+        writer.finish()
+        writer.header_fp.close()
+        for label, kwargs in [('no cache', {}), 
+                              ('cache miss', dict(cache_dir=cache_dir)),
+                              ('cache hit', dict(cache_dir=cache_dir)),
+                              ('cache hit, columnar', 
+                               dict(cache_dir=cache_dir, columnar=True))]:
+            start = time.time()
+            KneFileReader.read_directory(data_dir, **kwargs)
+            _print_result('KneFileReader (%s)' % label, 
+                          (time.time() - start) / number_of_lines)
+        for name in os.listdir(cache_dir):
+            size = os.path.getsize(os.path.join(cache_dir, name))
+            print '%-45s %8.1f bytes/line' % ('cache entry', 
+                                              float(size) / number_of_lines)
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def run_benchmarks(names=None):
+    module = sys.modules[__name__]
+    if not names:
+        names = sorted([name[len('benchmark_'):] for name in dir(module)
+                        if name.startswith('benchmark_')])
+    for name in names:
+        getattr(module, 'benchmark_' + name)()
+
+
+if __name__ == '__main__':
+    run_benchmarks(sys.argv[1:])
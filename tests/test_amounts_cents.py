@@ -0,0 +1,130 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+from cStringIO import StringIO
+from decimal import Decimal
+import unittest
+
+from libkne import KneFileReader, KneReader, verify
+from libkne.model import BalanceParser
+from libkne.util import AMOUNTS_CENTS, cents_to_decimal, decimal_to_cents
+
+from tests.test_knereader_lazy import posting_line_values
+from tests.test_knewriter import _build_kne_writer, _build_posting_line
+from tests.test_util import get_data_files
+
+
+class TestCentsMode(unittest.TestCase):
+    
+    def _read(self, datadir='datev_self', number_data_files=4, **kwargs):
+        header, data_files = get_data_files(datadir, number_data_files)
+        return KneFileReader(header, data_files, **kwargs)
+    
+    
+    def _assert_same_lines(self, reader, cents_reader):
+        lines = list(reader.iter_posting_lines())
+        cents_lines = list(cents_reader.iter_posting_lines())
+        self.assertNotEqual(0, len(lines))
+        self.assertEqual(len(lines), len(cents_lines))
+        for line, cents_line in zip(lines, cents_lines):
+            self.assertTrue(isinstance(cents_line.transaction_volume,
+                                       (int, long)))
+            self.assertEqual(line.transaction_volume,
+                             cents_to_decimal(cents_line.transaction_volume))
+            for name in ['transaction_volume', 'cash_discount', 
+                         'base_currency_amount']:
+                value = cents_to_decimal(getattr(cents_line, name))
+                setattr(cents_line, name, value)
+            self.assertEqual(posting_line_values(line),
+                             posting_line_values(cents_line))
+    
+    
+    def test_read_amounts_as_cents(self):
+        reader = self._read()
+        self._assert_same_lines(reader, self._read(amounts='cents'))
+        self._assert_same_lines(reader, self._read(amounts='cents',
+                                                   columnar=True))
+        self._assert_same_lines(reader, self._read(amounts='cents', lazy=True))
+        self._assert_same_lines(reader, self._read(amounts='cents',
+                                                   workers=2))
+    
+    
+    def test_unknown_amounts_are_rejected(self):
+        self.assertRaises(ValueError, self._read, amounts='float')
+    
+    
+    def test_offset_index_sums_do_not_depend_on_amounts(self):
+        # KneFileReader would store the index files next to the test data
+        header, data_files = get_data_files('datev_self', 4)
+        def read(**kwargs):
+            data_fps = [file(filename, 'rb') for filename in data_files]
+            return KneReader(file(header, 'rb'), data_fps, **kwargs)
+        reader = read(offset_index=True)
+        cents_reader = read(offset_index=True, amounts='cents')
+        list(reader.iter_posting_lines())
+        list(cents_reader.iter_posting_lines())
+        self.assertEqual(reader.get_file(0).offset_index.amount_sums,
+                         cents_reader.get_file(0).offset_index.amount_sums)
+    
+    
+    def _write(self, lines, **kwargs):
+        header_fp = StringIO()
+        writer, data_fps = _build_kne_writer(header_fp=header_fp, **kwargs)
+        writer.add_posting_lines(lines)
+        writer.finish()
+        return (header_fp.getvalue(),
+                [data_fp.getvalue() for data_fp in data_fps])
+    
+    
+    def test_write_amounts_as_cents(self):
+        lines = [_build_posting_line(transaction_volume=Decimal('-1.15'),
+                                     cash_discount=Decimal('0.03')),
+                 _build_posting_line(transaction_volume=Decimal('250.10'))]
+        expected = self._write(lines, streaming=False)
+        for line in lines:
+            line.transaction_volume = decimal_to_cents(line.transaction_volume)
+            line.cash_discount = decimal_to_cents(line.cash_discount)
+        for streaming in [False, True]:
+            header, data = self._write(lines, streaming=streaming,
+                                       amounts=AMOUNTS_CENTS)
+            self.assertEqual(expected, (header, data))
+        report = verify(StringIO(header), map(StringIO, data))
+        self.assertEqual([], report.get_errors())
+        self.assertEqual([24895], report.files[0].client_totals)
+    
+    
+    def test_writer_rejects_decimals_in_cents_mode(self):
+        line = _build_posting_line(transaction_volume=Decimal('-1.15'))
+        self.assertRaises(ValueError, self._write, [line],
+                          amounts=AMOUNTS_CENTS)
+    
+    
+    def test_roundtrip_in_cents_mode(self):
+        line = _build_posting_line(transaction_volume=-115)
+        header, data = self._write([line], amounts=AMOUNTS_CENTS)
+        reader = KneReader(StringIO(header), map(StringIO, data),
+                           amounts='cents')
+        read_line = reader.get_file(0).get_posting_lines()[0]
+        self.assertEqual(-115, read_line.transaction_volume)
+    
+    
+    def test_balances_in_cents(self):
+        reader = self._read()
+        cents_reader = self._read(amounts='cents')
+        balances = BalanceParser(reader).balances()
+        for parser in [BalanceParser(cents_reader),
+                       BalanceParser(reader, amounts='cents')]:
+            self.assertEqual(AMOUNTS_CENTS, parser.amounts)
+            cents_balances = parser.balances()
+            self.assertEqual([account.number for account in balances],
+                             [account.number for account in cents_balances])
+            self.assertEqual(
+                [account.balance for account in balances],
+                [cents_to_decimal(account.balance)
+                 for account in cents_balances])
+        decimal_balances = BalanceParser(cents_reader,
+                                         amounts='decimal').balances()
+        self.assertEqual([account.balance for account in balances],
+                         [account.balance for account in decimal_balances])
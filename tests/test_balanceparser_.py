@@ -3,8 +3,21 @@
 # See LICENSE.txt in the main project directory, for more information.
 # For the exact contribution history, see the git revision log.
 
+from cStringIO import StringIO
+from datetime import date
+from decimal import Decimal
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from libkne import KneFileReader, KneReader
 from libkne.model import BalanceParser
+from libkne.model import balanceparser
 
+from tests.test_knereader_parallel import get_testdata_dir
+from tests.test_knewriter import _build_kne_writer, _build_posting_line
 from tests.test_util import SampleDataReaderCase
 
 
@@ -26,3 +39,155 @@ class TestBalanceParserLxOffice(SampleDataReaderCase):
         self.assertEqual(1400, account1400.number)
         self.assertEqual(-1250, account1400.balance)
 
+
+
+class TestPeriodicBalances(unittest.TestCase):
+    
+    def _build_reader(self, **kwargs):
+        postings = [(date(2008, 1, 5), Decimal('100.50'), 1000, 8400),
+                    (date(2008, 1, 31), Decimal('-20.25'), 1000, 8400),
+                    (date(2008, 2, 1), Decimal('10'), 1200, 1000),
+                    (date(2008, 4, 1), Decimal('7.77'), 1000, 1200),
+                    (date(2008, 12, 31), Decimal('1'), 8400, 1200)]
+        header_fp = StringIO()
+        writer, data_fps = _build_kne_writer(header_fp=header_fp)
+        for day, amount, account_number, offsetting_account in postings:
+            line = _build_posting_line(date=day, transaction_volume=amount,
+                                       account_number=account_number,
+                                       offsetting_account=offsetting_account)
+            writer.add_posting_line(line)
+        writer.finish()
+        header_fp.seek(0)
+        for data_fp in data_fps:
+            data_fp.seek(0)
+        return KneReader(header_fp, data_fps, **kwargs)
+    
+    
+    def _get_totals(self, parser, freq, use_numpy=False):
+        return [(b.number, b.period_start, b.debit, b.credit, b.balance)
+                for b in parser.periodic_balances(freq, use_numpy=use_numpy)]
+    
+    
+    def test_monthly_balances(self):
+        parser = BalanceParser(self._build_reader())
+        self.assertEqual([
+            (1000, date(2008, 1, 1), Decimal('100.50'), Decimal('20.25'), 
+             Decimal('80.25')),
+            (1000, date(2008, 2, 1), 0, Decimal('10'), Decimal('-10')),
+            (1000, date(2008, 4, 1), Decimal('7.77'), 0, Decimal('7.77')),
+            (1200, date(2008, 2, 1), Decimal('10'), 0, Decimal('10')),
+            (1200, date(2008, 4, 1), 0, Decimal('7.77'), Decimal('-7.77')),
+            (1200, date(2008, 12, 1), 0, Decimal('1'), Decimal('-1')),
+            (8400, date(2008, 1, 1), Decimal('20.25'), Decimal('100.50'), 
+             Decimal('-80.25')),
+            (8400, date(2008, 12, 1), Decimal('1'), 0, Decimal('1')),
+            ], self._get_totals(parser, 'month'))
+    
+    
+    def test_periods(self):
+        parser = BalanceParser(self._build_reader(amounts='cents'))
+        self.assertEqual([
+            (1000, date(2008, 1, 1), 10050, 3025, 7025),
+            (1000, date(2008, 4, 1), 777, 0, 777),
+            (1200, date(2008, 1, 1), 1000, 0, 1000),
+            (1200, date(2008, 4, 1), 0, 777, -777),
+            (1200, date(2008, 10, 1), 0, 100, -100),
+            (8400, date(2008, 1, 1), 2025, 10050, -8025),
+            (8400, date(2008, 10, 1), 100, 0, 100),
+            ], self._get_totals(parser, 'quarter'))
+        
+        yearly_balances = parser.periodic_balances('year', use_numpy=False)
+        self.assertEqual([(account.number, account.balance) 
+                          for account in parser.balances()],
+                         [(b.number, b.balance) for b in yearly_balances])
+        
+        boundaries = [date(2008, 2, 1), date(2008, 1, 1)]
+        self.assertEqual([
+            (1000, date(2008, 1, 1), 10050, 2025, 8025),
+            (1000, date(2008, 2, 1), 777, 1000, -223),
+            (1200, date(2008, 2, 1), 1000, 877, 123),
+            (8400, date(2008, 1, 1), 2025, 10050, -8025),
+            (8400, date(2008, 2, 1), 100, 0, 100),
+            ], self._get_totals(parser, boundaries))
+        self.assertRaises(ValueError, parser.periodic_balances, 
+                          [date(2008, 2, 1)], use_numpy=False)
+        self.assertRaises(ValueError, parser.periodic_balances, 'week')
+    
+    
+    def test_columnar_reader(self):
+        parser = BalanceParser(self._build_reader())
+        columnar_parser = BalanceParser(self._build_reader(columnar=True))
+        self.assertEqual(self._get_totals(parser, 'month'),
+                         self._get_totals(columnar_parser, 'month'))
+    
+    
+    @unittest.skipIf(balanceparser.numpy == None, 'numpy not installed')
+    def test_numpy_returns_same_balances(self):
+        for kwargs in [{}, dict(columnar=True), dict(amounts='cents')]:
+            parser = BalanceParser(self._build_reader(**kwargs))
+            for freq in ['month', 'quarter', 'year', [date(2008, 1, 1), 
+                                                      date(2008, 3, 15)]]:
+                self.assertEqual(self._get_totals(parser, freq),
+                                 self._get_totals(parser, freq, True))
+
+
+
+class TestBalancesFromArchives(unittest.TestCase):
+    
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+    
+    
+    def _build_zip(self, datadir):
+        directory = get_testdata_dir(datadir)
+        filename = os.path.join(self.tempdir, datadir + '.zip')
+        archive = zipfile.ZipFile(filename, 'w')
+        for name in os.listdir(directory):
+            archive.write(os.path.join(directory, name), name)
+        archive.close()
+        return filename
+    
+    
+    def _get_balances(self, accounts):
+        return [(account.number, account.balance) for account in accounts]
+    
+    
+    def _get_expected_balances(self, datadirs):
+        balances = {}
+        for datadir in datadirs:
+            reader = KneFileReader.read_directory(get_testdata_dir(datadir))
+            for account in BalanceParser(reader).balances():
+                balances[account.number] = \
+                    balances.get(account.number, 0) + account.balance
+        return sorted(balances.items())
+    
+    
+    def test_merge_balances_of_all_archives(self):
+        datadirs = ['datev_self', 'lxoffice_transactions', 'tz_easybuch']
+        paths = [self._build_zip(datadir) for datadir in datadirs[:2]]
+        paths.append(get_testdata_dir(datadirs[2]))
+        expected = self._get_expected_balances(datadirs)
+        for workers in [None, 2]:
+            accounts = BalanceParser.from_archives(paths, workers=workers)
+            self.assertEqual(expected, self._get_balances(accounts))
+            self.assertTrue(isinstance(accounts[0].balance, Decimal))
+        accounts = BalanceParser.from_archives(paths, amounts='cents')
+        self.assertEqual([(number, int(balance * 100)) 
+                          for number, balance in expected], 
+                         self._get_balances(accounts))
+    
+    
+    def test_errors_name_the_archive(self):
+        path = os.path.join(self.tempdir, 'empty.zip')
+        zipfile.ZipFile(path, 'w').close()
+        paths = [self._build_zip('datev_self'), path]
+        for workers in [None, 2]:
+            try:
+                BalanceParser.from_archives(paths, workers=workers)
+                self.fail('ValueError expected')
+            except ValueError, e:
+                self.assertTrue('empty.zip' in str(e))
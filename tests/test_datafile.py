@@ -0,0 +1,105 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+from datetime import date
+import StringIO
+import unittest
+
+from libkne import KneFileReader, KneWriter
+from libkne.datafile import DataFile
+
+from tests.test_util import get_data_files
+
+
+class TestRemoveFillBytes(unittest.TestCase):
+    
+    def setUp(self):
+        self.datafile = DataFile({})
+    
+    
+    def _block(self, payload):
+        return payload + '\x00' * (256 - len(payload))
+    
+    
+    def test_remove_fill_bytes(self):
+        binary_data = self._block('a' * 250) + self._block('b' * 10)
+        payload = self.datafile._remove_fill_bytes(binary_data, 2)
+        self.assertEqual('a' * 250 + 'b' * 10, payload)
+    
+    
+    def test_missing_fill_bytes_are_reported_with_block_number(self):
+        binary_data = self._block('a' * 250) + ('b' * 256)
+        try:
+            self.datafile._remove_fill_bytes(binary_data, 2)
+            self.fail('ValueError expected')
+        except ValueError, e:
+            self.assertTrue('block 2' in str(e), str(e))
+
+
+
+def pack_blocks_quadratic(header, binary_lines, end_of_data):
+    '''Reference implementation: the (quadratic) block packing algorithm
+    which was used before DataFile.finish() switched to a BlockWriter.'''
+    binary_info = header
+    for binary_line in binary_lines:
+        number_fill_bytes = 6
+        blocks_used = len(binary_info) / 256 + 1
+        end_block_index = blocks_used * 256
+        free_bytes_in_block = end_block_index - number_fill_bytes \
+                                  - len(binary_info)
+        if free_bytes_in_block < len(binary_line):
+            binary_line = binary_line[:free_bytes_in_block] + \
+                          ('\x00' * number_fill_bytes) + \
+                          binary_line[free_bytes_in_block:]
+        binary_info += binary_line
+    binary_info += end_of_data
+    binary_info += '\x00' * (256 - (len(binary_info) % 256))
+    return binary_info
+
+
+class TestBlockPacking(unittest.TestCase):
+    
+    def _build_writer(self):
+        config = {'advisor_number': 1234567, 'advisor_name': 'Datev eG',
+                  'client_number': 42, 'name_abbreviation': 'fs',
+                  'date_start': date(2004, 2, 4), 'date_end': date(2004, 2, 29)}
+        data_fp_builder = lambda nr: StringIO.StringIO()
+        return KneWriter(config=config, header_fp=StringIO.StringIO(),
+                         data_fp_builder=data_fp_builder)
+    
+    
+    def _assert_same_packing(self, datadir, number_data_files=1):
+        reader = KneFileReader(*get_data_files(datadir, number_data_files))
+        writer = self._build_writer()
+        for i in range(reader.get_number_of_files()):
+            datafile = reader.get_file(i)
+            if datafile.contains_transaction_data():
+                writer.add_posting_lines(datafile.get_posting_lines())
+            else:
+                writer.add_masterdata_lines(datafile.get_master_data_lines())
+        manager = writer.transaction_manager
+        data_files = manager.transaction_files + manager.masterdata_files
+        self.assertNotEqual(0, len(data_files))
+        for datafile in data_files:
+            binary_lines = []
+            for line in datafile.lines:
+                binary_lines.extend(line.to_binary())
+            binary_data = datafile.to_binary()
+            header = datafile._get_feed_line() + datafile._get_version_record()
+            expected_binary_data = pack_blocks_quadratic(header, binary_lines, 
+                                       datafile._get_end_of_data())
+            self.assertEqual(expected_binary_data, binary_data)
+            self.assertEqual(len(binary_data) / 256, datafile.number_of_blocks)
+    
+    
+    def test_packing_is_identical_to_previous_implementation(self):
+        self._assert_same_packing('datev_self', 4)
+        self._assert_same_packing('lxoffice_transactions')
+        self._assert_same_packing('mms_bilanz_addresses')
+        self._assert_same_packing('mms_kassenbuch_account_labels')
+        self._assert_same_packing('mms_kassenbuch_transactions')
+        self._assert_same_packing('monkey_kassenbuch_account_labels')
+        self._assert_same_packing('monkey_kassenbuch_transactions')
+        self._assert_same_packing('tz_easybuch')
@@ -0,0 +1,45 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import codecs
+import unittest
+
+from libkne import datev_encoding
+
+
+class TestDatevEncoding(unittest.TestCase):
+    
+    def test_decoding_table_matches_decoding_map(self):
+        for byte in range(256):
+            char = chr(byte)
+            if byte in datev_encoding.decoding_map:
+                expected = unichr(datev_encoding.decoding_map[byte])
+                self.assertEqual(expected, datev_encoding.decode(char))
+                self.assertEqual(expected, char.decode('datev_ascii'))
+                self.assertEqual(char, datev_encoding.encode(expected))
+                self.assertEqual(char, expected.encode('datev_ascii'))
+            else:
+                self.assertRaises(UnicodeDecodeError, datev_encoding.decode, 
+                                  char)
+                self.assertRaises(UnicodeDecodeError, char.decode, 
+                                  'datev_ascii')
+    
+    
+    def test_special_characters(self):
+        binary = 'Stra\xe1e \x15 12, \xfe 5 f\x81r \x99l'
+        text = u'Straße § 12, € 5 für Öl'
+        self.assertEqual(text, datev_encoding.decode(binary))
+        self.assertEqual(binary, datev_encoding.encode(text))
+        self.assertRaises(UnicodeEncodeError, datev_encoding.encode, u'~')
+        self.assertRaises(UnicodeEncodeError, datev_encoding.encode, u'é')
+    
+    
+    def test_batch_encoding(self):
+        values = ['Kasse', 'M\x81ller', '']
+        texts = datev_encoding.decode_many(values)
+        self.assertEqual([u'Kasse', u'Müller', u''], texts)
+        self.assertEqual(values, datev_encoding.encode_many(texts))
+        self.assertRaises(UnicodeDecodeError, datev_encoding.decode_many, 
+                          ['ok', '\x00'])
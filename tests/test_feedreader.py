@@ -0,0 +1,145 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import StringIO
+import unittest
+
+from libkne import KneFeedReader, KneFileReader
+from libkne.datablocks import BLOCK_SIZE, PushDataBuffer, strip_fill_bytes
+
+from tests.test_knereader_lazy import master_data_line_values, \
+    posting_line_values
+from tests.test_util import get_data_files
+
+
+def _read_file(filename):
+    fp = file(filename, 'rb')
+    try:
+        return fp.read()
+    finally:
+        fp.close()
+
+
+class TestKneFeedReader(unittest.TestCase):
+    
+    def _build_reader(self, datadir, number_data_files):
+        header, data_files = get_data_files(datadir, number_data_files)
+        header_fp = StringIO.StringIO(_read_file(header))
+        return KneFeedReader(header_fp), map(_read_file, data_files)
+    
+    
+    def _feed(self, reader, index, data, chunk_size):
+        lines = []
+        for offset in range(0, len(data), chunk_size):
+            lines.extend(reader.feed(index, data[offset:offset+chunk_size]))
+        reader.close(index)
+        return lines
+    
+    
+    def _assert_same_lines(self, datadir, number_data_files=1, 
+                           chunk_sizes=(1, 100, 256, 1000, 1000000)):
+        header, data_files = get_data_files(datadir, number_data_files)
+        expected_reader = KneFileReader(header, data_files)
+        for chunk_size in chunk_sizes:
+            reader, data = self._build_reader(datadir, number_data_files)
+            for i, datafile in enumerate(expected_reader.files):
+                lines = self._feed(reader, i, data[i], chunk_size)
+                if datafile.contains_transaction_data():
+                    expected = datafile.get_posting_lines()
+                    values = posting_line_values
+                else:
+                    expected = datafile.get_master_data_lines()
+                    values = master_data_line_values
+                self.assertEqual(map(values, expected), map(values, lines))
+                self.assertEqual(datafile.get_metadata(), 
+                                 reader.get_file(i).get_metadata())
+            self.assertEqual(expected_reader.get_config(), reader.get_config())
+    
+    
+    def test_incremental_parsing_returns_same_lines(self):
+        self._assert_same_lines('datev_self', 4)
+        self._assert_same_lines('mms_kassenbuch_transactions')
+        self._assert_same_lines('tz_easybuch')
+    
+    
+    def test_lines_are_returned_as_soon_as_possible(self):
+        reader, data = self._build_reader('tz_easybuch', 1)
+        self.assertEqual([], reader.feed(0, data[0][:256]))
+        self.assertEqual(False, reader.get_parser(0).is_finished())
+        lines = reader.feed(0, data[0][256:1024])
+        number_of_lines = len(lines)
+        self.assertTrue(number_of_lines > 0)
+        lines += reader.feed(0, data[0][1024:])
+        self.assertTrue(len(lines) > number_of_lines)
+        self.assertEqual(True, reader.get_parser(0).is_finished())
+    
+    
+    def test_incomplete_data_is_rejected(self):
+        reader, data = self._build_reader('mms_kassenbuch_transactions', 1)
+        reader.feed(0, data[0][:-1])
+        self.assertRaises(ValueError, reader.close)
+        reader.feed(0, data[0][-1])
+        reader.close()
+        self.assertRaises(ValueError, reader.feed, 0, '\x00')
+    
+    
+    def test_data_after_last_block_is_rejected(self):
+        reader, data = self._build_reader('tz_easybuch', 1)
+        self.assertRaises(ValueError, reader.feed, 0, data[0] + '\x00' * 256)
+    
+    
+    def test_number_of_parsed_records_can_be_limited(self):
+        header, data_files = get_data_files('tz_easybuch', 1)
+        expected = KneFileReader(header, data_files).get_file(0)
+        reader, data = self._build_reader('tz_easybuch', 1)
+        parser = reader.get_parser(0)
+        lines = reader.feed(0, data[0], max_records=3)
+        self.assertTrue(len(lines) <= 3)
+        self.assertEqual(True, parser.has_available_records())
+        while parser.has_available_records():
+            new_lines = reader.parse(0, max_records=3)
+            self.assertTrue(len(new_lines) <= 3)
+            lines += new_lines
+        self.assertEqual(True, parser.is_finished())
+        self.assertEqual([], reader.close(0))
+        self.assertEqual(map(posting_line_values, expected.get_posting_lines()),
+                         map(posting_line_values, lines))
+    
+    
+    def test_data_files_only_provide_the_metadata(self):
+        reader, data = self._build_reader('datev_self', 4)
+        self.assertEqual(4, reader.get_number_of_files())
+        for i in range(reader.get_number_of_files()):
+            self._feed(reader, i, data[i], 1000)
+            self.assertEqual(None, reader.get_file(i).lines)
+        self.assertEqual([[], [], [], []], reader.close())
+    
+    
+    def test_close_returns_lines_which_were_not_parsed(self):
+        reader, data = self._build_reader('tz_easybuch', 1)
+        lines = reader.feed(0, data[0], max_records=1)
+        self.assertEqual(False, reader.get_parser(0).is_finished())
+        remaining_lines = reader.close()
+        self.assertEqual(1, len(remaining_lines))
+        self.assertTrue(len(remaining_lines[0]) > 0)
+    
+    
+    def test_only_a_window_of_large_chunks_is_kept(self):
+        header, data_files = get_data_files('tz_easybuch', 1)
+        data = _read_file(data_files[0])
+        number_data_blocks = len(data) / BLOCK_SIZE
+        payload = ''.join([strip_fill_bytes(data[i:i+BLOCK_SIZE], 1) 
+                           for i in range(0, len(data), BLOCK_SIZE)])
+        buf = PushDataBuffer(number_data_blocks, compact_threshold=BLOCK_SIZE)
+        buf.feed(data)
+        self.assertEqual('', buf.data)
+        index, parsed_payload = 0, []
+        while not buf.is_exhausted(index):
+            index = buf.fill(index)
+            self.assertTrue(len(buf.data) < 
+                            2 * buf.compact_threshold + buf.lookahead)
+            parsed_payload.append(buf.data[index])
+            index += 1
+        self.assertEqual(payload, ''.join(parsed_payload))
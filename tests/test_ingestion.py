@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import os
+import unittest
+
+import libkne
+from libkne import KneReader
+from libkne.ingestion import find_kne_sets
+
+
+testdata_dir = os.path.join(os.path.dirname(__file__), 'testdata')
+
+
+class TestIngestion(unittest.TestCase):
+    
+    def test_find_kne_sets_recursively(self):
+        kne_sets = list(find_kne_sets(os.path.dirname(__file__)))
+        directories = [os.path.basename(kne_set[0]) for kne_set in kne_sets]
+        self.assertEqual(sorted(os.listdir(testdata_dir)), directories)
+        directory, header_filename, data_filenames = kne_sets[0]
+        self.assertEqual('datev_self', os.path.basename(directory))
+        self.assertEqual(4, len(data_filenames))
+    
+    
+    def _assert_ingestion(self, workers):
+        ingestion = libkne.ingest([testdata_dir], workers=workers, 
+                                  columnar=True)
+        results = dict(ingestion)
+        self.assertEqual(len(os.listdir(testdata_dir)), len(results))
+        failed_directories = []
+        for directory, result in results.items():
+            if isinstance(result, Exception):
+                failed_directories.append(os.path.basename(directory))
+            else:
+                self.assertTrue(isinstance(result, KneReader))
+        # this data carrier contains a field which is not supported yet
+        self.assertEqual(['mms_bilanz_transactions_and_addresses'], 
+                         failed_directories)
+        reader = results[os.path.join(testdata_dir, 'datev_self')]
+        self.assertEqual(4, reader.get_number_of_files())
+        
+        self.assertEqual(len(results), ingestion.number_of_sets)
+        self.assertEqual(1, ingestion.number_of_errors)
+        self.assertTrue(ingestion.number_of_bytes > 0)
+        self.assertTrue(ingestion.bytes_per_second() > 0)
+        self.assertTrue(ingestion.sets_per_second() > 0)
+    
+    
+    def test_ingest(self):
+        self._assert_ingestion(workers=None)
+    
+    
+    def test_ingest_with_workers(self):
+        self._assert_ingestion(workers=2)
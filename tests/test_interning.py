@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+from datetime import date
+import unittest
+
+from libkne import AccountingLine, InternTable, KneFileReader
+from libkne.accountingline import posting_line_fields
+
+from tests.test_knereader_lazy import posting_line_values
+from tests.test_knewriter import _build_posting_line
+from tests.test_util import get_data_files
+
+
+def get_metadata(date_start=date(2008, 1, 1), date_end=date(2008, 12, 31)):
+    return dict(stored_general_ledger_account_no_length=8,
+                date_start=date_start, date_end=date_end)
+
+
+class TestInternTable(unittest.TestCase):
+    
+    def _parse(self, line, metadata, intern_table):
+        binary_line = line.to_binary()[0]
+        return AccountingLine.from_binary(binary_line, 0, metadata,
+                                          intern_table)[0]
+    
+    
+    def test_equal_values_are_shared(self):
+        intern_table = InternTable()
+        metadata = get_metadata()
+        first_line = self._parse(_build_posting_line(), metadata, intern_table)
+        second_line = self._parse(_build_posting_line(), metadata, intern_table)
+        for name in ['record_field1', 'record_field2', 'date',
+                     'account_number', 'posting_text',
+                     'currency_code_transaction_volume']:
+            self.assertEqual(getattr(first_line, name),
+                             getattr(second_line, name))
+            self.assertTrue(getattr(first_line, name) is
+                            getattr(second_line, name), name)
+        self.assertEqual(u'AR mit UST-Automatikkonto', second_line.posting_text)
+        self.assertEqual(date(2008, 1, 1), second_line.date)
+        
+        uninterned_line = self._parse(_build_posting_line(), metadata, None)
+        self.assertEqual(posting_line_values(first_line),
+                         posting_line_values(uninterned_line))
+        self.assertFalse(first_line.date is uninterned_line.date)
+    
+    
+    def test_dates_depend_on_date_range(self):
+        intern_table = InternTable()
+        line = _build_posting_line(date=date(2008, 1, 1))
+        first_line = self._parse(line, get_metadata(), intern_table)
+        metadata = get_metadata(date(2009, 1, 1), date(2009, 12, 31))
+        second_line = self._parse(line, metadata, intern_table)
+        self.assertEqual(date(2008, 1, 1), first_line.date)
+        self.assertEqual(date(2009, 1, 1), second_line.date)
+    
+    
+    def test_table_is_bounded(self):
+        intern_table = InternTable(max_size=3)
+        metadata = get_metadata()
+        for i in range(10):
+            line = _build_posting_line(record_field1='Re%d' % i)
+            self._parse(line, metadata, intern_table)
+            self.assertTrue(len(intern_table) <= 3)
+        self.assertFalse(intern_table.values.get(('record_field1', 'Re0')))
+    
+    
+    def test_only_declared_fields_are_interned(self):
+        names = [field.name for field in posting_line_fields if field.interned]
+        self.assertEqual(['record_field1', 'record_field2', 'date',
+                          'account_number', 'posting_text',
+                          'currency_code_transaction_volume'], names)
+    
+    
+    def test_reader_shares_values_until_closed(self):
+        for lazy in [False, True]:
+            header, data_files = get_data_files('tz_easybuch', 1)
+            reader = KneFileReader(header, data_files, lazy=lazy)
+            lines = list(reader.iter_posting_lines())
+            self.assertTrue(len(reader.intern_table) > 0)
+            currency_codes = set([id(line.currency_code_transaction_volume)
+                                  for line in lines])
+            self.assertEqual(1, len(currency_codes))
+            reader.close()
+            self.assertEqual(0, len(reader.intern_table))
+    
+    
+    def test_parallel_reading_returns_same_lines(self):
+        header, data_files = get_data_files('datev_self', 4)
+        reader = KneFileReader(header, data_files)
+        parallel_reader = KneFileReader(header, data_files, workers=2)
+        self.assertEqual(map(posting_line_values, reader.iter_posting_lines()),
+                         map(posting_line_values,
+                             parallel_reader.iter_posting_lines()))
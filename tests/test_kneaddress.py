@@ -6,7 +6,11 @@
 import logging
 import unittest
 
+from libkne import DataLine, KneFileReader
 from libkne.model import KNEAddress
+from libkne.model.address import iter_addresses
+
+from tests.test_knereader_parallel import get_testdata_dir
 
 logging.basicConfig(level=logging.ERROR)
 
@@ -80,3 +84,82 @@ class TestKNEAddress(unittest.TestCase):
 
 
 
+class TestAddressAssembler(unittest.TestCase):
+    
+    def _read(self, datadir, **kwargs):
+        directory = get_testdata_dir(datadir)
+        return KneFileReader.read_directory(directory, **kwargs)
+    
+    
+    def test_build_addresses_from_master_data_lines(self):
+        reader = self._read('datev_self')
+        addresses = list(reader.get_file(1).iter_addresses())
+        # the records for terms of payment (ED00004) have no account number
+        account_numbers = [address.account_number for address in addresses]
+        self.assertEqual(account_numbers, [address.account_number for address 
+                                           in reader.iter_addresses()])
+        self.assertEqual([100050000, 100060000, 120010000, 120020000, 
+                          130010000, 140010000, 700030000, 700040000], 
+                         account_numbers)
+        address = addresses[0]
+        self.assertEqual(1, address.new_record)
+        self.assertEqual(u'Name-Beispiel', address.name1)
+        self.assertEqual(u'Firmenname-Beispiel', address.name2)
+        # short values are not joined
+        self.assertEqual(u'Name-Beispiel', address.name)
+        self.assertEqual(u'MA-100-123', address.customer_number)
+        self.assertEqual(u'Straße-Beispiel', address.street)
+        self.assertEqual({110: u'30'}, address.additional_fields)
+        self.assertEqual(2, addresses[1].new_record)
+        self.assertEqual(None, addresses[1].city)
+    
+    
+    def test_lazy_reading(self):
+        reader = self._read('mms_bilanz_addresses', lazy=True)
+        addresses = list(reader.iter_addresses())
+        self.assertEqual(1, len(addresses))
+        self.assertEqual(10000, addresses[0].account_number)
+        self.assertEqual(u'New York', addresses[0].city)
+        self.assertEqual(u'Berliner Sparkasse', 
+                         addresses[0].additional_fields[130])
+    
+    
+    def test_split_values_are_joined(self):
+        first_address = KNEAddress(True, 10001)
+        first_address.name = 'Foo Bar Baz Qux Quux Quuux Quuuux Quuuuux Barfoo'
+        first_address.emailaddress = 'foo.bar@' + 'x' * 40 + '.example'
+        second_address = KNEAddress(False, 10002, city='Berlin')
+        lines = [DataLine(1200, 'Bank')]
+        lines += first_address.build_masterdata_lines()
+        lines += second_address.build_masterdata_lines()
+        lines += [DataLine(1400, 'Forderungen aus LuL')]
+        for line in lines:
+            line.text = unicode(line.text)
+        
+        addresses = list(iter_addresses(lines))
+        self.assertEqual(2, len(addresses))
+        self.assertEqual(first_address.name, addresses[0].name)
+        self.assertEqual(first_address.emailaddress, addresses[0].emailaddress)
+        self.assertEqual(first_address.emailaddress1, addresses[0].emailaddress1)
+        self.assertEqual(first_address.emailaddress2, addresses[0].emailaddress2)
+        self.assertEqual(None, addresses[0].interneturl1)
+        self.assertEqual(10002, addresses[1].account_number)
+        self.assertEqual(2, addresses[1].new_record)
+        self.assertEqual(u'Berlin', addresses[1].city)
+        self.assertEqual({}, addresses[1].additional_fields)
+        # the lines can be written again
+        rebuilt_lines = addresses[0].build_masterdata_lines() + \
+                        addresses[1].build_masterdata_lines()
+        self.assertEqual([(line.key, line.text) for line in lines[1:-1]], 
+                         [(line.key, unicode(line.text)) 
+                          for line in rebuilt_lines])
+    
+    
+    def test_addresses_are_returned_before_all_lines_were_read(self):
+        def lines():
+            yield DataLine(101, u'1')
+            yield DataLine(102, u'10001')
+            yield DataLine(101, u'1')
+            raise AssertionError('address should be returned before')
+        addresses = iter_addresses(lines())
+        self.assertEqual(10001, addresses.next().account_number)
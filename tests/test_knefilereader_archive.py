@@ -0,0 +1,147 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import gzip
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from libkne import KneFileReader, knefilereader
+
+from tests.test_knereader_parallel import get_testdata_dir
+from tests.test_knereader_lazy import master_data_line_values, \
+    posting_line_values
+
+
+class TestKneArchiveReader(unittest.TestCase):
+    
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.datadir = get_testdata_dir('datev_self')
+        self.filenames = sorted(os.listdir(self.datadir))
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+    
+    
+    def _line_values(self, reader):
+        values = []
+        for datafile in reader.files:
+            if datafile.contains_transaction_data():
+                lines = datafile.iter_posting_lines()
+                values.append(map(posting_line_values, lines))
+            else:
+                lines = datafile.iter_master_data_lines()
+                values.append(map(master_data_line_values, lines))
+        return values
+    
+    
+    def _build_zip(self, archive_name, prefix=''):
+        filename = os.path.join(self.tempdir, archive_name)
+        archive = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+        archive.writestr('README.txt', 'KNE export')
+        for name in self.filenames:
+            archive.write(os.path.join(self.datadir, name), prefix + name)
+        archive.close()
+        return filename
+    
+    
+    def _build_tar(self, archive_name, mode, prefix=''):
+        filename = os.path.join(self.tempdir, archive_name)
+        archive = tarfile.open(filename, mode)
+        for name in self.filenames:
+            archive.add(os.path.join(self.datadir, name), prefix + name)
+        archive.close()
+        return filename
+    
+    
+    def _assert_same_lines(self, filename):
+        expected_reader = KneFileReader.read_directory(self.datadir)
+        expected_values = self._line_values(expected_reader)
+        reader = KneFileReader.read_archive(filename)
+        self.assertEqual(expected_reader.get_config(), reader.get_config())
+        self.assertEqual(expected_values, self._line_values(reader))
+        
+        lazy_reader = KneFileReader.read_archive(filename, lazy=True)
+        self.assertEqual(expected_values, self._line_values(lazy_reader))
+        lazy_reader.close()
+    
+    
+    def test_read_zip_archive(self):
+        self._assert_same_lines(self._build_zip('kne.zip'))
+        self._assert_same_lines(self._build_zip('kne2.zip', 'export/2008/'))
+    
+    
+    def test_read_tar_archives(self):
+        self._assert_same_lines(self._build_tar('kne.tar', 'w'))
+        self._assert_same_lines(self._build_tar('kne.tar.gz', 'w:gz', 'kne/'))
+        self._assert_same_lines(self._build_tar('kne.tar.bz2', 'w:bz2'))
+    
+    
+    def _build_gzip_zip(self):
+        zip_filename = self._build_zip('kne.zip')
+        filename = os.path.join(self.tempdir, 'kne.zip.gz')
+        fp = gzip.open(filename, 'wb')
+        fp.write(file(zip_filename, 'rb').read())
+        fp.close()
+        return filename
+    
+    
+    def test_read_gzip_compressed_zip_archive(self):
+        self._assert_same_lines(self._build_gzip_zip())
+    
+    
+    def test_size_of_gzip_compressed_zip_archive_is_limited(self):
+        filename = self._build_gzip_zip()
+        size_limit = knefilereader.GZIP_ZIP_SIZE_LIMIT
+        knefilereader.GZIP_ZIP_SIZE_LIMIT = 1024
+        try:
+            self.assertRaises(ValueError, KneFileReader.read_archive, filename)
+        finally:
+            knefilereader.GZIP_ZIP_SIZE_LIMIT = size_limit
+    
+    
+    def test_errors_name_the_archive_member(self):
+        self.datadir = \
+            get_testdata_dir('mms_bilanz_transactions_and_addresses')
+        self.filenames = sorted(os.listdir(self.datadir))
+        filename = self._build_zip('kne.zip', 'export/')
+        try:
+            KneFileReader.read_archive(filename, workers=2)
+        except ValueError, e:
+            self.assertTrue('export/ED00001' in str(e), str(e))
+        else:
+            self.fail('ValueError expected')
+    
+    
+    def test_invalid_archives(self):
+        filename = os.path.join(self.tempdir, 'EV01.gz')
+        fp = gzip.open(filename, 'wb')
+        fp.write(file(os.path.join(self.datadir, 'EV01'), 'rb').read())
+        fp.close()
+        self.assertRaises(ValueError, KneFileReader.read_archive, filename)
+        
+        ev_filename = os.path.join(self.datadir, 'EV01')
+        self.assertRaises(ValueError, KneFileReader.read_archive, ev_filename)
+        
+        filename = os.path.join(self.tempdir, 'only_header.zip')
+        archive = zipfile.ZipFile(filename, 'w')
+        archive.write(ev_filename, 'EV01')
+        archive.close()
+        self.assertRaises(ValueError, KneFileReader.read_archive, filename)
+    
+    
+    def test_archive_with_multiple_kne_sets_is_rejected(self):
+        filename = os.path.join(self.tempdir, 'kne.zip')
+        archive = zipfile.ZipFile(filename, 'w')
+        for prefix in ('jan/', 'feb/'):
+            for name in self.filenames:
+                archive.write(os.path.join(self.datadir, name), prefix + name)
+        archive.close()
+        self.assertRaises(ValueError, KneFileReader.read_archive, filename)
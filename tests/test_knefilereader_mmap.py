@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import unittest
+
+from libkne import KneFileReader
+
+from tests.test_knereader_parallel import get_testdata_dir
+from tests.test_knereader_lazy import master_data_line_values, \
+    posting_line_values
+
+
+class TestMemoryMappedKneFileReader(unittest.TestCase):
+    
+    def _line_values(self, reader):
+        values = []
+        for datafile in reader.files:
+            if datafile.contains_transaction_data():
+                lines = datafile.iter_posting_lines()
+                values.append(map(posting_line_values, lines))
+            else:
+                lines = datafile.iter_master_data_lines()
+                values.append(map(master_data_line_values, lines))
+        return values
+    
+    
+    def _assert_same_lines(self, datadir, **kwargs):
+        directory = get_testdata_dir(datadir)
+        expected = self._line_values(KneFileReader.read_directory(directory))
+        reader = KneFileReader.read_directory(directory, use_mmap=True, 
+                                              **kwargs)
+        self.assertEqual(expected, self._line_values(reader))
+    
+    
+    def test_mmap_reading_returns_same_lines(self):
+        self._assert_same_lines('datev_self')
+        self._assert_same_lines('mms_bilanz_addresses')
+        self._assert_same_lines('mms_kassenbuch_transactions')
+        self._assert_same_lines('tz_easybuch')
+    
+    
+    def test_mmap_with_lazy_reading_and_workers(self):
+        self._assert_same_lines('mms_kassenbuch_transactions', lazy=True)
+        self._assert_same_lines('datev_self', workers=2)
+    
+    
+    def test_close_releases_mappings_of_lazy_files(self):
+        directory = get_testdata_dir('mms_kassenbuch_transactions')
+        reader = KneFileReader.read_directory(directory, use_mmap=True, 
+                                              lazy=True)
+        mappings = list(reader._owned_fps)
+        self.assertEqual(1, len(mappings))
+        reader.close()
+        self.assertEqual([], reader._owned_fps)
+        self.assertRaises(ValueError, mappings[0].read, 1)
@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import unittest
+
+from libkne import KneFileReader
+
+from tests.test_util import get_data_files
+
+
+def posting_line_values(line):
+    return (line.transaction_volume, line.amendment_key, line.tax_key,
+            line.offsetting_account, line.record_field1, line.record_field2,
+            line.date, line.account_number, line.cash_discount,
+            line.posting_text, line.currency_code_transaction_volume,
+            line.base_currency_amount, line.base_currency, line.exchange_rate,
+            line.reserved_fields,
+            [(r.key, r.value) for r in line.custom_info_records])
+
+
+def master_data_line_values(line):
+    return (line.key, line.text, line.aggregation_or_adjustment_key)
+
+
+class TestLazyKneReader(unittest.TestCase):
+    
+    def _read(self, datadir, number_data_files, lazy):
+        header, data_files = get_data_files(datadir, number_data_files)
+        return KneFileReader(header, data_files, lazy=lazy)
+    
+    
+    def _assert_same_lines(self, datadir, number_data_files=1):
+        reader = self._read(datadir, number_data_files, lazy=False)
+        lazy_reader = self._read(datadir, number_data_files, lazy=True)
+        self.assertEqual(reader.get_number_of_files(),
+                         lazy_reader.get_number_of_files())
+        for i in range(reader.get_number_of_files()):
+            datafile = reader.get_file(i)
+            lazy_datafile = lazy_reader.get_file(i)
+            self.assertEqual(None, lazy_datafile.lines)
+            if datafile.contains_transaction_data():
+                expected = map(posting_line_values, datafile.get_posting_lines())
+                lines = lazy_datafile.iter_posting_lines()
+                self.assertEqual(expected, map(posting_line_values, lines))
+            else:
+                expected = map(master_data_line_values,
+                               datafile.get_master_data_lines())
+                lines = lazy_datafile.iter_master_data_lines()
+                self.assertEqual(expected, map(master_data_line_values, lines))
+    
+    
+    def test_lazy_reading_returns_same_lines(self):
+        self._assert_same_lines('datev_self', 4)
+        self._assert_same_lines('lxoffice_transactions')
+        # this file spans multiple blocks
+        self._assert_same_lines('mms_kassenbuch_transactions')
+        self._assert_same_lines('monkey_kassenbuch_transactions')
+        self._assert_same_lines('tz_easybuch')
+    
+    
+    def test_lines_are_parsed_only_when_iterating(self):
+        reader = self._read('mms_kassenbuch_transactions', 1, lazy=True)
+        lines = reader.iter_posting_lines()
+        first_line = lines.next()
+        self.assertNotEqual(None, first_line.transaction_volume)
+        number_of_lines = 1 + len(list(lines))
+        
+        eager_reader = self._read('mms_kassenbuch_transactions', 1, lazy=False)
+        posting_lines = eager_reader.get_file(0).get_posting_lines()
+        self.assertEqual(len(posting_lines), number_of_lines)
+    
+    
+    def test_lazy_lines_can_only_be_read_once(self):
+        reader = self._read('lxoffice_transactions', 1, lazy=True)
+        datafile = reader.get_file(0)
+        list(datafile.iter_posting_lines())
+        self.assertRaises(ValueError, datafile.iter_posting_lines)
+        self.assertRaises(ValueError, datafile.get_posting_lines)
+    
+    
+    def test_close_closes_data_files(self):
+        reader = self._read('datev_self', 4, lazy=True)
+        data_fps = list(reader._owned_fps)
+        self.assertEqual(4, len(data_fps))
+        self.assertEqual([False] * 4, [fp.closed for fp in data_fps])
+        reader.close()
+        self.assertEqual([True] * 4, [fp.closed for fp in data_fps])
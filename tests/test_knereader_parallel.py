@@ -0,0 +1,112 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from libkne import KneFileReader, KneReader, PostingTable, ReaderOptions
+from libkne.util import AMOUNTS_CENTS
+
+from tests.test_knereader_lazy import master_data_line_values, \
+    posting_line_values
+
+
+def get_testdata_dir(datadir):
+    return os.path.join(os.path.dirname(__file__), 'testdata', datadir)
+
+
+class TestParallelKneReader(unittest.TestCase):
+    
+    def _line_values(self, reader):
+        values = []
+        for datafile in reader.files:
+            if datafile.contains_transaction_data():
+                lines = datafile.get_posting_lines()
+                values.append(map(posting_line_values, lines))
+            else:
+                lines = datafile.get_master_data_lines()
+                values.append(map(master_data_line_values, lines))
+        return values
+    
+    
+    def test_parallel_reading_returns_files_in_order(self):
+        directory = get_testdata_dir('datev_self')
+        reader = KneFileReader.read_directory(directory)
+        parallel_reader = KneFileReader.read_directory(directory, workers=3)
+        self.assertEqual(4, parallel_reader.get_number_of_files())
+        self.assertEqual(self._line_values(reader), 
+                         self._line_values(parallel_reader))
+    
+    
+    def test_error_names_data_file(self):
+        directory = get_testdata_dir('mms_bilanz_transactions_and_addresses')
+        try:
+            KneFileReader.read_directory(directory, workers=2)
+            self.fail('ValueError expected')
+        except ValueError, e:
+            self.assertTrue('ED00001' in str(e), str(e))
+    
+    
+    def _read_corrupted_directory(self, offset, workers):
+        tempdir = tempfile.mkdtemp()
+        try:
+            directory = os.path.join(tempdir, 'datev_self')
+            shutil.copytree(get_testdata_dir('datev_self'), directory)
+            filename = os.path.join(directory, 'ED00002')
+            data = file(filename, 'rb').read()
+            file(filename, 'wb').write(data[:offset] + '\x01' + 
+                                       data[offset+1:])
+            KneFileReader.read_directory(directory, workers=workers)
+        finally:
+            shutil.rmtree(tempdir)
+    
+    
+    def test_worker_errors_keep_their_type(self):
+        self.assertRaises(AssertionError, self._read_corrupted_directory, 0, 
+                          None)
+        try:
+            self._read_corrupted_directory(0, 2)
+            self.fail('AssertionError expected')
+        except AssertionError, e:
+            self.assertTrue(str(e).startswith('Error while parsing ED00002'), 
+                            str(e))
+            self.assertTrue('Traceback' in str(e), str(e))
+        
+        # UnicodeDecodeError needs more arguments than a message
+        self.assertRaises(UnicodeDecodeError, self._read_corrupted_directory,
+                          100, None)
+        self.assertRaises(UnicodeError, self._read_corrupted_directory, 100, 2)
+    
+    
+    def test_parallel_reading_updates_shared_config(self):
+        directory = get_testdata_dir('datev_self')
+        reader = KneFileReader.read_directory(directory)
+        parallel_reader = KneFileReader.read_directory(directory, workers=2)
+        self.assertEqual('SELF', reader.config['product_abbreviation'])
+        self.assertEqual(reader.config, parallel_reader.config)
+        for datafile in parallel_reader.files:
+            self.assertTrue(datafile.config is parallel_reader.config)
+    
+    
+    def test_options_are_passed_to_all_data_files(self):
+        directory = get_testdata_dir('datev_self')
+        header, data_files = KneFileReader._list_kne_files(directory)
+        options = ReaderOptions(columnar=True, amounts=AMOUNTS_CENTS)
+        for workers in (None, 2):
+            data_fps = [file(filename, 'rb') for filename in data_files]
+            reader = KneReader(file(header, 'rb'), data_fps, workers=workers,
+                               options=options)
+            self.assertTrue(reader.options is options)
+            for datafile in reader.get_transaction_files():
+                self.assertEqual(AMOUNTS_CENTS, datafile.amounts)
+                self.assertTrue(isinstance(datafile.lines, PostingTable))
+    
+    
+    def test_lazy_reading_with_workers_is_rejected(self):
+        directory = get_testdata_dir('datev_self')
+        self.assertRaises(ValueError, KneFileReader.read_directory, directory,
+                          lazy=True, workers=2)
@@ -0,0 +1,130 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import StringIO
+import sys
+import traceback
+import unittest
+
+from libkne import KneFileReader, KneReader
+from libkne.datablocks import BLOCK_SIZE, OffsetReader, StreamingDataBuffer
+
+from tests.test_knereader_parallel import get_testdata_dir
+from tests.test_knewriter import _build_kne_writer, _build_posting_line
+
+
+def _build_kne_data(number_of_lines=300):
+    header_fp = StringIO.StringIO()
+    writer, data_fps = _build_kne_writer(header_fp=header_fp)
+    lines = [_build_posting_line(posting_text='Line %d' % i) 
+             for i in range(number_of_lines)]
+    writer.add_posting_lines(lines)
+    writer.finish()
+    return header_fp.getvalue(), data_fps[0].getvalue()
+
+
+class TestTolerantKneReader(unittest.TestCase):
+    
+    def _read(self, header, data, **kwargs):
+        data_fps = [StringIO.StringIO(data)]
+        return KneReader(StringIO.StringIO(header), data_fps, **kwargs)
+    
+    
+    def _posting_texts(self, reader):
+        return [line.posting_text for line in reader.iter_posting_lines()]
+    
+    
+    def test_invalid_posting_line_is_skipped(self):
+        directory = get_testdata_dir('mms_bilanz_transactions_and_addresses')
+        self.assertRaises(ValueError, KneFileReader.read_directory, directory)
+        
+        reader = KneFileReader.read_directory(directory, tolerant=True)
+        self.assertEqual([u'Barverkauf', u'Schmiergeld'], 
+                         self._posting_texts(reader))
+        self.assertEqual(8, len(reader.get_file(1).get_master_data_lines()))
+        invalid_records = reader.get_invalid_records()
+        self.assertEqual(1, len(invalid_records))
+        invalid_record = invalid_records[0]
+        self.assertEqual(1, invalid_record.file_number)
+        self.assertEqual(169, invalid_record.file_offset)
+        self.assertEqual(1, invalid_record.block_number)
+        self.assertTrue(invalid_record.raw_data.startswith('+80000a10000'))
+        self.assertTrue(invalid_record.raw_data.endswith('\xb3EUR\x1cy'))
+        self.assertTrue('currency_code' in invalid_record.message)
+    
+    
+    def test_parsing_resumes_after_corrupt_lines(self):
+        header, data = _build_kne_data()
+        expected_texts = [u'Line %d' % i for i in range(300)]
+        reader = self._read(header, data)
+        self.assertEqual(expected_texts, self._posting_texts(reader))
+        
+        # undefined character in the posting text and an invalid date
+        data = data.replace('Line 100\x1c', 'Line~100\x1c')
+        data = data.replace('d101e84000000\x1eLine 200\x1c', 
+                            'd999e84000000\x1eLine 200\x1c')
+        self.assertEqual(len(_build_kne_data()[1]), len(data))
+        self.assertRaises(ValueError, self._read, header, data)
+        
+        del expected_texts[200]
+        del expected_texts[100]
+        for kwargs in [{}, dict(lazy=True), dict(workers=2)]:
+            reader = self._read(header, data, tolerant=True, **kwargs)
+            self.assertEqual(expected_texts, self._posting_texts(reader))
+            invalid_records = reader.get_invalid_records()
+            self.assertEqual(2, len(invalid_records))
+            self.assertTrue('Line~100' in invalid_records[0].raw_data)
+            self.assertTrue('Line 200' in invalid_records[1].raw_data)
+            for invalid_record in invalid_records:
+                offset = invalid_record.file_offset
+                self.assertEqual(data[offset:offset+5], 
+                                 invalid_record.raw_data[:5])
+                self.assertEqual(offset / 256 + 1, invalid_record.block_number)
+    
+    
+    def test_scanning_again_does_not_add_invalid_records(self):
+        header, data = _build_kne_data()
+        data = data.replace('Line 200\x1c', 'Line~200\x1c')
+        reader = self._read(header, data, tolerant=True, lazy=True, 
+                            offset_index=True)
+        datafile = reader.get_file(0)
+        self.assertEqual(299, len(list(datafile.iter_posting_lines())))
+        invalid_records = reader.get_invalid_records()
+        self.assertEqual(1, len(invalid_records))
+        
+        lines = list(datafile.iter_postings(150, 250))
+        self.assertEqual(100, len(lines))
+        self.assertEqual(u'Line 201', lines[50].posting_text)
+        self.assertEqual(invalid_records, reader.get_invalid_records())
+        
+        # offsets of a scan in the middle of the file refer to the whole file
+        block_number = invalid_records[0].block_number - 1
+        reader = OffsetReader(StringIO.StringIO(data), 
+                              block_number * BLOCK_SIZE)
+        buf = StreamingDataBuffer(reader, 2, first_block_number=block_number)
+        index = buf.fill(0)
+        self.assertEqual(block_number * BLOCK_SIZE, buf.file_offset(index))
+        self.assertEqual(data[buf.file_offset(index + 10)], 
+                         buf.data[index + 10])
+    
+    
+    def test_invalid_client_total_is_not_skipped(self):
+        header, data = _build_kne_data(10)
+        self.assertEqual(1, data.count('w00000000115000y'))
+        data = data.replace('w00000000115000y', 'w000000001A5000y')
+        self.assertRaises(AssertionError, self._read, header, data)
+        self.assertRaises(AssertionError, self._read, header, data, 
+                          tolerant=True)
+    
+    
+    def test_strict_mode_keeps_original_traceback(self):
+        directory = get_testdata_dir('mms_bilanz_transactions_and_addresses')
+        try:
+            KneFileReader.read_directory(directory)
+        except ValueError:
+            innermost_frame = traceback.extract_tb(sys.exc_info()[2])[-1]
+        else:
+            self.fail('ValueError expected')
+        self.assertFalse(innermost_frame[0].endswith('datafile.py'))
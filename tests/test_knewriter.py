@@ -28,7 +28,8 @@ def _default_config():
     return config
 
 
-def _build_kne_writer(config=None, header_fp=None):
+def _build_kne_writer(config=None, header_fp=None, streaming=False, 
+                      amounts='decimal'):
     if config == None:
         config = _default_config()
     data_fps = []
@@ -40,7 +41,7 @@ def _build_kne_writer(config=None, header_fp=None):
     if header_fp == None:
         header_fp = StringIO.StringIO()
     writer = KneWriter(header_fp=header_fp, data_fp_builder=data_fp_builder,
-                       config=config)
+                       config=config, streaming=streaming, amounts=amounts)
     return (writer, data_fps)
 
 
@@ -429,3 +430,56 @@ class TestKneWriteAndParseAccountingLinesWithCustomInfo(unittest.TestCase):
         self.assertEqual(('Foo', 'Bar'), (r1.key, r1.value))
         self.assertEqual(('Baz', 'Quuz'), (r2.key, r2.value))
     
+
+
+
+class TestStreamingKneWriter(unittest.TestCase):
+    
+    def _add_lines(self, writer):
+        for i in range(100):
+            line = _build_posting_line(transaction_volume=i + 1, 
+                                       date=date(2008 - (i % 2) * 3, 1, 1 + i % 28))
+            if i % 10 == 0:
+                record = CustomInfoRecord(key='Foo', value='Bar %d' % i)
+                line.custom_info_records.append(record)
+            writer.add_posting_line(line)
+        writer.add_masterdata_lines(_build_masterdata_lines())
+    
+    
+    def _write(self, streaming):
+        header_fp = StringIO.StringIO()
+        writer, data_fps = _build_kne_writer(header_fp=header_fp, 
+                                             streaming=streaming)
+        self._add_lines(writer)
+        writer.finish()
+        return header_fp.getvalue(), [fp.getvalue() for fp in data_fps]
+    
+    
+    def test_streaming_produces_same_output(self):
+        header, data_files = self._write(streaming=False)
+        streamed_header, streamed_data_files = self._write(streaming=True)
+        self.assertEqual(3, len(data_files))
+        self.assertEqual(header, streamed_header)
+        self.assertEqual(data_files, streamed_data_files)
+    
+    
+    def test_complete_blocks_are_written_immediately(self):
+        header_fp = StringIO.StringIO()
+        writer, data_fps = _build_kne_writer(header_fp=header_fp, 
+                                             streaming=True)
+        line = _build_posting_line()
+        for i in range(10):
+            writer.add_posting_line(line)
+        self.assertEqual(1, len(data_fps))
+        self.assertEqual(None, writer.transaction_manager.streamed_files[0].lines)
+        written_bytes = len(data_fps[0].getvalue())
+        self.assertTrue(written_bytes >= 2 * 256)
+        self.assertEqual(0, written_bytes % 256)
+        
+        writer.finish()
+        header_fp.seek(0)
+        data_fps[0].seek(0)
+        reader = KneReader(header_fp, data_fps)
+        lines = reader.get_file(0).get_posting_lines()
+        self.assertEqual(10, len(lines))
+        self.assertEqual(date(2008, 1, 1), lines[0].date)
@@ -0,0 +1,215 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+from datetime import date
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+import warnings
+
+from libkne import KneFileReader, KneFileWriter, KneReader, OffsetIndex
+
+from tests.test_knereader_lazy import posting_line_values
+from tests.test_knewriter import _build_kne_writer, _build_posting_line, \
+    _default_config
+
+
+def _build_lines(number_of_lines=500):
+    lines = []
+    for i in range(number_of_lines):
+        # the lines are sorted by date, the account numbers are not
+        line_date = date(2008, 1 + (12 * i / number_of_lines), 1 + i % 28)
+        line = _build_posting_line(transaction_volume=i + 1, date=line_date,
+                                   account_number=84000000 + (i % 7))
+        lines.append(line)
+    return lines
+
+
+def _write_kne_data(lines):
+    header_fp = StringIO.StringIO()
+    writer, data_fps = _build_kne_writer(header_fp=header_fp)
+    writer.add_posting_lines(lines)
+    writer.finish()
+    header_fp.seek(0)
+    data_fps[0].seek(0)
+    return header_fp, data_fps
+
+
+class TestOffsetIndex(unittest.TestCase):
+    
+    def setUp(self):
+        self.header_fp, self.data_fps = _write_kne_data(_build_lines())
+        self.expected_lines = map(posting_line_values, self._read_lines())
+        self.assertEqual(500, len(self.expected_lines))
+    
+    
+    def _read_lines(self):
+        self.header_fp.seek(0)
+        self.data_fps[0].seek(0)
+        reader = KneReader(self.header_fp, self.data_fps)
+        return reader.get_file(0).get_posting_lines()
+    
+    
+    def _build_lazy_datafile(self):
+        self.header_fp.seek(0)
+        self.data_fps[0].seek(0)
+        reader = KneReader(self.header_fp, self.data_fps, lazy=True, 
+                           offset_index=True)
+        datafile = reader.get_file(0)
+        # the index is built while iterating
+        self.assertEqual(None, datafile.offset_index)
+        return datafile
+    
+    
+    def test_index_contains_offsets_and_block_statistics(self):
+        datafile = self._build_lazy_datafile()
+        lines = list(datafile.iter_posting_lines())
+        index = datafile.offset_index
+        self.assertEqual(500, len(index))
+        self.assertTrue(len(index.block_numbers) > 100)
+        self.assertEqual(sum(range(1, 501)) * 100, sum(index.amount_sums))
+        self.assertEqual(date(2008, 1, 1).toordinal(), index.min_dates[0])
+        self.assertEqual(84000000, min(index.min_accounts))
+        self.assertEqual(84000006, max(index.max_accounts))
+        
+        binary_data = self.data_fps[0].getvalue()
+        for offset in index.offsets:
+            # all lines have a positive transaction volume
+            self.assertEqual('+', binary_data[offset])
+    
+    
+    def test_random_access(self):
+        datafile = self._build_lazy_datafile()
+        first_lines = list(datafile.iter_posting_lines())
+        for i in [0, 1, 250, 499, -1]:
+            line = datafile.get_posting(i)
+            self.assertEqual(self.expected_lines[i], posting_line_values(line))
+        self.assertRaises(IndexError, datafile.get_posting, 500)
+        
+        lines = map(posting_line_values, datafile.iter_postings(250, 260))
+        self.assertEqual(self.expected_lines[250:260], lines)
+        lines = map(posting_line_values, datafile.iter_postings(495))
+        self.assertEqual(self.expected_lines[495:], lines)
+        self.assertEqual(self.expected_lines, map(posting_line_values, first_lines))
+    
+    
+    def test_range_scans_skip_blocks(self):
+        datafile = self._build_lazy_datafile()
+        list(datafile.iter_posting_lines())
+        
+        march = (date(2008, 3, 1), date(2008, 3, 31))
+        lines = map(posting_line_values, datafile.iter_postings_by_date(*march))
+        expected_lines = [line for line in self.expected_lines 
+                          if march[0] <= line[6] <= march[1]]
+        self.assertNotEqual(0, len(expected_lines))
+        self.assertEqual(expected_lines, lines)
+        ranges = datafile.offset_index.find_date_ranges(*march)
+        number_of_scanned_lines = sum([stop - start for start, stop in ranges])
+        self.assertTrue(number_of_scanned_lines < 100, number_of_scanned_lines)
+        
+        lines = datafile.iter_postings_by_account(84000003)
+        expected_lines = [line for line in self.expected_lines 
+                          if line[7] == 84000003]
+        self.assertEqual(expected_lines, map(posting_line_values, lines))
+    
+    
+    def test_range_scans_without_index(self):
+        self.header_fp.seek(0)
+        self.data_fps[0].seek(0)
+        datafile = KneReader(self.header_fp, self.data_fps).get_file(0)
+        lines = datafile.iter_postings_by_account(84000003, 84000004)
+        expected_lines = [line for line in self.expected_lines 
+                          if line[7] in (84000003, 84000004)]
+        self.assertEqual(expected_lines, map(posting_line_values, lines))
+    
+    
+    def test_save_and_load(self):
+        datafile = self._build_lazy_datafile()
+        list(datafile.iter_posting_lines())
+        index_fp = StringIO.StringIO()
+        datafile.offset_index.save(index_fp)
+        index_fp.seek(0)
+        index = OffsetIndex.load(index_fp)
+        for name in OffsetIndex.columns:
+            self.assertEqual(getattr(datafile.offset_index, name), 
+                             getattr(index, name))
+        
+        truncated_fp = StringIO.StringIO(index_fp.getvalue()[:-1])
+        self.assertRaises(ValueError, OffsetIndex.load, truncated_fp)
+
+
+
+class TestOffsetIndexFiles(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        config = _default_config()
+        writer = KneFileWriter(config=config, dir=self.dir)
+        writer.add_posting_lines(_build_lines(100))
+        writer.finish()
+        writer.header_fp.close()
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    
+    def test_index_file_is_created_and_used(self):
+        index_filename = os.path.join(self.dir, 'ED00001.idx')
+        reader = KneFileReader.read_directory(self.dir, offset_index=True)
+        self.assertTrue(os.path.exists(index_filename))
+        lines = reader.get_file(0).get_posting_lines()
+        
+        lazy_reader = KneFileReader.read_directory(self.dir, lazy=True,
+                                                   offset_index=True)
+        datafile = lazy_reader.get_file(0)
+        self.assertNotEqual(None, datafile.offset_index)
+        self.assertEqual(posting_line_values(lines[42]), 
+                         posting_line_values(datafile.get_posting(42)))
+    
+    
+    def test_index_of_another_data_file_is_rebuilt(self):
+        index_filename = os.path.join(self.dir, 'ED00001.idx')
+        KneFileReader.read_directory(self.dir, offset_index=True)
+        index_data = file(index_filename, 'rb').read()
+        
+        # replace the data file (the index file is still newer)
+        other_dir = os.path.join(self.dir, 'other')
+        os.mkdir(other_dir)
+        writer = KneFileWriter(config=_default_config(), dir=other_dir)
+        writer.add_posting_lines(_build_lines(120))
+        writer.finish()
+        writer.header_fp.close()
+        for name in ('EV01', 'ED00001'):
+            shutil.copy(os.path.join(other_dir, name), self.dir)
+        shutil.rmtree(other_dir)
+        os.utime(os.path.join(self.dir, 'ED00001'), (0, 0))
+        
+        reader = KneFileReader.read_directory(self.dir, lazy=True,
+                                              offset_index=True)
+        datafile = reader.get_file(0)
+        self.assertEqual(None, datafile.offset_index)
+        self.assertEqual(120, len(list(datafile.iter_posting_lines())))
+        self.assertEqual(120, len(datafile.offset_index))
+        self.assertNotEqual(index_data, file(index_filename, 'rb').read())
+        reader.close()
+    
+    
+    def test_index_is_kept_in_memory_if_it_can_not_be_stored(self):
+        # a directory with the name of the index file can neither be loaded 
+        # nor written
+        index_filename = os.path.join(self.dir, 'ED00001.idx')
+        os.mkdir(index_filename)
+        filters = warnings.filters[:]
+        warnings.simplefilter('ignore')
+        try:
+            reader = KneFileReader.read_directory(self.dir, offset_index=True)
+        finally:
+            warnings.filters[:] = filters
+        datafile = reader.get_file(0)
+        self.assertEqual(100, len(datafile.get_posting_lines()))
+        self.assertNotEqual(None, datafile.offset_index)
@@ -0,0 +1,37 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import unittest
+
+from libkne.util import parse_number, parse_string, scan_digits, scan_string
+
+
+class TestParseUtil(unittest.TestCase):
+    
+    def test_scan_digits(self):
+        self.assertEqual(('4711', 4), scan_digits('a4711b', 1, 10))
+        self.assertEqual(('47', 2), scan_digits('a4711b', 1, 2))
+        self.assertEqual(('', -1), scan_digits('a4711b', 0, 4))
+    
+    
+    def test_parse_number(self):
+        self.assertEqual((4711, 4), parse_number('a4711b', 1, 10))
+        self.assertEqual((471, 3), parse_number('a4711b', 1, 3))
+        self.assertEqual((47, 4), parse_number('a4711b', 1, 10, 
+                                               restrict_number_length=2))
+        self.assertRaises(ValueError, parse_number, 'a4711b', 0, 4)
+    
+    
+    def test_scan_string(self):
+        self.assertEqual(('Foo', 4), scan_string('\xb7Foo\x1cy', 1, 20))
+        self.assertEqual(('Foo', 4), scan_string('\xb7Foo\x1cy', 1))
+        self.assertEqual(('Foo', 4), scan_string('\xb7Foo y', 1, 
+                                                 stop_character=' '))
+    
+    
+    def test_parse_string_checks_maximum_length(self):
+        self.assertEqual(('Foo', 4), parse_string('\xb7Foo\x1cy', 1, 3))
+        self.assertRaises(ValueError, parse_string, '\xb7Foo\x1cy', 1, 2)
+        self.assertRaises(ValueError, parse_string, '\xb7Foo', 1)
@@ -0,0 +1,153 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import cPickle
+import os
+import shutil
+import tempfile
+import unittest
+
+from libkne import KneFileReader, PostingTable
+from libkne.parsecache import ParseCache
+from libkne.util import AMOUNTS_CENTS
+
+from tests.test_knereader_parallel import get_testdata_dir
+from tests.test_knereader_lazy import master_data_line_values, \
+    posting_line_values
+
+
+class TestParseCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, 'cache')
+        self.data_dir = os.path.join(self.tempdir, 'data')
+        shutil.copytree(get_testdata_dir('datev_self'), self.data_dir)
+    
+    
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+    
+    
+    def _line_values(self, reader):
+        values = []
+        for datafile in reader.files:
+            if datafile.contains_transaction_data():
+                lines = datafile.iter_posting_lines()
+                values.append(map(posting_line_values, lines))
+            else:
+                lines = datafile.iter_master_data_lines()
+                values.append(map(master_data_line_values, lines))
+        return values
+    
+    
+    def _read(self, **kwargs):
+        return KneFileReader.read_directory(self.data_dir, 
+                                            cache_dir=self.cache_dir, **kwargs)
+    
+    
+    def test_cached_data_is_used_for_unchanged_files(self):
+        expected = self._line_values(KneFileReader.read_directory(self.data_dir))
+        reader = self._read()
+        self.assertEqual(False, reader.loaded_from_cache)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        
+        cached_reader = self._read()
+        self.assertEqual(True, cached_reader.loaded_from_cache)
+        self.assertEqual(reader.get_config(), cached_reader.get_config())
+        self.assertEqual(expected, self._line_values(cached_reader))
+        
+        # the cached columns are also used for columnar reading
+        columnar_reader = self._read(columnar=True)
+        self.assertEqual(True, columnar_reader.loaded_from_cache)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        self.assertTrue(isinstance(columnar_reader.get_file(0).lines, 
+                                   PostingTable))
+        self.assertEqual(expected, self._line_values(columnar_reader))
+    
+    
+    def test_options_are_restored_from_the_cache(self):
+        directory = get_testdata_dir('mms_bilanz_transactions_and_addresses')
+        shutil.rmtree(self.data_dir)
+        shutil.copytree(directory, self.data_dir)
+        for kwargs in [dict(tolerant=True), 
+                       dict(tolerant=True, amounts=AMOUNTS_CENTS),
+                       dict(tolerant=True, offset_index=True)]:
+            reader = self._read(**kwargs)
+            cached_reader = self._read(**kwargs)
+            self.assertEqual(True, cached_reader.loaded_from_cache)
+            self.assertEqual(self._line_values(reader), 
+                             self._line_values(cached_reader))
+            self.assertEqual(map(repr, reader.get_invalid_records()), 
+                             map(repr, cached_reader.get_invalid_records()))
+            self.assertEqual(
+                [record.raw_data for record in reader.get_invalid_records()],
+                [record.raw_data 
+                 for record in cached_reader.get_invalid_records()])
+        offset_index = cached_reader.get_file(0).offset_index
+        self.assertEqual(reader.get_file(0).offset_index.offsets, 
+                         offset_index.offsets)
+    
+    
+    def test_entries_do_not_contain_pickles(self):
+        self._read()
+        for name in os.listdir(self.cache_dir):
+            filename = os.path.join(self.cache_dir, name)
+            self.assertTrue(file(filename, 'rb').read().startswith('KNECACHE'))
+            # old (pickled) entries are ignored
+            cPickle.dump((2, None), file(filename, 'wb'))
+        self.assertEqual(False, self._read().loaded_from_cache)
+    
+    
+    def test_changed_files_invalidate_the_cache(self):
+        self._read()
+        filename = os.path.join(self.data_dir, 'ED00002')
+        stat = os.stat(filename)
+        # same size but different contents
+        fp = file(filename, 'r+b')
+        data = fp.read()
+        fp.seek(0)
+        fp.write(data.replace('Name-Beispiel', 'NAME-BEISPIEL'))
+        fp.close()
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(False, self._read().loaded_from_cache)
+        self.assertEqual(True, self._read().loaded_from_cache)
+        
+        file(filename, 'ab').write('\x00' * 256)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+        self.assertRaises(ValueError, self._read)
+    
+    
+    def test_files_are_only_hashed_if_they_were_touched(self):
+        self._read()
+        hashed_files = []
+        original_hash_file = ParseCache._hash_file
+        def hash_file(cache, filename):
+            hashed_files.append(os.path.basename(filename))
+            return original_hash_file(cache, filename)
+        ParseCache._hash_file = hash_file
+        try:
+            self.assertEqual(True, self._read().loaded_from_cache)
+            self.assertEqual([], hashed_files)
+            
+            filename = os.path.join(self.data_dir, 'ED00002')
+            stat = os.stat(filename)
+            os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+            self.assertEqual(True, self._read().loaded_from_cache)
+            self.assertEqual(['ED00002'], hashed_files)
+        finally:
+            ParseCache._hash_file = original_hash_file
+    
+    
+    def test_broken_cache_entries_are_ignored(self):
+        self._read()
+        for name in os.listdir(self.cache_dir):
+            file(os.path.join(self.cache_dir, name), 'wb').write('broken')
+        self.assertEqual(False, self._read().loaded_from_cache)
+        self.assertEqual(True, self._read().loaded_from_cache)
+    
+    
+    def test_lazy_reading_can_not_be_cached(self):
+        self.assertRaises(AssertionError, self._read, lazy=True)
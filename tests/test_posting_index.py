@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+from tests.test_util import SampleDataReaderCase
+
+
+class TestPostingIndex(SampleDataReaderCase):
+    
+    def setUp(self):
+        super(TestPostingIndex, self).setUp('datev_self', 4)
+        self.datafile = self.reader.get_file(0)
+        self.lines = self.datafile.get_posting_lines()
+    
+    
+    def _scan(self, attribute_name, value):
+        return [line for line in self.lines 
+                if getattr(line, attribute_name) == value]
+    
+    
+    def test_index_is_built_on_first_use(self):
+        self.assertEqual({}, self.datafile._posting_indexes)
+        account_number = self.lines[0].account_number
+        self.datafile.postings_by_account(account_number)
+        self.assertEqual(['account_number'], 
+                         self.datafile._posting_indexes.keys())
+    
+    
+    def test_postings_by_account(self):
+        for line in self.lines:
+            account_number = line.account_number
+            expected_lines = self._scan('account_number', account_number)
+            lines = self.datafile.postings_by_account(account_number)
+            self.assertEqual(expected_lines, lines)
+        self.assertEqual([], self.datafile.postings_by_account(4711))
+    
+    
+    def test_postings_by_offsetting_account(self):
+        for line in self.lines:
+            account_number = line.offsetting_account
+            expected_lines = self._scan('offsetting_account', account_number)
+            lines = self.datafile.postings_by_offsetting_account(account_number)
+            self.assertEqual(expected_lines, lines)
+    
+    
+    def test_postings_by_record_field1(self):
+        for line in self.lines:
+            expected_lines = self._scan('record_field1', line.record_field1)
+            lines = self.datafile.postings_by_record_field1(line.record_field1)
+            self.assertEqual(expected_lines, lines)
+    
+    
+    def test_postings_of_all_files(self):
+        expected_lines = [line for line in self.reader.iter_posting_lines()
+                          if line.account_number == 84000000]
+        self.assertNotEqual(0, len(expected_lines))
+        self.assertEqual(expected_lines, 
+                         self.reader.postings_by_account(84000000))
@@ -0,0 +1,103 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+from datetime import date
+from decimal import Decimal
+import unittest
+
+from libkne import CustomInfoRecord, KneFileReader, PostingTable
+
+from tests.test_knereader_lazy import posting_line_values
+from tests.test_knewriter import _build_posting_line
+from tests.test_util import get_data_files
+
+
+class TestPostingTable(unittest.TestCase):
+    
+    def _read(self, datadir, number_data_files, columnar):
+        header, data_files = get_data_files(datadir, number_data_files)
+        return KneFileReader(header, data_files, columnar=columnar)
+    
+    
+    def _assert_same_lines(self, datadir, number_data_files=1):
+        reader = self._read(datadir, number_data_files, columnar=False)
+        columnar_reader = self._read(datadir, number_data_files, columnar=True)
+        for datafile, columnar_datafile in zip(reader.get_transaction_files(), 
+                                columnar_reader.get_transaction_files()):
+            table = columnar_datafile.get_posting_lines()
+            self.assertTrue(isinstance(table, PostingTable))
+            expected = map(posting_line_values, datafile.get_posting_lines())
+            self.assertEqual(expected, map(posting_line_values, table))
+    
+    
+    def test_columnar_reading_returns_same_lines(self):
+        self._assert_same_lines('datev_self', 4)
+        self._assert_same_lines('lxoffice_transactions')
+        self._assert_same_lines('mms_kassenbuch_transactions')
+        self._assert_same_lines('monkey_kassenbuch_transactions')
+        self._assert_same_lines('tz_easybuch')
+    
+    
+    def test_store_rarely_used_fields(self):
+        line = _build_posting_line(tax_key=3, cash_discount=Decimal('1.50'),
+                                   exchange_rate=Decimal('1.234567'))
+        line.custom_info_records.append(CustomInfoRecord(key='Foo', value='Bar'))
+        line.reserved_fields = [None] * 7
+        table = PostingTable({})
+        table.append(line)
+        table.append(_build_posting_line(transaction_volume=Decimal('12.34')))
+        
+        self.assertEqual(2, len(table))
+        self.assertEqual([0], table.sparse_values.keys())
+        self.assertEqual(posting_line_values(line), posting_line_values(table[0]))
+        second_line = table[-1]
+        self.assertEqual(Decimal('12.34'), second_line.transaction_volume)
+        self.assertEqual(None, second_line.amendment_key)
+        self.assertEqual(None, second_line.tax_key)
+        self.assertEqual(date(2008, 1, 1), second_line.date)
+        self.assertEqual(1234, table.amounts[1])
+        self.assertEqual([line.record_field1] * 2, 
+                         [l.record_field1 for l in table[0:2]])
+        self.assertRaises(IndexError, lambda: table[2])
+    
+    
+    def test_equal_strings_are_shared(self):
+        table = PostingTable({})
+        table.append(_build_posting_line(record_field1='Re' + '4711'))
+        table.append(_build_posting_line(record_field1='Re4' + '711'))
+        self.assertTrue(table.record_fields1[0] is table.record_fields1[1])
+    
+    
+    def test_sharing_keeps_the_type_of_values(self):
+        table = PostingTable({})
+        table.append(_build_posting_line(record_field1='1234'))
+        table.append(_build_posting_line(posting_text=u'1234'))
+        table.append(_build_posting_line(posting_text=u'EUR'))
+        self.assertEqual(unicode, type(table[1].posting_text))
+        self.assertEqual(unicode, type(table[2].posting_text))
+        self.assertEqual(str, type(table[2].currency_code_transaction_volume))
+    
+    
+    def test_large_account_numbers_fit_into_columns(self):
+        table = PostingTable({})
+        table.append(_build_posting_line(account_number=9999999999))
+        self.assertEqual(9999999999, table[0].account_number)
+        self.assertTrue(table.account_numbers.itemsize >= 8)
+    
+    
+    def test_invalid_amount(self):
+        table = PostingTable({})
+        line = _build_posting_line(transaction_volume=Decimal('1.234'))
+        self.assertRaises(ValueError, table.append, line)
+        self.assertEqual(0, len(table))
+    
+    
+    def test_index_uses_columns(self):
+        reader = self._read('datev_self', 4, columnar=True)
+        datafile = reader.get_file(0)
+        lines = datafile.postings_by_account(84000000)
+        self.assertNotEqual(0, len(lines))
+        for line in lines:
+            self.assertEqual(84000000, line.account_number)
@@ -0,0 +1,113 @@
+# -*- coding: UTF-8 -*-
+# The source code contained in this file is licensed under the MIT license.
+# See LICENSE.txt in the main project directory, for more information.
+# For the exact contribution history, see the git revision log.
+
+import StringIO
+import unittest
+
+from libkne import verify
+
+from tests.test_util import get_data_files
+
+
+def _read_file(filename):
+    fp = file(filename, 'rb')
+    try:
+        return fp.read()
+    finally:
+        fp.close()
+
+
+class TestVerifier(unittest.TestCase):
+    
+    def _load(self, datadir, number_data_files=1):
+        header, data_files = get_data_files(datadir, number_data_files)
+        return _read_file(header), map(_read_file, data_files)
+    
+    
+    def _verify(self, header, data):
+        data_fps = [StringIO.StringIO(item) for item in data]
+        return verify(StringIO.StringIO(header), data_fps)
+    
+    
+    def test_valid_data_carriers(self):
+        report = self._verify(*self._load('datev_self', 4))
+        self.assertEqual(True, report.is_valid(), report.get_errors())
+        self.assertEqual(4, len(report.files))
+        transaction_report = report.files[0]
+        self.assertEqual(True, transaction_report.contains_transaction_data)
+        self.assertEqual(8, transaction_report.number_of_lines)
+        self.assertEqual(5035500, transaction_report.amount_total)
+        self.assertEqual([5035500], transaction_report.client_totals)
+        self.assertEqual(False, report.files[1].contains_transaction_data)
+        self.assertEqual(65, report.files[1].number_of_lines)
+        
+        for datadir in ('lxoffice_transactions', 'tz_easybuch', 
+                        'monkey_kassenbuch_account_labels'):
+            report = self._verify(*self._load(datadir))
+            self.assertEqual(True, report.is_valid(), report.get_errors())
+    
+    
+    def test_negative_client_total(self):
+        report = self._verify(*self._load('mms_kassenbuch_transactions'))
+        self.assertEqual(True, report.is_valid(), report.get_errors())
+        self.assertEqual(-386300, report.files[0].amount_total)
+        self.assertEqual([-386300], report.files[0].client_totals)
+    
+    
+    def test_client_total_must_match_posting_lines(self):
+        header, data = self._load('tz_easybuch')
+        self.assertTrue('x9600451y' in data[0])
+        data[0] = data[0].replace('x9600451y', 'x9600452y')
+        report = self._verify(header, data)
+        self.assertEqual(False, report.is_valid())
+        self.assertEqual(1, len(report.get_errors()))
+        self.assertTrue('client total 9600452' in report.get_errors()[0])
+        
+        data[0] = data[0].replace('x9600452y', 'w9600451y')
+        self.assertEqual(False, self._verify(header, data).is_valid())
+    
+    
+    def test_invalid_records_are_located(self):
+        report = self._verify(*self._load('mms_bilanz_transactions_and_addresses',
+                                          2))
+        self.assertEqual(False, report.is_valid())
+        errors = report.get_errors()
+        self.assertEqual(1, len(errors))
+        self.assertTrue(errors[0].startswith('ED00001: offset 169: ValueError'),
+                        errors[0])
+        self.assertEqual(True, report.files[1].is_valid())
+    
+    
+    def test_block_errors(self):
+        header, data = self._load('tz_easybuch')
+        broken_block = data[0][:255] + 'A' + data[0][256:]
+        report = self._verify(header, [broken_block])
+        self.assertEqual(False, report.is_valid())
+        self.assertTrue('block 1' in report.get_errors()[0], report.get_errors())
+        
+        for broken_data in (data[0][:-256], data[0] + '\x00' * 256):
+            report = self._verify(header, [broken_data])
+            self.assertEqual(False, report.is_valid())
+    
+    
+    def test_undefined_characters(self):
+        header, data = self._load('datev_self', 4)
+        self.assertTrue('Name-Beispiel' in data[1])
+        data[1] = data[1].replace('Name-Beispiel', 'Name~Beispiel')
+        report = self._verify(header, data)
+        self.assertEqual(1, len(report.get_errors()))
+        self.assertTrue('undefined character' in report.get_errors()[0])
+    
+    
+    def test_control_file_errors(self):
+        header, data = self._load('datev_self', 4)
+        report = self._verify(header, data[:3])
+        self.assertEqual(False, report.is_valid())
+        self.assertEqual(1, len(report.errors))
+        self.assertEqual(3, len(report.files))
+        
+        report = self._verify(header[:100], data)
+        self.assertEqual(False, report.is_valid())
+        self.assertEqual(0, len(report.files))